@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -46,6 +47,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bookly_app.metrics.MetricsMiddleware',
+    'bookly_app.log.RequestIDMiddleware',
+    'bookly_app.throttling.ConcurrencyLimitMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -54,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bookly_app.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'bookly.urls'
@@ -88,6 +93,29 @@ DATABASES = {
 }
 
 
+# Password hashing
+# scrypt is memory-hard; hashes made by the other hashers still verify and are
+# upgraded to scrypt the next time their owner logs in
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+AUTHENTICATION_BACKENDS = ['bookly_app.auth.PooledModelBackend']
+
+# Hashing runs in a bounded per-process pool (see bookly_app.auth); None means
+# one thread per CPU
+PASSWORD_HASHING_WORKERS = None
+PASSWORD_HASHING_MAX_PENDING = 32
+PASSWORD_HASHING_TIMEOUT = 10
+PASSWORD_HASHING_RETRY_AFTER = 1
+# Seconds a login for a nonexistent username is answered without hashing
+LOGIN_UNKNOWN_USER_CACHE_TIMEOUT = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -143,12 +171,192 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # Reverse proxies in front of the app (nginx on the same host). Client IPs
+    # for the per-IP throttles are taken from X-Forwarded-For only this many
+    # hops back; the rest of the header is client-supplied and ignored. Set
+    # BOOKLY_NUM_PROXIES=0 when the app is reached directly.
+    'NUM_PROXIES': int(os.environ.get('BOOKLY_NUM_PROXIES', '1')),
+    # Sliding windows (see bookly_app.throttling): '<scope>.<user|ip|endpoint>'
+    'DEFAULT_THROTTLE_RATES': {
+        'login.ip': '10/min',
+        'login.endpoint': '600/min',
+        'register.ip': '5/hour',
+        'register.endpoint': '120/min',
+        'review_create.user': '20/hour',
+        'review_create.endpoint': '600/min',
+        'comment_create.user': '30/min',
+        'comment_create.endpoint': '1200/min',
+        'book_create.user': '30/hour',
+        'book_create.endpoint': '300/min',
+        'import_create.user': '10/hour',
+        'upload_create.user': '60/hour',
+    },
+}
+
+# Throttle counters live in the default cache. Production must set REDIS_URL
+# (the redis package is in requirements.txt): with the per-process default
+# each worker enforces the limits on its own (manage.py check --deploy warns
+# about it)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+
+# Per-worker cap on in-flight requests; beyond it requests get a fast 503
+MAX_CONCURRENT_REQUESTS = 32
+CONCURRENCY_RETRY_AFTER = 1
+CONCURRENCY_LIMIT_EXEMPT = ['/metrics']
+
+# Logging: JSON records with request IDs, written by a background thread.
+# High-volume debug events from the views are sampled.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {
+            '()': 'bookly_app.log.RequestIDFilter',
+        },
+        'sample_debug': {
+            '()': 'bookly_app.log.SamplingFilter',
+            'rate': 0.1,
+        },
+        'require_debug_false': {
+            '()': 'django.utils.log.RequireDebugFalse',
+        },
+    },
+    'handlers': {
+        'async_json': {
+            '()': 'bookly_app.log.QueueListenerHandler',
+            'filters': ['request_id'],
+        },
+        # Django's default reporting of 500s to ADMINS, which replacing the
+        # django.request handlers would otherwise switch off
+        'mail_admins': {
+            'level': 'ERROR',
+            'filters': ['require_debug_false'],
+            'class': 'django.utils.log.AdminEmailHandler',
+        },
+    },
+    'loggers': {
+        'bookly_app': {
+            'handlers': ['async_json'],
+            'level': os.environ.get('BOOKLY_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        'bookly_app.views': {
+            'filters': ['sample_debug'],
+        },
+        'django.request': {
+            'handlers': ['async_json', 'mail_admins'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
+# Scraping /metrics needs "Authorization: Bearer <METRICS_TOKEN>" or a
+# REMOTE_ADDR in METRICS_ALLOWED_IPS. Behind the local nginx every request
+# comes from 127.0.0.1, so list addresses only when the app is reached directly
+METRICS_TOKEN = os.environ.get('BOOKLY_METRICS_TOKEN')
+METRICS_ALLOWED_IPS = []
+
+# On-demand request profiling for staff (X-Profile header or ?profile=1)
+PROFILING_ENABLED = True
+PROFILING_SAMPLE_RATE = 1.0
+PROFILING_MODE = 'sample'
+PROFILING_INTERVAL = 0.001
+PROFILING_MAX_QUERIES = 500
+PROFILING_DIR = BASE_DIR / 'profiles'
+
+# Maximum number of sub-requests accepted by /api/batch/
+BATCH_MAX_REQUESTS = 25
+
+# Background jobs. A manage.py run_jobs worker is required: without it (and
+# without JOBS_RUN_INLINE) book ratings, cards and covers are never updated.
+JOB_RETRY_BASE_DELAY = 10
+JOB_RETRY_MAX_DELAY = 3600
+# Workers refresh the lock of the jobs they run this often; a running job whose
+# worker has been silent for JOB_LOCK_TIMEOUT is requeued (or failed, when that
+# was its last attempt)
+JOB_HEARTBEAT_INTERVAL = 60
+JOB_LOCK_TIMEOUT = 600
+# Finished jobs are deleted after this many days (failed ones are kept longer)
+JOB_RETENTION_DAYS = 7
+JOB_FAILED_RETENTION_DAYS = 30
+# Run jobs where they are enqueued, for setups without a run_jobs worker. On by
+# default with DEBUG, so a development server works without a worker
+JOBS_RUN_INLINE = os.environ.get('BOOKLY_JOBS_RUN_INLINE', '1' if DEBUG else '0') == '1'
+JOB_SCHEDULE = {
+    'compact-book-activity': {'task': 'compact_book_activity', 'every': 24 * 60 * 60},
+    'archive-records': {'task': 'archive_records', 'every': 24 * 60 * 60},
+    'refresh-catalog-facets': {'task': 'refresh_catalog_facets', 'every': 10 * 60},
+    'purge-sync-tombstones': {'task': 'purge_sync_tombstones', 'every': 24 * 60 * 60},
+    'purge-upload-sessions': {'task': 'purge_upload_sessions', 'every': 60 * 60},
+    'purge-finished-jobs': {'task': 'purge_finished_jobs', 'every': 24 * 60 * 60},
+}
+
+# Book list facets: entries per genre/author list, and how long the whole-catalog
+# counts stay cached (the refresh job renews them well before that)
+FACET_SIZE = 20
+FACET_CACHE_TIMEOUT = 30 * 60
+# Most ISBNs one POST /api/books/isbn-lookup/ may resolve
+ISBN_LOOKUP_MAX = 5000
+# Author name -> id entries each worker keeps (see bookly_app.authors)
+AUTHOR_CACHE_SIZE = 10000
+
+# Delta sync: tokens and deletion tombstones expire after this many days, and
+# a sync response carries at most SYNC_PAGE_SIZE changes
+SYNC_TOKEN_MAX_AGE_DAYS = 30
+SYNC_PAGE_SIZE = 500
+
+# Books on more shelves than this get one broadcast notification per review
+# instead of a row per shelf owner
+NOTIFICATION_FANOUT_LIMIT = 5000
+
+# Finished exchanges and closed tickets move to the archive tables after this
+ARCHIVE_AFTER_DAYS = 180
+ARCHIVE_BATCH_SIZE = 1000
+# Rating imports: rows matched and written per batch; bigger uploads run as a job
+IMPORT_BATCH_SIZE = 500
+IMPORT_SYNC_MAX_BYTES = 64 * 1024
+IMPORT_MAX_BYTES = 20 * 1024 * 1024
+# Uploaded covers larger than this are scaled down in the background
+COVER_MAX_SIZE = (800, 1200)
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# User files that must not be public, e.g. uploaded imports
+PRIVATE_MEDIA_ROOT = BASE_DIR / 'private'
+
+# Resumable image uploads (POST /api/uploads/): chunks are written to
+# UPLOAD_TEMP_DIR until the file is complete; abandoned uploads are purged
+UPLOAD_TEMP_DIR = PRIVATE_MEDIA_ROOT / 'uploads'
+UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+UPLOAD_CHUNK_MAX_BYTES = 4 * 1024 * 1024
+UPLOAD_SESSION_TTL_HOURS = 24
+# A chunk claim left by a worker that died mid-chunk is released after this long
+UPLOAD_CLAIM_TIMEOUT = 300
+
+# Uploads are stored under content-hashed names so they can be cached forever
+STORAGES = {
+    'default': {
+        'BACKEND': 'bookly_app.media.HashedFileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# How /media/ is delivered: 'python' streams from the worker, 'x-accel' hands
+# the transfer to nginx and 'x-sendfile' to Apache/lighttpd
+MEDIA_SERVE_MODE = 'python'
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 3600
 
 # JWT Settings
 SIMPLE_JWT = {
@@ -1,16 +1,287 @@
+import json
+import os
+from django.conf import settings
 from django.contrib import admin
-from .models import Book, Genre, UserProfile, Bookshelf, Review, ExchangeOffer, ExchangeRequest, Discussion, Comment, SupportTicket, TicketReply, Author
-
-# Регистрация моделей в админке
-admin.site.register(Book)
-admin.site.register(Genre)
-admin.site.register(UserProfile)
-admin.site.register(Bookshelf)
-admin.site.register(Review)
-admin.site.register(ExchangeOffer)
-admin.site.register(ExchangeRequest)
-admin.site.register(Discussion)
-admin.site.register(Comment)
-admin.site.register(SupportTicket)
-admin.site.register(TicketReply)
-admin.site.register(Author)
+from django.core.paginator import Paginator
+from django.db import connection
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils import timezone
+from django.utils.html import format_html
+from .models import Book, Genre, UserProfile, Bookshelf, Review, ExchangeOffer, ExchangeRequest, Discussion, Comment, SupportTicket, TicketReply, Author, RequestProfile, BookActivity, Job, ImportJob, ArchivedExchangeOffer, ArchivedExchangeRequest, ArchivedSupportTicket, ArchivedTicketReply, Notification, InboxState, UploadSession, UserStats
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that doesn't COUNT(*) whole tables: for an unfiltered changelist
+    it uses the planner's row estimate on PostgreSQL, falling back to an exact
+    count for small or filtered tables. Other backends keep no row statistics
+    (SQLite's highest rowid overcounts once rows are deleted, e.g. archived),
+    so they always count.
+    """
+    exact_count_threshold = 10000
+    
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = self._estimate(self.object_list.model._meta.db_table)
+            if estimate is not None and estimate > self.exact_count_threshold:
+                return estimate
+        return super().count
+    
+    def _estimate(self, table):
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # Changelists never run COUNT(*) over the whole table
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(Genre)
+class GenreAdmin(admin.ModelAdmin):
+    search_fields = ('name',)
+
+
+@admin.register(Author)
+class AuthorAdmin(LargeTableAdmin):
+    list_display = ('name', 'birth_date', 'death_date')
+    search_fields = ('^name',)
+
+
+@admin.register(Book)
+class BookAdmin(LargeTableAdmin):
+    list_display = ('title', 'author', 'isbn', 'publication_date', 'created_at')
+    list_select_related = ('author',)
+    autocomplete_fields = ('author', 'genres')
+    search_fields = ('^title', '=isbn13', '^author__name')
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(LargeTableAdmin):
+    list_display = ('user', 'full_name')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('=user__username', '^full_name')
+
+
+@admin.register(Bookshelf)
+class BookshelfAdmin(LargeTableAdmin):
+    list_display = ('name', 'user', 'created_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user', 'books')
+    search_fields = ('=user__username',)
+
+
+@admin.register(Review)
+class ReviewAdmin(LargeTableAdmin):
+    list_display = ('id', 'book', 'user', 'rating', 'created_at')
+    list_select_related = ('book__author', 'user')
+    raw_id_fields = ('book', 'user')
+    search_fields = ('=user__username', '^book__title')
+
+
+@admin.register(ExchangeOffer)
+class ExchangeOfferAdmin(LargeTableAdmin):
+    list_display = ('id', 'book', 'owner', 'exchange_type', 'status', 'created_at')
+    list_filter = ('status', 'exchange_type')
+    list_select_related = ('book', 'owner')
+    raw_id_fields = ('book', 'owner')
+    search_fields = ('=owner__username', '^book__title')
+
+
+@admin.register(ExchangeRequest)
+class ExchangeRequestAdmin(LargeTableAdmin):
+    list_display = ('id', 'offer', 'requester', 'status', 'created_at')
+    list_filter = ('status',)
+    list_select_related = ('offer__book', 'requester')
+    raw_id_fields = ('offer', 'requester')
+    search_fields = ('=requester__username',)
+
+
+@admin.register(Discussion)
+class DiscussionAdmin(LargeTableAdmin):
+    list_display = ('title', 'created_by', 'book', 'author', 'comment_count', 'last_activity_at', 'created_at')
+    list_select_related = ('created_by', 'book__author', 'author')
+    readonly_fields = ('comment_count', 'last_activity_at')
+    raw_id_fields = ('created_by', 'book', 'author')
+    search_fields = ('^title',)
+
+
+@admin.register(Comment)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'discussion', 'created_at')
+    list_select_related = ('user', 'discussion')
+    raw_id_fields = ('discussion', 'user', 'likes')
+    search_fields = ('=user__username',)
+
+
+@admin.register(SupportTicket)
+class SupportTicketAdmin(LargeTableAdmin):
+    list_display = ('subject', 'user', 'status', 'created_at')
+    list_filter = ('status',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('=user__username', '^subject')
+
+
+@admin.register(TicketReply)
+class TicketReplyAdmin(LargeTableAdmin):
+    list_display = ('id', 'ticket', 'user', 'created_at')
+    list_select_related = ('ticket__user', 'user')
+    raw_id_fields = ('ticket', 'user')
+
+
+@admin.register(BookActivity)
+class BookActivityAdmin(LargeTableAdmin):
+    list_display = ('book', 'date', 'reviews', 'shelvings', 'offers')
+    list_select_related = ('book__author',)
+    raw_id_fields = ('book',)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(LargeTableAdmin):
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'sql_time_ms', 'mode', 'user')
+    list_filter = ('mode', 'method', 'status_code')
+    search_fields = ('path',)
+    list_select_related = ('user',)
+    readonly_fields = ('created_at', 'user', 'method', 'path', 'mode', 'status_code', 'duration_ms',
+                       'query_count', 'sql_time_ms', 'download', 'sql')
+    exclude = ('queries', 'profile_file')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_urls(self):
+        return [
+            path('<int:object_id>/download/', self.admin_site.admin_view(self.download_view),
+                 name='bookly_app_requestprofile_download'),
+        ] + super().get_urls()
+    
+    def download_view(self, request, object_id):
+        profile = self.get_object(request, object_id)
+        if profile is None or not self.has_view_permission(request, profile):
+            raise Http404
+        full_path = os.path.join(settings.PROFILING_DIR, os.path.basename(profile.profile_file))
+        if not os.path.exists(full_path):
+            raise Http404
+        return FileResponse(open(full_path, 'rb'), as_attachment=True, filename=profile.profile_file)
+    
+    @admin.display(description='Profile')
+    def download(self, obj):
+        url = reverse('admin:bookly_app_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.profile_file)
+    
+    @admin.display(description='SQL')
+    def sql(self, obj):
+        return format_html('<pre style="white-space: pre-wrap">{}</pre>', json.dumps(obj.queries, indent=2))
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ('id', 'task', 'status', 'run_at', 'attempts', 'locked_by', 'finished_at')
+    list_filter = ('status', 'task')
+    search_fields = ('=idempotency_key',)
+    readonly_fields = ('attempts', 'last_error', 'locked_by', 'locked_at', 'created_at', 'finished_at')
+    actions = ['retry']
+    
+    @admin.action(description='Run selected jobs again now')
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status='RUNNING').update(status='QUEUED', run_at=timezone.now(), attempts=0)
+        self.message_user(request, f'{updated} job(s) queued.')
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'format', 'status', 'processed_rows', 'total_rows', 'created_at')
+    list_filter = ('status',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('=user__username',)
+
+
+class ArchiveAdmin(LargeTableAdmin):
+    """Archive rows are history: viewable, never edited"""
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedExchangeOffer)
+class ArchivedExchangeOfferAdmin(ArchiveAdmin):
+    list_display = ('id', 'book', 'owner', 'exchange_type', 'status', 'created_at', 'archived_at')
+    list_filter = ('status',)
+    list_select_related = ('book__author', 'owner')
+    search_fields = ('=owner__username',)
+
+
+@admin.register(ArchivedExchangeRequest)
+class ArchivedExchangeRequestAdmin(ArchiveAdmin):
+    list_display = ('id', 'offer_id', 'requester', 'status', 'created_at', 'archived_at')
+    list_filter = ('status',)
+    list_select_related = ('requester',)
+    search_fields = ('=requester__username', '=offer_id')
+
+
+class ArchivedTicketReplyInline(admin.TabularInline):
+    model = ArchivedTicketReply
+    fields = ('user', 'message', 'created_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(ArchivedSupportTicket)
+class ArchivedSupportTicketAdmin(ArchiveAdmin):
+    list_display = ('subject', 'user', 'status', 'created_at', 'archived_at')
+    list_select_related = ('user',)
+    search_fields = ('=user__username', '^subject')
+    inlines = [ArchivedTicketReplyInline]
+
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ('id', 'recipient', 'verb', 'object_id', 'book', 'actor', 'is_read', 'created_at')
+    list_filter = ('verb', 'is_read')
+    list_select_related = ('recipient', 'actor', 'book__author')
+    raw_id_fields = ('recipient', 'actor', 'book')
+    search_fields = ('=recipient__username',)
+
+
+@admin.register(InboxState)
+class InboxStateAdmin(LargeTableAdmin):
+    list_display = ('user', 'unread_count', 'broadcast_read_id')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('=user__username',)
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'target', 'object_id', 'received', 'size', 'status', 'updated_at')
+    list_filter = ('status', 'target')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('=user__username',)
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(LargeTableAdmin):
+    list_display = ('user', 'books_shelved', 'reviews_written', 'exchanges_completed', 'updated_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('=user__username',)
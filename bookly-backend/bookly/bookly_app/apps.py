@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class BooklyAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bookly_app'
+    
+    def ready(self):
+        # Connect signal handlers that keep the derived tables up to date
+        from . import signals  # noqa: F401
+        # Register the background job functions
+        from . import tasks  # noqa: F401
+        # Register the deployment check for the shared throttle cache
+        from . import throttling  # noqa: F401
@@ -0,0 +1,117 @@
+"""
+Moves finished exchanges and closed support tickets out of the hot tables.
+
+Rows older than the cutoff are copied into the ``Archived*`` tables, keeping
+their ids, and deleted from the live tables. The work runs in batches of
+``batch_size``, one transaction per batch, so a run can be interrupted at any
+point without losing or duplicating rows.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Q
+from django.utils import timezone
+
+from .models import (
+    ArchivedExchangeOffer, ArchivedExchangeRequest, ArchivedSupportTicket, ArchivedTicketReply,
+    ExchangeOffer, ExchangeRequest, SupportTicket, TicketReply,
+)
+
+FINAL_EXCHANGE_STATUSES = ('COMPLETED', 'REJECTED')
+FINAL_TICKET_STATUSES = ('CLOSED',)
+
+OFFER_FIELDS = ('id', 'book_id', 'owner_id', 'condition', 'exchange_type', 'price',
+                'exchange_preferences', 'status', 'created_at')
+REQUEST_FIELDS = ('id', 'offer_id', 'requester_id', 'message', 'status', 'created_at')
+TICKET_FIELDS = ('id', 'user_id', 'subject', 'message', 'status', 'created_at')
+REPLY_FIELDS = ('id', 'ticket_id', 'user_id', 'message', 'created_at')
+
+
+def default_cutoff():
+    return timezone.now() - datetime.timedelta(days=getattr(settings, 'ARCHIVE_AFTER_DAYS', 180))
+
+
+def _copy(rows, archive_model):
+    # ignore_conflicts keeps a re-run harmless if a row was copied before
+    archive_model.objects.bulk_create([archive_model(**row) for row in rows], ignore_conflicts=True)
+
+
+def _batches(queryset, batch_size):
+    """Yields lists of primary keys until ``queryset`` has nothing left."""
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+
+
+def archivable_offers(cutoff):
+    """Finished offers; they are archived together with all of their requests."""
+    offers = ExchangeOffer.objects.filter(status__in=FINAL_EXCHANGE_STATUSES, created_at__lt=cutoff)
+    # An offer with a request still being negotiated stays live
+    return offers.exclude(
+        Exists(ExchangeRequest.objects.filter(offer=OuterRef('pk')).exclude(status__in=FINAL_EXCHANGE_STATUSES))
+    )
+
+
+def archivable_requests(cutoff):
+    """Finished requests whose offer is still live (e.g. it was accepted for someone else)."""
+    return ExchangeRequest.objects.filter(status__in=FINAL_EXCHANGE_STATUSES, created_at__lt=cutoff)
+
+
+def archivable_tickets(cutoff):
+    """Closed tickets without replies since the cutoff; archived with their replies."""
+    return (
+        SupportTicket.objects
+        .filter(status__in=FINAL_TICKET_STATUSES, created_at__lt=cutoff)
+        .annotate(last_reply_at=Max('replies__created_at'))
+        .filter(Q(last_reply_at__isnull=True) | Q(last_reply_at__lt=cutoff))
+    )
+
+
+def archive_offers(cutoff, batch_size):
+    moved = 0
+    for ids in _batches(archivable_offers(cutoff), batch_size):
+        with transaction.atomic():
+            requests = ExchangeRequest.objects.filter(offer_id__in=ids)
+            _copy(requests.values(*REQUEST_FIELDS), ArchivedExchangeRequest)
+            _copy(ExchangeOffer.objects.filter(id__in=ids).values(*OFFER_FIELDS), ArchivedExchangeOffer)
+            requests.delete()
+            ExchangeOffer.objects.filter(id__in=ids).delete()
+        moved += len(ids)
+    return moved
+
+
+def archive_requests(cutoff, batch_size):
+    moved = 0
+    for ids in _batches(archivable_requests(cutoff), batch_size):
+        with transaction.atomic():
+            _copy(ExchangeRequest.objects.filter(id__in=ids).values(*REQUEST_FIELDS), ArchivedExchangeRequest)
+            ExchangeRequest.objects.filter(id__in=ids).delete()
+        moved += len(ids)
+    return moved
+
+
+def archive_tickets(cutoff, batch_size):
+    moved = 0
+    for ids in _batches(archivable_tickets(cutoff), batch_size):
+        with transaction.atomic():
+            replies = TicketReply.objects.filter(ticket_id__in=ids)
+            _copy(SupportTicket.objects.filter(id__in=ids).values(*TICKET_FIELDS), ArchivedSupportTicket)
+            _copy(replies.values(*REPLY_FIELDS), ArchivedTicketReply)
+            replies.delete()
+            SupportTicket.objects.filter(id__in=ids).delete()
+        moved += len(ids)
+    return moved
+
+
+def archive_all(cutoff=None, batch_size=None):
+    """Runs every archiver; returns ``{name: rows moved}``."""
+    cutoff = cutoff or default_cutoff()
+    batch_size = batch_size or getattr(settings, 'ARCHIVE_BATCH_SIZE', 1000)
+    return {
+        'offers': archive_offers(cutoff, batch_size),
+        'requests': archive_requests(cutoff, batch_size),
+        'tickets': archive_tickets(cutoff, batch_size),
+    }
@@ -0,0 +1,157 @@
+"""
+Password hashing off the request threads.
+
+Hashing a password costs tens of milliseconds of CPU (and, for scrypt, 16 MB
+of memory) by design. Without a limit, a burst of logins lets every worker
+thread hash at once, and all other requests stall behind them. Here hashing
+runs in one bounded pool per process. ``hashlib`` releases the GIL while it
+hashes, so the pool's threads really do run in parallel. Requests that find
+more than ``PASSWORD_HASHING_MAX_PENDING`` hashes already waiting get an
+immediate 503 with Retry-After instead of queueing.
+"""
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import metrics
+
+
+def _unknown_user_key(username):
+    # Usernames typed at login can contain anything; keep the cache key safe
+    return 'login:unknown:' + hashlib.sha256(username.encode()).hexdigest()
+
+
+class HashingOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins in progress, please retry shortly.'
+    default_code = 'hashing_overloaded'
+
+    def __init__(self):
+        super().__init__()
+        self.wait = getattr(settings, 'PASSWORD_HASHING_RETRY_AFTER', 1)
+
+
+class HashingPool:
+    def __init__(self, workers, max_pending, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='bookly-hash')
+        # One slot per running or waiting hash
+        self.slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def run(self, operation, func, *args):
+        if not self.slots.acquire(blocking=False):
+            metrics.HASHING_REJECTED.inc()
+            raise HashingOverloaded()
+        try:
+            future = self.executor.submit(self._timed, operation, func, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            metrics.HASHING_REJECTED.inc()
+            raise HashingOverloaded()
+
+    def _timed(self, operation, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            metrics.PASSWORD_HASH_TIME.labels(operation).observe(time.perf_counter() - start)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(
+                    workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or os.cpu_count() or 1,
+                    max_pending=getattr(settings, 'PASSWORD_HASHING_MAX_PENDING', 32),
+                    timeout=getattr(settings, 'PASSWORD_HASHING_TIMEOUT', 10),
+                )
+    return _pool
+
+
+def hash_password(raw_password):
+    return get_pool().run('hash', make_password, raw_password)
+
+
+def verify_password(user, raw_password):
+    """
+    Checks ``raw_password`` against ``user``. A correct password stored with
+    an outdated hasher or work factor is re-hashed with the preferred one, so
+    accounts migrate to new ``PASSWORD_HASHERS`` as their owners log in.
+    """
+    encoded = user.password
+    if not get_pool().run('verify', check_password, raw_password, encoded):
+        return False
+    if needs_rehash(encoded):
+        user.password = hash_password(raw_password)
+        user.save(update_fields=['password'])
+    return True
+
+
+def needs_rehash(encoded):
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    preferred = get_hasher('default')
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def forget_unknown_user(username):
+    cache.delete(_unknown_user_key(username))
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ``ModelBackend`` that hashes in the shared pool. Unknown usernames are
+    remembered for ``LOGIN_UNKNOWN_USER_CACHE_TIMEOUT`` seconds, so retries
+    against them skip the user lookup. They still pay for one hash, as every
+    miss does: answering them faster than a wrong password would tell a caller
+    which usernames exist. Floods of them are bounded by the pool like any
+    other login.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        key = _unknown_user_key(username)
+        if cache.get(key):
+            # Hash anyway, like ModelBackend, so a miss takes as long as a
+            # wrong password
+            hash_password(password)
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            hash_password(password)
+            cache.set(key, True, getattr(settings, 'LOGIN_UNKNOWN_USER_CACHE_TIMEOUT', 60))
+            return None
+        if verify_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
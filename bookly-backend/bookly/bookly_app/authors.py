@@ -0,0 +1,93 @@
+"""
+Resolving author names to authors.
+
+Names are matched on ``Author.name_key`` (see names.py), which has a unique
+index. :func:`resolve_many` looks up all the names it is given with one
+SELECT. It inserts the missing authors with one INSERT that ignores
+conflicts, then reads back the ids with a second SELECT. Two requests or
+imports creating the same author at once therefore end up with the same row
+and never fail. Resolved ids are kept in a small per-process LRU cache, new
+ones once their transaction commits. The author signals drop changed and
+deleted authors from it.
+"""
+import collections
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Author
+from .names import clean_name, name_key
+
+logger = logging.getLogger(__name__)
+
+_cache = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def _cache_size():
+    return getattr(settings, 'AUTHOR_CACHE_SIZE', 10000)
+
+
+def _cached(keys):
+    with _lock:
+        found = {}
+        for key in keys:
+            if key in _cache:
+                _cache.move_to_end(key)
+                found[key] = _cache[key]
+        return found
+
+
+def _remember(ids):
+    with _lock:
+        _cache.update(ids)
+        for key in ids:
+            _cache.move_to_end(key)
+        while len(_cache) > _cache_size():
+            _cache.popitem(last=False)
+
+
+def forget(author_id):
+    """Drops an author from the cache, e.g. after a rename or delete."""
+    with _lock:
+        for key in [key for key, cached_id in _cache.items() if cached_id == author_id]:
+            del _cache[key]
+
+
+def resolve_many(names, create=True):
+    """
+    Maps every name in ``names`` to an author id. Unknown authors are created,
+    or left out of the result when ``create`` is false.
+    """
+    keys = {name: name_key(name) for name in names}
+    if not all(keys.values()):
+        raise ValueError("Author names must not be blank.")
+    ids = _cached(set(keys.values()))
+    missing = set(keys.values()) - ids.keys()
+    if missing:
+        found = dict(Author.objects.filter(name_key__in=missing).values_list('name_key', 'id'))
+        _remember(found)
+        ids.update(found)
+        new = missing - found.keys()
+        if new and create:
+            # The first spelling of a new author becomes its name
+            spellings = {}
+            for name, key in keys.items():
+                spellings.setdefault(key, clean_name(name))
+            Author.objects.bulk_create(
+                [Author(name=spellings[key], name_key=key) for key in new],
+                ignore_conflicts=True,
+            )
+            created = dict(Author.objects.filter(name_key__in=new).values_list('name_key', 'id'))
+            # A rolled-back transaction must not leave its authors in the cache
+            transaction.on_commit(lambda: _remember(created))
+            ids.update(created)
+            logger.info("Created %d new authors", len(new), extra={'authors': sorted(spellings[key] for key in new)})
+    return {name: ids[key] for name, key in keys.items() if key in ids}
+
+
+def resolve(name, create=True):
+    """The id of the author called ``name``, creating it if needed; ``None`` if unknown and not ``create``."""
+    return resolve_many([name], create=create).get(name)
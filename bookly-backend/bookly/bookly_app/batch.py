@@ -0,0 +1,167 @@
+import io
+import json
+import logging
+import re
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import LimitedStream, WSGIRequest
+from django.db import transaction
+from django.urls import Resolver404, resolve, reverse
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_METHODS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+# {$name.field.0.id} pulls a value out of an earlier sub-response body
+REFERENCE_RE = re.compile(r'\{\$(\w+)((?:\.[\w-]+)*)\}')
+
+
+class UnresolvedReference(Exception):
+    pass
+
+
+def _max_requests():
+    return getattr(settings, 'BATCH_MAX_REQUESTS', 25)
+
+
+class BatchView(APIView):
+    """
+    Runs an ordered list of sub-requests against the API in a single round trip.
+
+    Each item is ``{"method", "path", "body"?, "name"?}``. Later items can use
+    ``{$name.field}`` (or ``{$0.field}`` by position) in their path or body to refer
+    to earlier response bodies. With ``"atomic": true`` everything runs in one
+    transaction that is rolled back at the first failing sub-request.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        items = request.data.get('requests')
+        atomic = bool(request.data.get('atomic', False))
+        if not isinstance(items, list) or not items:
+            return Response({"requests": ["A non-empty list is required."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > _max_requests():
+            return Response({"requests": [f"At most {_max_requests()} sub-requests are allowed."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if atomic:
+            with transaction.atomic():
+                responses, failed = self._run(request, items, stop_on_error=True)
+                if failed:
+                    transaction.set_rollback(True)
+        else:
+            responses, failed = self._run(request, items, stop_on_error=False)
+
+        return Response({
+            'committed': not (atomic and failed),
+            'responses': responses,
+        })
+
+    def _run(self, request, items, stop_on_error):
+        results = {}
+        responses = []
+        failed = False
+        for index, item in enumerate(items):
+            name = item.get('name') if isinstance(item, dict) else None
+            if failed and stop_on_error:
+                responses.append({'name': name, 'status': status.HTTP_424_FAILED_DEPENDENCY,
+                                  'body': {"detail": "Skipped after an earlier sub-request failed."}})
+                continue
+
+            try:
+                code, body = self._dispatch(request, item, results)
+            except UnresolvedReference as e:
+                code, body = status.HTTP_424_FAILED_DEPENDENCY, {"detail": str(e)}
+            except Exception:
+                logger.exception("Batch sub-request %d failed", index)
+                code, body = status.HTTP_500_INTERNAL_SERVER_ERROR, {"detail": "Internal server error."}
+
+            if code < 400:
+                results[str(index)] = body
+                if name:
+                    results[name] = body
+            else:
+                failed = True
+            responses.append({'name': name, 'status': code, 'body': body})
+        return responses, failed
+
+    def _dispatch(self, request, item, results):
+        if not isinstance(item, dict):
+            return status.HTTP_400_BAD_REQUEST, {"detail": "Each sub-request must be an object."}
+        method = str(item.get('method', 'GET')).upper()
+        if method not in ALLOWED_METHODS:
+            return status.HTTP_405_METHOD_NOT_ALLOWED, {"detail": f"Method {method} is not allowed."}
+
+        path = _substitute(item.get('path', ''), results)
+        url = urlsplit(str(path))
+        if not url.path.startswith('/api/') or url.path == reverse('batch'):
+            return status.HTTP_400_BAD_REQUEST, {"detail": "Only API endpoints can be batched."}
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            return status.HTTP_404_NOT_FOUND, {"detail": "Not found."}
+
+        body = b''
+        if 'body' in item:
+            body = json.dumps(_substitute(item['body'], results)).encode()
+
+        sub_request = _build_request(request, method, url.path, url.query, body)
+        sub_request.resolver_match = match
+        response = match.func(sub_request, *match.args, **match.kwargs)
+        data = getattr(response, 'data', None)
+        if data is None and response.content:
+            data = json.loads(response.content)
+        return response.status_code, data
+
+
+def _build_request(request, method, path, query, body):
+    environ = {
+        key: value for key, value in request._request.META.items()
+        if key not in ('CONTENT_LENGTH', 'CONTENT_TYPE', 'QUERY_STRING', 'wsgi.input')
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': LimitedStream(io.BytesIO(body), len(body)),
+    })
+    sub_request = WSGIRequest(environ)
+    # The batch itself is already authenticated; DRF skips its authenticators
+    # (and the JWT signature check) when these are set
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    return sub_request
+
+
+def _lookup(results, name, path):
+    if name not in results:
+        raise UnresolvedReference(f"No successful sub-request named '{name}'.")
+    value = results[name]
+    for key in filter(None, path.split('.')):
+        try:
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise UnresolvedReference(f"'{name}{path}' does not exist.")
+    return value
+
+
+def _substitute(value, results):
+    if isinstance(value, dict):
+        return {key: _substitute(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute(item, results) for item in value]
+    if not isinstance(value, str):
+        return value
+    whole = REFERENCE_RE.fullmatch(value)
+    if whole:
+        # Keep the referenced value's type, e.g. an integer ID
+        return _lookup(results, whole.group(1), whole.group(2))
+    return REFERENCE_RE.sub(lambda m: str(_lookup(results, m.group(1), m.group(2))), value)
@@ -0,0 +1,117 @@
+"""
+Book cards: the summary of a book that lists show.
+
+:class:`~bookly_app.models.BookCard` holds each book's title, author name,
+genre names, rating and cover URL, plus the card's JSON already rendered. The
+signals rewrite a card in the transaction that changes the book, its author
+or its genres. Rating and cover updates, which are written with UPDATE
+statements, call :func:`refresh` themselves.
+
+Ratings are the exception: a review write queues the book's rating
+recompute (see tasks.py) instead of changing the card in its own
+transaction, so the rating on the card and on the book catch up together
+once a ``run_jobs`` worker has run that job. That is normally within a
+second or two of the commit, or right after it with ``JOBS_RUN_INLINE``, but
+longer while the queue is backed up or no worker runs. :func:`check` can
+count such cards as outdated in the meantime. List endpoints select only
+``data`` and join the strings with :func:`splice`, so no model instance or
+serializer is involved. :func:`check` compares every card with a fresh
+rendering.
+"""
+import json
+
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+
+from .models import Book, BookCard, Genre
+
+BATCH_SIZE = 500
+
+CARD_FIELDS = ('title', 'author_name', 'genre_names', 'average_rating', 'rating_count', 'cover_url', 'data')
+
+
+def render(book_id, title, author_id, author_name, genre_names, average_rating, rating_count, cover_name):
+    """The card of a book as a dict of its column values, ``data`` included."""
+    cover_url = default_storage.url(cover_name) if cover_name else ''
+    card = {
+        'id': book_id,
+        'title': title,
+        'author': author_id,
+        'author_name': author_name,
+        'genres': genre_names,
+        'average_rating': average_rating,
+        'rating_count': rating_count,
+        'cover_image': cover_url or None,
+    }
+    return {
+        'title': title,
+        'author_name': author_name,
+        'genre_names': genre_names,
+        'average_rating': average_rating,
+        'rating_count': rating_count,
+        'cover_url': cover_url,
+        'data': json.dumps(card, ensure_ascii=False, separators=(',', ':')),
+    }
+
+
+def _render_books(book_ids):
+    books = (
+        Book.objects
+        .filter(id__in=book_ids)
+        .select_related('author')
+        .prefetch_related(Prefetch('genres', queryset=Genre.objects.order_by('name')))
+        .only('id', 'title', 'author__name', 'rating_avg', 'rating_count', 'cover_image')
+    )
+    return {
+        book.id: render(book.id, book.title, book.author_id, book.author.name,
+                        [genre.name for genre in book.genres.all()],
+                        book.rating_avg, book.rating_count, book.cover_image.name)
+        for book in books
+    }
+
+
+def refresh(book_ids):
+    """Rewrites the cards of ``book_ids``; ids of deleted books are skipped."""
+    book_ids = sorted(set(book_ids))
+    for start in range(0, len(book_ids), BATCH_SIZE):
+        rendered = _render_books(book_ids[start:start + BATCH_SIZE])
+        BookCard.objects.bulk_create(
+            [BookCard(book_id=book_id, **values) for book_id, values in rendered.items()],
+            update_conflicts=True, unique_fields=['book'], update_fields=[*CARD_FIELDS, 'updated_at'],
+        )
+
+
+def splice(data):
+    """A JSON array of the stored card strings in ``data``."""
+    return '[' + ','.join(item for item in data if item is not None) + ']'
+
+
+def check(batch_size=1000, fix=False):
+    """
+    Compares every card with the source tables; returns ``(checked, missing,
+    stale)`` and, with ``fix``, rewrites the cards that differ.
+    """
+    checked = missing = stale = 0
+    last_id = 0
+    while True:
+        ids = list(Book.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return checked, missing, stale
+        last_id = ids[-1]
+        expected = _render_books(ids)
+        stored = {
+            card['book_id']: card
+            for card in BookCard.objects.filter(book_id__in=ids).values('book_id', *CARD_FIELDS)
+        }
+        wrong = []
+        for book_id, values in expected.items():
+            card = stored.get(book_id)
+            if card is None:
+                missing += 1
+                wrong.append(book_id)
+            elif any(card[field] != values[field] for field in CARD_FIELDS):
+                stale += 1
+                wrong.append(book_id)
+        checked += len(expected)
+        if fix and wrong:
+            refresh(wrong)
@@ -0,0 +1,63 @@
+"""
+Denormalized discussion counters.
+
+``Discussion.comment_count`` and ``Discussion.last_activity_at`` let the
+discussion index sort by activity from an index, without aggregating over
+comments. Comment signals keep them current with single UPDATE statements
+built on F() expressions, so concurrent comments never lose an increment.
+:func:`repair` recomputes both from the comments.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Discussion
+
+
+def comment_added(comment):
+    Discussion.objects.filter(pk=comment.discussion_id).update(
+        comment_count=F('comment_count') + 1,
+        last_activity_at=Greatest(F('last_activity_at'), comment.created_at),
+    )
+
+
+def _last_comment_at():
+    return Subquery(
+        Comment.objects.filter(discussion=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    )
+
+
+def comment_removed(comment):
+    # The latest comment may be the one that went; fall back to the one before it
+    Discussion.objects.filter(pk=comment.discussion_id).update(
+        comment_count=Greatest(F('comment_count') - 1, 0),
+        last_activity_at=Coalesce(_last_comment_at(), F('created_at')),
+    )
+
+
+def repair(batch_size=1000):
+    """Recomputes the counters of every discussion; returns how many were out of date."""
+    comment_count = Subquery(
+        Comment.objects.filter(discussion=OuterRef('pk')).order_by()
+        .values('discussion').annotate(n=Count('id')).values('n')
+    )
+    fixed = 0
+    last_id = 0
+    while True:
+        ids = list(
+            Discussion.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return fixed
+        last_id = ids[-1]
+        stale = (
+            Discussion.objects
+            .filter(id__in=ids)
+            .annotate(actual_count=Coalesce(comment_count, 0),
+                      actual_activity=Coalesce(_last_comment_at(), F('created_at')))
+            .exclude(comment_count=F('actual_count'), last_activity_at=F('actual_activity'))
+            .values_list('id', flat=True)
+        )
+        fixed += Discussion.objects.filter(id__in=list(stale)).update(
+            comment_count=Coalesce(comment_count, 0),
+            last_activity_at=Coalesce(_last_comment_at(), F('created_at')),
+        )
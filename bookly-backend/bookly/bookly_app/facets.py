@@ -0,0 +1,164 @@
+"""
+Facet counts for book listings: books per genre, author, decade and rating.
+
+All four facets come from one statement, a UNION ALL of four GROUP BY
+queries over the current result set. Counts for the whole catalog are the
+same for every visitor. They are cached, and the ``refresh_catalog_facets``
+job recomputes them on a schedule, so an unfiltered browse page never pays
+for the aggregate.
+"""
+import heapq
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import Cast, ExtractYear, Floor
+from rest_framework.exceptions import ValidationError
+
+from . import metrics
+from .models import Author, Book, Genre
+
+FACETS = ('genre', 'author', 'decade', 'rating')
+CATALOG_CACHE_KEY = 'facets:catalog'
+
+# Every part of the UNION must produce the same columns in the same order
+FACET_COLUMNS = ('f_facet', 'f_value')
+
+# Accepted values per facet. A decade filter ends at decade + 10, which must
+# still be a valid year; ids stay within a 64-bit column.
+FACET_BOUNDS = {
+    'genre': (1, 2 ** 63 - 1),
+    'author': (1, 2 ** 63 - 1),
+    'decade': (0, 9980),
+    'rating': (0, 5),
+}
+
+
+def _facet_size():
+    return getattr(settings, 'FACET_SIZE', 20)
+
+
+def _decade():
+    return Cast(Floor(ExtractYear('publication_date') / 10) * 10, IntegerField())
+
+
+def _rating_bucket():
+    # Bucket 4 holds averages from 4.0 up to (not including) 5.0; unrated books have none
+    return Case(
+        When(rating_count=0, then=Value(None)),
+        default=Cast(Floor('rating_avg'), IntegerField()),
+        output_field=IntegerField(),
+    )
+
+
+def _int_values(params, name):
+    raw = params.get(name)
+    if not raw:
+        return []
+    values = raw.split(',')
+    if not all(value.isdigit() for value in values):
+        raise ValidationError({name: ["A comma-separated list of integers is required."]})
+    values = [int(value) for value in values]
+    low, high = FACET_BOUNDS[name]
+    if not all(low <= value <= high for value in values):
+        raise ValidationError({name: [f"Values must be between {low} and {high}."]})
+    return values
+
+
+def selected(params):
+    """The facet values chosen in the query string, as ``{facet: [values]}``."""
+    return {name: values for name in FACETS if (values := _int_values(params, name))}
+
+
+def apply_filters(queryset, chosen):
+    """
+    Narrows ``queryset`` to the chosen facet values: values of one facet are
+    OR-ed together, different facets are AND-ed.
+    """
+    if 'genre' in chosen:
+        queryset = queryset.filter(
+            pk__in=Book.genres.through.objects.filter(genre_id__in=chosen['genre']).values('book_id')
+        )
+    if 'author' in chosen:
+        queryset = queryset.filter(author_id__in=chosen['author'])
+    if 'decade' in chosen:
+        decades = Q()
+        for decade in chosen['decade']:
+            # Dates start at year 1, so the 0s decade can't begin at year 0
+            decades |= Q(publication_date__year__gte=max(decade, 1), publication_date__year__lt=decade + 10)
+        queryset = queryset.filter(decades)
+    if 'rating' in chosen:
+        ratings = Q()
+        for bucket in chosen['rating']:
+            ratings |= Q(rating_avg__gte=bucket, rating_avg__lt=bucket + 1)
+        queryset = queryset.filter(ratings, rating_count__gt=0)
+    return queryset
+
+
+def _part(queryset, facet, value):
+    return (
+        queryset
+        .annotate(f_facet=Value(facet), f_value=value)
+        .filter(f_value__isnull=False)
+        .values(*FACET_COLUMNS)
+        .annotate(f_count=Count('*'))
+        .order_by()
+    )
+
+
+def count(queryset):
+    """Returns ``{facet: {value: count}}`` for the books in ``queryset``."""
+    books = Book.objects.filter(pk__in=queryset.order_by().values('pk'))
+    genres = Book.genres.through.objects.filter(book__in=queryset.order_by().values('pk'))
+    parts = [
+        _part(genres, 'genre', F('genre_id')),
+        _part(books, 'author', F('author_id')),
+        _part(books, 'decade', _decade()),
+        _part(books, 'rating', _rating_bucket()),
+    ]
+    counts = {facet: {} for facet in FACETS}
+    for row in parts[0].union(*parts[1:], all=True):
+        counts[row['f_facet']][int(row['f_value'])] = row['f_count']
+    return counts
+
+
+def _entries(values, labels):
+    return [{'value': value, 'label': labels.get(value, str(value)), 'count': n} for value, n in values]
+
+
+def present(counts, size=None):
+    """Turns raw counts into labelled lists: the biggest genres and authors, all decades and ratings."""
+    size = size or _facet_size()
+    top = {
+        facet: heapq.nlargest(size, counts[facet].items(), key=lambda item: (item[1], -item[0]))
+        for facet in ('genre', 'author')
+    }
+    genre_names = dict(Genre.objects.filter(id__in=[value for value, _ in top['genre']]).values_list('id', 'name'))
+    author_names = dict(Author.objects.filter(id__in=[value for value, _ in top['author']]).values_list('id', 'name'))
+    return {
+        'genre': _entries(top['genre'], genre_names),
+        'author': _entries(top['author'], author_names),
+        'decade': _entries(sorted(counts['decade'].items(), reverse=True),
+                           {value: f'{value}s' for value in counts['decade']}),
+        'rating': _entries(sorted(counts['rating'].items(), reverse=True),
+                           {value: f'{value}+' if value < 5 else '5' for value in counts['rating']}),
+    }
+
+
+def refresh_catalog():
+    facets = present(count(Book.objects.all()))
+    cache.set(CATALOG_CACHE_KEY, facets, getattr(settings, 'FACET_CACHE_TIMEOUT', 30 * 60))
+    return facets
+
+
+def catalog():
+    """Facets of the whole catalog, from the cache when possible."""
+    facets = cache.get(CATALOG_CACHE_KEY)
+    metrics.record_cache_lookup('facets', facets is not None)
+    if facets is None:
+        facets = refresh_catalog()
+    return facets
+
+
+def for_queryset(queryset, filtered):
+    return present(count(queryset)) if filtered else catalog()
@@ -0,0 +1,148 @@
+import sys
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import permissions, serializers
+
+
+def _param_set(request, name):
+    value = request.query_params.get(name) if request is not None else None
+    if value is None:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin that lets clients shape the top-level representation.
+
+    ``?fields=id,title`` keeps only the listed fields and ``?expand=author`` swaps a
+    related field for the nested serializer declared in ``Meta.expandable_fields``
+    as ``{name: (serializer_class_or_name, kwargs)}``. Properties and method fields
+    that need related rows declare them in ``Meta.query_hints`` so the viewsets can
+    load exactly what the response uses.
+    """
+
+    def _is_root(self):
+        parent = self.parent
+        return parent is None or (
+            isinstance(parent, serializers.ListSerializer) and parent.parent is None
+        )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in permissions.SAFE_METHODS or not self._is_root():
+            return fields
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        expand = (_param_set(request, 'expand') or set()) & set(expandable)
+        for name in expand:
+            serializer_class, kwargs = expandable[name]
+            if isinstance(serializer_class, str):
+                serializer_class = getattr(sys.modules[type(self).__module__], serializer_class)
+            fields[name] = serializer_class(read_only=True, **kwargs)
+
+        requested = _param_set(request, 'fields')
+        if requested is not None:
+            for name in set(fields) - requested - expand:
+                fields.pop(name)
+        return fields
+
+
+def plan_queryset(queryset, serializer, prefix=''):
+    """
+    Work out which columns and relations ``serializer`` reads and return
+    ``(only, select_related, prefetch_related)``. ``only`` is ``None`` when a field
+    reads something the plan can't see, in which case no columns are deferred.
+    """
+    model = queryset.model
+    only = {prefix + model._meta.pk.name}
+    select, prefetch = set(), []
+    hints = getattr(getattr(serializer, 'Meta', None), 'query_hints', {})
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in hints:
+            hint = hints[name]
+            if only is not None:
+                only.update(prefix + f for f in hint.get('only', []))
+            select.update(prefix + f for f in hint.get('select', []))
+            prefetch.extend(prefix + f for f in hint.get('prefetch', []))
+            continue
+        if field.source == '*':
+            # Method fields without hints may read anything
+            only = None
+            continue
+
+        current, path = model, []
+        for index, attr in enumerate(field.source_attrs):
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                # A property or method; without a hint we can't tell what it reads
+                only = None
+                break
+            last = index == len(field.source_attrs) - 1
+            lookup = '__'.join(path + [attr])
+
+            if model_field.many_to_many or model_field.one_to_many:
+                child = getattr(field, 'child', None)
+                related = model_field.related_model.objects.all()
+                if isinstance(child, serializers.BaseSerializer):
+                    # Reverse FK prefetches match rows on the FK, so it must stay loaded
+                    extra = [model_field.field.name] if model_field.one_to_many else []
+                    related = optimize_queryset(related, child, extra_only=extra)
+                prefetch.append(Prefetch(prefix + lookup, queryset=related))
+                break
+            if model_field.is_relation:
+                if only is not None and not model_field.auto_created:
+                    only.add(prefix + lookup)
+                if last and not isinstance(field, serializers.BaseSerializer):
+                    # Plain primary key field: the FK column is enough
+                    break
+                select.add(prefix + lookup)
+                if last:
+                    nested_only, nested_select, nested_prefetch = plan_queryset(
+                        model_field.related_model.objects.all(), field, prefix=prefix + lookup + '__'
+                    )
+                    if only is not None and nested_only is not None:
+                        only.update(nested_only)
+                    elif nested_only is None:
+                        only = None
+                    select.update(nested_select)
+                    prefetch.extend(nested_prefetch)
+                    break
+                current, path = model_field.related_model, path + [attr]
+                continue
+            if only is not None:
+                only.add(prefix + lookup)
+            break
+    return only, select, prefetch
+
+
+def optimize_queryset(queryset, serializer, extra_only=()):
+    only, select, prefetch = plan_queryset(queryset, serializer)
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if only is not None:
+        queryset = queryset.only(*only, *extra_only)
+    return queryset
+
+
+class SparseFieldsetMixin:
+    """
+    Viewset mixin that trims the queryset to what ``?fields=``/``?expand=`` asked
+    for: unused joins and prefetches are dropped and unused columns deferred.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        params = self.request.query_params
+        if self.action not in ('list', 'retrieve') or ('fields' not in params and 'expand' not in params):
+            return queryset
+        return optimize_queryset(queryset, self.get_serializer())
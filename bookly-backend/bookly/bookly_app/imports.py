@@ -0,0 +1,295 @@
+"""
+Bulk import of a user's ratings, reviews and shelves from another site.
+
+The upload is CSV (e.g. a Goodreads export) or a JSON list of objects. Rows are
+handled in batches of ``IMPORT_BATCH_SIZE``. Each batch looks its books up in
+two queries (by ISBN, then by title and author), upserts reviews with
+``bulk_create(update_conflicts=True)`` and adds shelf memberships in bulk.
+Per-row signals are bypassed, so ratings and activity are updated once per
+import.
+"""
+import collections
+import csv
+import io
+import itertools
+import json
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from . import rankings, stats, sync
+from .isbn import to_isbn13
+from .models import Book, Bookshelf, ImportJob, Review
+from .tasks import update_book_ratings
+
+logger = logging.getLogger(__name__)
+
+MAX_ERRORS = 50
+
+# Accepted column names (lower case) for every field, in order of preference
+COLUMNS = {
+    'isbn': ('isbn13', 'isbn'),
+    'title': ('title', 'book title'),
+    'author': ('author', 'author name', 'author_name'),
+    'rating': ('my rating', 'rating'),
+    'review_title': ('review title', 'review_title'),
+    'review': ('my review', 'review', 'content'),
+}
+SHELF_COLUMNS = ('bookshelves', 'shelves', 'shelf', 'exclusive shelf')
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def detect_format(name, requested=None):
+    if requested:
+        if requested not in dict(ImportJob.FORMAT_CHOICES):
+            raise ImportFileError(f"Unknown format '{requested}'.")
+        return requested
+    extension = name.rsplit('.', 1)[-1].lower()
+    if extension not in dict(ImportJob.FORMAT_CHOICES):
+        raise ImportFileError("Use a .csv or .json file, or pass format=csv|json.")
+    return extension
+
+
+def read_rows(file, format):
+    """Yields the raw rows of an uploaded file as dicts with lower-case keys."""
+    if format == 'json':
+        data = json.load(file)
+        if not isinstance(data, list):
+            raise ImportFileError("A JSON import must be a list of objects.")
+        for item in data:
+            yield {str(key).strip().lower(): value for key, value in item.items()} if isinstance(item, dict) else {}
+        return
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    for item in csv.DictReader(text):
+        yield {str(key).strip().lower(): value for key, value in item.items() if key is not None}
+
+
+def _first(raw, names):
+    for name in names:
+        value = raw.get(name)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def clean_row(raw):
+    """Maps a raw row to ``{isbn, title, author, rating, review_title, review, shelves}``."""
+    row = {field: _first(raw, names) for field, names in COLUMNS.items()}
+    # Goodreads writes ISBNs as ="9780345391803"; compare canonical ISBN-13s
+    row['isbn'] = to_isbn13(row['isbn']) or ''
+    row['title'] = str(row['title'] or '').strip()
+    row['author'] = str(row['author'] or '').strip()
+    row['review_title'] = str(row['review_title'] or '')[:200]
+    row['review'] = str(row['review'] or '')
+
+    rating = row['rating']
+    try:
+        rating = int(float(rating)) if rating not in (None, '') else 0
+    except (TypeError, ValueError, OverflowError):
+        # OverflowError: int() of inf or 1e400
+        raise ImportFileError(f"Invalid rating '{rating}'.")
+    if not 0 <= rating <= 5:
+        raise ImportFileError(f"Rating {rating} is outside 0-5 (0 means not rated).")
+    # 0 means "not rated": the book is only shelved
+    row['rating'] = rating
+
+    shelves = []
+    for name in SHELF_COLUMNS:
+        value = raw.get(name)
+        if isinstance(value, list):
+            shelves.extend(value)
+        elif value:
+            shelves.extend(str(value).split(','))
+    row['shelves'] = list(dict.fromkeys(str(shelf).strip()[:100] for shelf in shelves if str(shelf).strip()))
+    return row
+
+
+def match_books(rows):
+    """Returns ``{row index: book id}`` for the rows whose book exists."""
+    isbns = {row['isbn'] for row in rows if row['isbn']}
+    by_isbn = dict(Book.objects.filter(isbn13__in=isbns).values_list('isbn13', 'id')) if isbns else {}
+
+    matches = {}
+    pending = []
+    for index, row in enumerate(rows):
+        if row['isbn'] in by_isbn:
+            matches[index] = by_isbn[row['isbn']]
+        elif row['title']:
+            pending.append(index)
+    if not pending:
+        return matches
+
+    titles = {rows[index]['title'] for index in pending}
+    # Compare in Python as well: SQLite's LOWER() only folds ASCII
+    candidates = (
+        Book.objects
+        .annotate(title_lower=Lower('title'))
+        .filter(Q(title_lower__in={title.lower() for title in titles}) | Q(title__in=titles))
+        .values_list('id', 'title', 'author__name')
+        .order_by('id')
+    )
+    by_title = {}
+    for book_id, title, author in candidates:
+        by_title.setdefault((title.lower(), author.lower()), book_id)
+        by_title.setdefault((title.lower(), ''), book_id)
+    for index in pending:
+        row = rows[index]
+        book_id = by_title.get((row['title'].lower(), row['author'].lower()))
+        if book_id is not None:
+            matches[index] = book_id
+    return matches
+
+
+class Importer:
+    def __init__(self, job):
+        self.job = job
+        self.user = job.user
+        self.shelf_ids = dict(Bookshelf.objects.filter(user=self.user).values_list('name', 'id'))
+        self.rated_books = set()
+        self.errors = []
+        self.counts = collections.Counter()
+
+    def error(self, line, message, row=None):
+        if len(self.errors) < MAX_ERRORS:
+            entry = {'row': line, 'error': message}
+            if row:
+                entry['title'] = row.get('title')
+            self.errors.append(entry)
+
+    def process(self, batch):
+        rows = []
+        for line, raw in batch:
+            try:
+                rows.append((line, clean_row(raw)))
+            except ImportFileError as e:
+                self.error(line, str(e))
+        matches = match_books([row for line, row in rows])
+
+        reviews = {}
+        memberships = set()
+        for index, (line, row) in enumerate(rows):
+            book_id = matches.get(index)
+            if book_id is None:
+                self.counts['unmatched'] += 1
+                self.error(line, "No matching book.", row)
+                continue
+            if row['rating']:
+                # The last row for a book wins
+                reviews[book_id] = row
+            for shelf in row['shelves']:
+                memberships.add((shelf, book_id))
+
+        with transaction.atomic():
+            self._upsert_reviews(reviews)
+            self._add_to_shelves(memberships)
+
+    def _upsert_reviews(self, reviews):
+        if not reviews:
+            return
+        existing = set(
+            Review.objects.filter(user=self.user, book_id__in=reviews).values_list('book_id', flat=True)
+        )
+        with_text, rating_only = [], []
+        for book_id, row in reviews.items():
+            review = Review(book_id=book_id, user=self.user, rating=row['rating'],
+                            title=row['review_title'], content=row['review'])
+            (with_text if row['review'] else rating_only).append(review)
+        # A row without text updates the rating but keeps an existing review text;
+        # titles are only set on new reviews
+        Review.objects.bulk_create(
+            with_text, update_conflicts=True, unique_fields=['book', 'user'],
+            update_fields=['rating', 'content', 'updated_at'],
+        )
+        Review.objects.bulk_create(
+            rating_only, update_conflicts=True, unique_fields=['book', 'user'],
+            update_fields=['rating', 'updated_at'],
+        )
+        created = set(reviews) - existing
+        rankings.record_activity(created, 'reviews')
+        review_ids = Review.objects.filter(user=self.user, book_id__in=reviews).values_list('id', flat=True)
+        sync.record([self.user.pk], 'reviews', review_ids)
+        self.rated_books.update(reviews)
+        self.counts['reviews_created'] += len(created)
+        self.counts['reviews_updated'] += len(reviews) - len(created)
+
+    def _add_to_shelves(self, memberships):
+        if not memberships:
+            return
+        missing = {shelf for shelf, book_id in memberships if shelf not in self.shelf_ids}
+        if missing:
+            created = Bookshelf.objects.bulk_create([Bookshelf(name=name, user=self.user) for name in sorted(missing)])
+            self.shelf_ids.update((shelf.name, shelf.id) for shelf in created)
+
+        Through = Bookshelf.books.through
+        pairs = {(self.shelf_ids[shelf], book_id) for shelf, book_id in memberships}
+        existing = set(
+            Through.objects
+            .filter(bookshelf_id__in={shelf_id for shelf_id, _ in pairs}, book_id__in={book_id for _, book_id in pairs})
+            .values_list('bookshelf_id', 'book_id')
+        )
+        new = pairs - existing
+        Through.objects.bulk_create(
+            [Through(bookshelf_id=shelf_id, book_id=book_id) for shelf_id, book_id in new],
+            ignore_conflicts=True,
+        )
+        # Group books by how many shelves they were added to, one UPDATE per group
+        added = collections.Counter(book_id for _, book_id in new)
+        by_amount = collections.defaultdict(list)
+        for book_id, amount in added.items():
+            by_amount[amount].append(book_id)
+        for amount, book_ids in by_amount.items():
+            rankings.record_activity(book_ids, 'shelvings', amount=amount)
+        sync.record([self.user.pk], 'bookshelves', {shelf_id for shelf_id, _ in new})
+        self.counts['shelved'] += len(new)
+
+    def save_progress(self, processed, **extra):
+        ImportJob.objects.filter(pk=self.job.pk).update(
+            processed_rows=processed,
+            reviews_created=self.counts['reviews_created'],
+            reviews_updated=self.counts['reviews_updated'],
+            shelved=self.counts['shelved'],
+            unmatched=self.counts['unmatched'],
+            errors=self.errors,
+            **extra,
+        )
+
+
+def run(import_id):
+    job = ImportJob.objects.select_related('user').get(pk=import_id)
+    importer = Importer(job)
+    batch_size = getattr(settings, 'IMPORT_BATCH_SIZE', 500)
+    processed = 0
+    status = 'DONE'
+    try:
+        with job.file.open('rb') as f:
+            total = sum(1 for _ in read_rows(f, job.format))
+        ImportJob.objects.filter(pk=job.pk).update(status='RUNNING', total_rows=total)
+
+        with job.file.open('rb') as f:
+            rows = enumerate(read_rows(f, job.format), start=1)
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                importer.process(batch)
+                processed += len(batch)
+                importer.save_progress(processed)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        status = 'FAILED'
+        importer.error(None, str(e))
+    except Exception:
+        logger.exception("Import %s failed", job.pk)
+        status = 'FAILED'
+        importer.error(None, "Internal error.")
+    # Batches that were written stay; their books still need fresh ratings
+    update_book_ratings(importer.rated_books)
+    # Bulk writes skip the signals that keep the user's statistics current
+    stats.rebuild([job.user_id])
+    importer.save_progress(processed, status=status, finished_at=timezone.now())
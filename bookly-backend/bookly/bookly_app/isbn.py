@@ -0,0 +1,40 @@
+"""
+ISBN normalization.
+
+Books are looked up by ``Book.isbn13``. It holds the canonical form of the
+ISBN: 13 digits, no hyphens, with ISBN-10s converted to their 978-prefixed
+ISBN-13. Input such as ``0-345-39180-2``, ``978-0-345-39180-3`` or Goodreads'
+``="9780345391803"`` therefore maps to the same indexed key.
+"""
+import re
+
+_NOISE = re.compile(r'[^0-9X]')
+
+
+def _isbn13_check_digit(first12):
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def _isbn10_is_valid(isbn10):
+    if not re.fullmatch(r'[0-9]{9}[0-9X]', isbn10):
+        return False
+    total = sum((10 - i) * (10 if char == 'X' else int(char)) for i, char in enumerate(isbn10))
+    return total % 11 == 0
+
+
+def to_isbn13(value):
+    """Returns the canonical ISBN-13 for ``value``, or ``None`` if it is not a valid ISBN."""
+    if value is None:
+        return None
+    digits = _NOISE.sub('', str(value).upper())
+    if len(digits) == 10:
+        if not _isbn10_is_valid(digits):
+            return None
+        first12 = '978' + digits[:9]
+        return first12 + _isbn13_check_digit(first12)
+    if len(digits) == 13 and digits.isdigit() and digits[:3] in ('978', '979'):
+        if _isbn13_check_digit(digits[:12]) != digits[12]:
+            return None
+        return digits
+    return None
@@ -0,0 +1,219 @@
+"""
+Database-backed background jobs.
+
+Functions registered with :func:`task` are queued as :class:`~bookly_app.models.Job`
+rows and executed by ``manage.py run_jobs``. Views should use
+:func:`enqueue_on_commit`, so that a job only becomes visible once the data it
+reads has been committed, and a rolled-back request leaves no job behind.
+
+Failed jobs are retried with exponential backoff until ``max_attempts`` is
+reached. A job that has an ``idempotency_key`` is queued at most once for that
+key. Tasks registered with ``unique_pending`` release the key when the job
+starts, so the key only merges copies still waiting to run and a call made
+during a run queues a fresh one. ``JOB_SCHEDULE`` lists periodic jobs. Every
+worker enqueues them, but one idempotency key per interval lets only one copy
+run. Finished jobs are deleted by the ``purge_finished_jobs`` task after
+``JOB_RETENTION_DAYS`` (``JOB_FAILED_RETENTION_DAYS`` for failed ones).
+
+While a job runs, its worker refreshes the job's ``locked_at`` every
+``JOB_HEARTBEAT_INTERVAL`` seconds (:func:`heartbeat`). A job whose worker has
+been silent for ``JOB_LOCK_TIMEOUT`` is taken to be lost. It is queued again
+if it has attempts left, and marked failed otherwise; the lost run counts as
+an attempt.
+
+A ``run_jobs`` worker is required: rating recomputes, cover processing,
+imports and the scheduled clean-ups only happen there. Setups without one
+(development, tests) set ``JOBS_RUN_INLINE``, and every job then runs right
+where it is enqueued (after the commit, for :func:`enqueue_on_commit`).
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+# Last JOB_SCHEDULE slot this process has queued, per entry
+_periodic_slots = {}
+
+
+class Task:
+    def __init__(self, func, name, max_attempts, unique_pending):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.unique_pending = unique_pending
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        return enqueue(self.name, *args, **kwargs)
+
+    def enqueue_on_commit(self, *args, **kwargs):
+        enqueue_on_commit(self.name, *args, **kwargs)
+
+
+def task(name=None, max_attempts=5, unique_pending=False):
+    """
+    Registers a function as a job. Arguments must be JSON-serializable. With
+    ``unique_pending``, idempotency keys are released once the job starts.
+    """
+    def decorator(func):
+        registered = Task(func, name or f'{func.__module__}.{func.__name__}', max_attempts, unique_pending)
+        _registry[registered.name] = registered
+        return registered
+    return decorator
+
+
+def get_task(name):
+    return _registry[name]
+
+
+def enqueue(name, *args, run_at=None, delay=None, idempotency_key=None, **kwargs):
+    """
+    Queues ``name(*args, **kwargs)``. Returns the new job or, when
+    ``idempotency_key`` was used before, the existing one. With
+    ``JOBS_RUN_INLINE`` the task runs right away and ``None`` is returned.
+    """
+    from .models import Job
+
+    if getattr(settings, 'JOBS_RUN_INLINE', False):
+        get_task(name)(*args, **kwargs)
+        return None
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+    job = Job(
+        task=name, args=list(args), kwargs=kwargs, run_at=run_at,
+        max_attempts=get_task(name).max_attempts, idempotency_key=idempotency_key,
+    )
+    if idempotency_key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return Job.objects.get(idempotency_key=idempotency_key)
+    return job
+
+
+def enqueue_on_commit(name, *args, **kwargs):
+    transaction.on_commit(lambda: enqueue(name, *args, **kwargs))
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number ``attempts``: exponential with jitter."""
+    base = getattr(settings, 'JOB_RETRY_BASE_DELAY', 10)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'JOB_RETRY_MAX_DELAY', 3600))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(worker, limit):
+    """Marks up to ``limit`` due jobs as running for ``worker`` and returns their ids."""
+    from .models import Job
+
+    now = timezone.now()
+    due = Job.objects.filter(status='QUEUED', run_at__lte=now).order_by('run_at', 'id')
+    running = dict(status='RUNNING', locked_by=worker, locked_at=now, attempts=F('attempts') + 1)
+
+    if connection.features.has_select_for_update_skip_locked:
+        # PostgreSQL: concurrent workers skip each other's rows instead of waiting
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(**running)
+        return ids
+
+    # Elsewhere (SQLite) a conditional UPDATE decides which worker gets a job
+    ids = []
+    for job_id in due.values_list('id', flat=True)[:limit * 2]:
+        if Job.objects.filter(id=job_id, status='QUEUED').update(**running):
+            ids.append(job_id)
+            if len(ids) == limit:
+                break
+    return ids
+
+
+def run(job_id):
+    """Executes a claimed job and records the outcome."""
+    from .models import Job
+
+    job = Job.objects.get(id=job_id)
+    task = get_task(job.task)
+    if job.idempotency_key and task.unique_pending:
+        # Calls from now on may change what this run reads, so they queue a new job
+        Job.objects.filter(id=job.id).update(idempotency_key=None)
+    try:
+        task(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            retry_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+            Job.objects.filter(id=job.id).update(status='QUEUED', run_at=retry_at, last_error=error)
+            logger.warning("Job %s failed (attempt %d), retrying at %s", job, job.attempts, retry_at)
+        else:
+            Job.objects.filter(id=job.id).update(status='FAILED', last_error=error, finished_at=timezone.now())
+            logger.error("Job %s failed permanently after %d attempts", job, job.attempts)
+        return False
+    Job.objects.filter(id=job.id).update(status='DONE', finished_at=timezone.now())
+    return True
+
+
+def heartbeat(worker):
+    """Marks the jobs ``worker`` is running as still alive."""
+    from .models import Job
+
+    return Job.objects.filter(status='RUNNING', locked_by=worker).update(locked_at=timezone.now())
+
+
+def requeue_stale(timeout=None):
+    """
+    Puts jobs back whose worker stopped sending heartbeats, or fails them when
+    the lost run was their last attempt. Returns the number requeued.
+    """
+    from .models import Job
+
+    timeout = timeout or getattr(settings, 'JOB_LOCK_TIMEOUT', 600)
+    now = timezone.now()
+    stale = Job.objects.filter(status='RUNNING', locked_at__lt=now - timedelta(seconds=timeout))
+    # claim() already counted the lost run as an attempt
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='FAILED', locked_by='', finished_at=now, last_error='The worker running this job was lost.',
+    )
+    if failed:
+        logger.error("%d jobs failed permanently after their worker was lost", failed)
+    return stale.update(status='QUEUED', locked_by='', run_at=now)
+
+
+def purge_finished(now=None):
+    """Deletes finished jobs past their retention; returns how many were deleted."""
+    from .models import Job
+
+    now = now or timezone.now()
+    done_cutoff = now - timedelta(days=getattr(settings, 'JOB_RETENTION_DAYS', 7))
+    failed_cutoff = now - timedelta(days=getattr(settings, 'JOB_FAILED_RETENTION_DAYS', 30))
+    # Periodic jobs' idempotency keys go with them; their slots are long past
+    deleted, _ = Job.objects.filter(
+        Q(status='DONE', finished_at__lt=done_cutoff) | Q(status='FAILED', finished_at__lt=failed_cutoff)
+    ).delete()
+    return deleted
+
+
+def enqueue_periodic(now=None):
+    """Queues the current run of every ``JOB_SCHEDULE`` entry that is due."""
+    now = now or timezone.now()
+    for name, entry in getattr(settings, 'JOB_SCHEDULE', {}).items():
+        every = entry['every']
+        slot = int(now.timestamp() // every)
+        if _periodic_slots.get(name) == slot:
+            continue
+        _periodic_slots[name] = slot
+        enqueue(entry['task'], *entry.get('args', ()), idempotency_key=f'periodic:{name}:{slot}',
+                **entry.get('kwargs', {}))
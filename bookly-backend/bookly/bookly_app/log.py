@@ -0,0 +1,139 @@
+"""
+Logging pipeline: JSON records tagged with a per-request correlation ID and
+written by a background thread, so request threads never wait on log I/O.
+"""
+import atexit
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from django.utils.module_loading import import_string
+
+REQUEST_ID_HEADER = 'HTTP_X_REQUEST_ID'
+
+request_id = contextvars.ContextVar('bookly_request_id', default='-')
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+
+class RequestIDMiddleware:
+    """Takes the caller's X-Request-ID (or makes one) and echoes it back."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        value = request.META.get(REQUEST_ID_HEADER, '')[:64] or uuid.uuid4().hex
+        request.request_id = value
+        token = request_id.set(value)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response['X-Request-ID'] = value
+        return response
+
+
+class RequestIDFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through only a fraction ``rate`` of records at or below ``level``."""
+
+    def __init__(self, rate=0.1, level='DEBUG'):
+        super().__init__()
+        self.rate = float(rate)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+    def filter(self, record):
+        return record.levelno > self.level or random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Hands records to a bounded in-memory queue drained by a ``QueueListener``
+    thread that formats them as JSON and writes them to ``target``. When the
+    queue is full the record is dropped rather than blocking the request, and
+    counted in ``bookly_log_records_dropped_total``.
+
+    The listener thread is started by the first record a process logs, not
+    when logging is configured: workers forked after the settings were loaded
+    (gunicorn ``--preload``) do not inherit the parent's thread, so each one
+    starts its own, with a fresh queue.
+    """
+
+    def __init__(self, target='logging.StreamHandler', queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = import_string(target)()
+        self.target.setFormatter(JSONFormatter())
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+        atexit.register(self._stop)
+
+    def _start(self):
+        # Called with the handler lock held (Handler.handle takes it)
+        if self._pid != os.getpid():
+            if self._pid is not None:
+                # Forked: whatever the parent had queued is its to write
+                self.queue = queue.Queue(maxsize=self.queue_size)
+            self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def _stop(self):
+        if self._pid == os.getpid():
+            self.listener.stop()
+            self._pid = None
+
+    def prepare(self, record):
+        # Interpolate the message here, while the arguments are still current,
+        # but leave the JSON encoding and the write to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            from bookly_app.metrics import LOG_RECORDS_DROPPED
+
+            self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
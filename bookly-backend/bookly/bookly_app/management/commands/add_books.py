@@ -1,8 +1,9 @@
 from django.core.management.base import BaseCommand
 from bookly_app.models import Book, Genre, Author
+from bookly_app import tasks
+from bookly_app.isbn import to_isbn13
 import datetime
 import os
-from django.core.files import File
 from django.conf import settings
 
 class Command(BaseCommand):
@@ -130,10 +131,10 @@ class Command(BaseCommand):
         for book_data in books_data:
             genres_list = book_data.pop('genres')
             cover_image = book_data.pop('cover_image', None)
-            book, created = Book.objects.get_or_create(
-                isbn=book_data['isbn'],
-                defaults=book_data
-            )
+            # Книги с некорректным ISBN не попадают в индекс isbn13, ищем их по исходной строке
+            isbn13 = to_isbn13(book_data['isbn'])
+            lookup = {'isbn13': isbn13} if isbn13 else {'isbn': book_data['isbn']}
+            book, created = Book.objects.get_or_create(**lookup, defaults=book_data)
             
             if created:
                 book.genres.set(genres_list)
@@ -142,9 +143,9 @@ class Command(BaseCommand):
                 if cover_image:
                     cover_path = os.path.join(covers_dir, cover_image)
                     if os.path.exists(cover_path):
-                        with open(cover_path, 'rb') as cover_file:
-                            book.cover_image.save(cover_image, File(cover_file), save=True)
-                        self.stdout.write(f'🖼️ Обложка для книги "{book.title}" установлена')
+                        # Копирование файла выполняет фоновый обработчик (manage.py run_jobs)
+                        tasks.attach_cover_file.enqueue(book.id, cover_path)
+                        self.stdout.write(f'🖼️ Обложка для книги "{book.title}" поставлена в очередь')
                     else:
                         self.stdout.write(self.style.WARNING(f'⚠️ Файл обложки не найден: {cover_path}'))
                 
@@ -0,0 +1,30 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from bookly_app import archive
+
+class Command(BaseCommand):
+    help = 'Moves finished exchanges and closed support tickets into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'ARCHIVE_AFTER_DAYS', 180),
+                            help='Archive records older than this many days')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'ARCHIVE_BATCH_SIZE', 1000),
+                            help='Rows moved per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        if options['dry_run']:
+            self.stdout.write(f'Offers: {archive.archivable_offers(cutoff).count()}')
+            self.stdout.write(f'Requests: {archive.archivable_requests(cutoff).count()}')
+            self.stdout.write(f'Tickets: {archive.archivable_tickets(cutoff).count()}')
+            return
+
+        moved = archive.archive_all(cutoff, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved['offers']} offer(s), {moved['requests']} request(s) and {moved['tickets']} ticket(s)"
+        ))
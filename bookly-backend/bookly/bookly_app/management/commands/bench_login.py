@@ -0,0 +1,49 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+from bookly_app import auth
+
+
+class Command(BaseCommand):
+    help = 'Measures password verifications (logins) per second and per core for each hasher'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashers', default='scrypt,pbkdf2_sha256',
+                            help='Comma-separated hasher algorithms to compare')
+        parser.add_argument('--logins', type=int, default=200,
+                            help='Verifications per hasher')
+        parser.add_argument('--concurrency', type=int, default=os.cpu_count() or 1,
+                            help='Simultaneous logins (request threads)')
+        parser.add_argument('--direct', action='store_true',
+                            help='Hash on the calling threads instead of through the hashing pool')
+
+    def handle(self, *args, **options):
+        logins = options['logins']
+        concurrency = options['concurrency']
+        pool = auth.get_pool()
+        cores = min(concurrency, os.cpu_count() or 1)
+        if not options['direct']:
+            cores = min(cores, pool.workers)
+        self.stdout.write(f'{logins} logins, {concurrency} concurrent, {cores} core(s) used')
+
+        for algorithm in options['hashers'].split(','):
+            encoded = make_password('correct horse battery staple', hasher=algorithm.strip())
+            if options['direct']:
+                verify = lambda _: check_password('correct horse battery staple', encoded)
+            else:
+                verify = lambda _: pool.run('verify', check_password, 'correct horse battery staple', encoded)
+
+            with ThreadPoolExecutor(concurrency) as clients:
+                start = time.perf_counter()
+                results = list(clients.map(verify, range(logins)))
+                elapsed = time.perf_counter() - start
+            assert all(results)
+
+            rate = logins / elapsed
+            self.stdout.write(
+                f'{algorithm:>16}: {rate:8.1f} logins/s  {rate / cores:8.1f} logins/s/core  '
+                f'{elapsed / logins * concurrency * 1000:7.1f} ms mean latency'
+            )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from bookly_app import cards
+
+class Command(BaseCommand):
+    help = 'Verifies the precomputed book cards against books, authors, genres and ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Rewrite missing and outdated cards')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Books checked per query')
+
+    def handle(self, *args, **options):
+        checked, missing, stale = cards.check(batch_size=options['batch_size'], fix=options['fix'])
+        summary = f'Checked {checked} card(s): {missing} missing, {stale} outdated'
+        if not (missing or stale):
+            self.stdout.write(self.style.SUCCESS(summary))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'{summary}, all rewritten'))
+        else:
+            # A non-zero exit lets monitoring alert on drift
+            raise CommandError(f'{summary}; run with --fix to rewrite them')
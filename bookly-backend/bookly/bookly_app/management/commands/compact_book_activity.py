@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from bookly_app import rankings
+
+class Command(BaseCommand):
+    help = 'Compacts the per-book activity rollup used by trending and popularity rankings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=rankings.TRENDING_MAX_DAYS,
+                            help='Daily rows newer than this are kept as is (at least the trending window)')
+        parser.add_argument('--max-age-days', type=int, default=730,
+                            help='Rows older than this are deleted')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute the rollup from reviews, shelves and offers first')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rows = rankings.rebuild()
+            self.stdout.write(f'Rebuilt activity rollup: {rows} rows')
+
+        folded, deleted = rankings.compact(
+            keep_days=options['keep_days'],
+            max_age_days=options['max_age_days'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Compacted {folded} month(s), deleted {deleted} expired row(s)'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from bookly_app import stats
+
+class Command(BaseCommand):
+    help = 'Recomputes the reading statistics of every user from shelves, reviews and exchanges'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Users rebuilt per round of queries')
+
+    def handle(self, *args, **options):
+        rebuilt = stats.rebuild_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt statistics of {rebuilt} user(s)'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from bookly_app import discussions
+
+class Command(BaseCommand):
+    help = 'Recomputes the comment count and last activity time of every discussion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Discussions checked per query')
+
+    def handle(self, *args, **options):
+        fixed = discussions.repair(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Repaired {fixed} discussion(s)'))
@@ -0,0 +1,104 @@
+import logging
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from bookly_app import jobs
+
+logger = logging.getLogger('bookly_app.jobs')
+
+
+def _run_in_thread(job_id):
+    try:
+        return jobs.run(job_id)
+    finally:
+        close_old_connections()
+
+
+def _init_process():
+    # Forked children must not share the parent's database connections
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Number of jobs run at the same time')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run jobs in threads (I/O-bound work) or processes (CPU-bound work)')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when no job is due')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no job is due instead of waiting for more')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        if options['pool'] == 'process':
+            connections.close_all()
+            pool = ProcessPoolExecutor(concurrency, initializer=_init_process)
+            submit = lambda job_id: pool.submit(jobs.run, job_id)
+        else:
+            pool = ThreadPoolExecutor(concurrency, thread_name_prefix='bookly-job')
+            submit = lambda job_id: pool.submit(_run_in_thread, job_id)
+
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f'Worker {worker} started ({options["pool"]} pool, {concurrency} slots)')
+        running = set()
+        done = failed = 0
+        heartbeat_interval = getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 60)
+        last_heartbeat = time.monotonic()
+        while not stopping:
+            if running and time.monotonic() - last_heartbeat >= heartbeat_interval:
+                # Long jobs stay ours; only a dead worker's jobs go stale
+                jobs.heartbeat(worker)
+                last_heartbeat = time.monotonic()
+            jobs.requeue_stale()
+            jobs.enqueue_periodic()
+            free = concurrency - len(running)
+            claimed = jobs.claim(worker, free) if free else []
+            running.update(submit(job_id) for job_id in claimed)
+
+            if not running:
+                if options['burst']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+            finished, running = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+            for future in finished:
+                if self._succeeded(future):
+                    done += 1
+                else:
+                    failed += 1
+
+        # Let the running jobs finish; unclaimed ones stay queued
+        for future in running:
+            if self._succeeded(future):
+                done += 1
+            else:
+                failed += 1
+        pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker} stopped: {done} done, {failed} failed'))
+
+    def _succeeded(self, future):
+        error = future.exception()
+        if error is not None:
+            # Job failures are handled by jobs.run; this is the worker itself failing,
+            # and the job is picked up again once its lock times out
+            logger.error("Worker could not run a job: %r", error)
+            return False
+        return future.result()
@@ -0,0 +1,203 @@
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.functional import cached_property
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+HASH_LENGTH = 12
+HASHED_NAME_RE = re.compile(r'\.([0-9a-f]{%d})\.[^./]+$' % HASH_LENGTH)
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    """
+    File storage that puts a hash of the content into every saved file name,
+    e.g. ``book_covers/dune.3f2a9c0d1b7e.jpg``. A name then always refers to the
+    same bytes, so it can be cached forever, and re-uploading an identical file
+    reuses the stored copy.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+
+        root, ext = os.path.splitext(name)
+        name = f'{root}.{digest.hexdigest()[:HASH_LENGTH]}{ext.lower()}'
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+class PrivateFileSystemStorage(FileSystemStorage):
+    """
+    Storage under ``PRIVATE_MEDIA_ROOT``. The location is read when first
+    used and again after the setting changes, as the default storage does
+    with ``MEDIA_ROOT``; a model field keeps its storage for good.
+    """
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.PRIVATE_MEDIA_ROOT)
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PRIVATE_MEDIA_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+
+_private_storage = PrivateFileSystemStorage()
+
+
+def private_storage():
+    """Storage for user files that must never be reachable under MEDIA_URL."""
+    return _private_storage
+
+
+class _FileRange:
+    """
+    Read-only view of ``length`` bytes of an open file starting at its current
+    position. It keeps ``fileno()`` so WSGI servers with ``wsgi.file_wrapper``
+    (gunicorn honours Content-Length) can still hand the range to sendfile().
+    """
+
+    def __init__(self, file, length):
+        self._file = file
+        self._remaining = length
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def _parse_range(header, size):
+    """Return ``(start, end)`` for a single satisfiable byte range, ``None`` to
+    ignore the header, or ``False`` when the range can't be satisfied."""
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        # Multiple or malformed ranges: serve the whole file
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _if_range_passes(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(last_modified) <= since
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serves a file from ``MEDIA_ROOT``.
+
+    ``MEDIA_SERVE_MODE`` selects how the bytes are sent: ``"x-accel"`` answers with
+    an ``X-Accel-Redirect`` to ``MEDIA_ACCEL_REDIRECT_PREFIX`` for nginx,
+    ``"x-sendfile"`` with ``X-Sendfile`` for Apache/lighttpd, and ``"python"`` (the
+    default) streams the file itself, supporting single byte ranges.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("File not found.")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found.")
+
+    hashed = HASHED_NAME_RE.search(path)
+    etag = quote_etag(hashed.group(1) if hashed else f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    content_type, encoding = mimetypes.guess_type(full_path)
+
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if hashed else (
+        f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)}"
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime), response=response)
+    if conditional is not response:
+        return conditional
+
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'python')
+    if mode == 'x-accel':
+        # nginx serves the bytes (and ranges) from an internal location
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        # Header values must be latin-1; nginx decodes the percent-escapes
+        response.headers['X-Accel-Redirect'] = quote(prefix + path)
+        return response
+    if mode == 'x-sendfile':
+        # mod_xsendfile unescapes the path (XSendFileUnescape, on by default)
+        response.headers['X-Sendfile'] = quote(full_path)
+        return response
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and _if_range_passes(request, etag, stat.st_mtime):
+        byte_range = _parse_range(request.META['HTTP_RANGE'], stat.st_size)
+    if byte_range is False:
+        response.status_code = 416
+        response.headers['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    start, end = byte_range or (0, stat.st_size - 1)
+    length = max(end - start + 1, 0)
+    if request.method != 'HEAD':
+        file = open(full_path, 'rb')
+        file.seek(start)
+        file_response = FileResponse(_FileRange(file, length))
+        for header, value in response.headers.items():
+            file_response.headers[header] = value
+        response = file_response
+    response.headers['Content-Length'] = str(length)
+    if byte_range:
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    return response
@@ -0,0 +1,173 @@
+"""
+Prometheus metrics for the API.
+
+With several worker processes, point ``PROMETHEUS_MULTIPROC_DIR`` at an empty
+directory before the workers start, and call :func:`child_exit` from the
+gunicorn ``child_exit`` hook. The ``/metrics`` view then merges the samples of
+all workers.
+
+Scrapers authenticate with ``Authorization: Bearer <METRICS_TOKEN>``, or come
+from an address in ``METRICS_ALLOWED_IPS``. Behind a reverse proxy on the same
+host every request arrives from 127.0.0.1, so use the token there; with
+neither configured ``/metrics`` answers 403 to everybody.
+"""
+import contextvars
+import os
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+REQUEST_LATENCY = Histogram(
+    'bookly_request_duration_seconds', 'Request latency',
+    ['view', 'action'], buckets=LATENCY_BUCKETS,
+)
+RESPONSES = Counter(
+    'bookly_responses_total', 'Responses by status code',
+    ['view', 'action', 'status'],
+)
+IN_FLIGHT = Gauge(
+    'bookly_requests_in_flight', 'Requests currently being processed',
+    multiprocess_mode='livesum',
+)
+DB_QUERIES = Histogram(
+    'bookly_db_queries_per_request', 'SQL queries executed per request',
+    ['view', 'action'], buckets=QUERY_COUNT_BUCKETS,
+)
+DB_TIME = Histogram(
+    'bookly_db_seconds_per_request', 'Time spent in SQL per request',
+    ['view', 'action'], buckets=LATENCY_BUCKETS,
+)
+# Everything the view does besides waiting on SQL, which for the API is mostly
+# serializing and rendering. Measured around the view so that every serializer
+# (and views that build their bodies by hand) is covered.
+VIEW_TIME = Histogram(
+    'bookly_view_python_seconds_per_request', 'Time spent in the view outside SQL (serialization, rendering) per request',
+    ['view', 'action'], buckets=LATENCY_BUCKETS,
+)
+# Hit ratio: rate(..{result="hit"}) / rate(..) per cache
+CACHE_LOOKUPS = Counter(
+    'bookly_cache_lookups_total', 'Cache lookups by outcome',
+    ['cache', 'result'],
+)
+THROTTLE_DECISIONS = Counter(
+    'bookly_throttle_decisions_total', 'Rate limit decisions by scope',
+    ['scope', 'result'],
+)
+LOAD_SHED = Counter(
+    'bookly_load_shed_total', 'Requests rejected by the concurrency limiter',
+)
+PASSWORD_HASH_TIME = Histogram(
+    'bookly_password_hash_seconds', 'Time spent hashing or verifying one password',
+    ['operation'], buckets=LATENCY_BUCKETS,
+)
+HASHING_REJECTED = Counter(
+    'bookly_password_hashing_rejected_total', 'Logins and registrations rejected because the hashing pool was full',
+)
+LOG_RECORDS_DROPPED = Counter(
+    'bookly_log_records_dropped_total', 'Log records dropped because the logging queue was full',
+)
+
+# Per-request accumulators, set up by MetricsMiddleware
+_request_stats = contextvars.ContextVar('bookly_request_stats', default=None)
+
+
+def record_cache_lookup(cache_name, hit):
+    CACHE_LOOKUPS.labels(cache_name, 'hit' if hit else 'miss').inc()
+
+
+def record_throttle_decision(scope, allowed):
+    THROTTLE_DECISIONS.labels(scope, 'allowed' if allowed else 'throttled').inc()
+
+
+def view_labels(view_func, method):
+    """``(view, action)`` labels for a resolved view, e.g. ``('BookViewSet', 'list')``."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown'), method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return view_class.__name__, actions.get(method.lower(), method.lower())
+
+
+class MetricsMiddleware:
+    """Records latency, status, SQL and view time for every request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = {'queries': 0, 'db_time': 0.0, 'view_start': None, 'view_db_time': 0.0}
+        token = _request_stats.set(stats)
+        request._metrics_labels = ('unresolved', request.method.lower())
+
+        def count_queries(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['queries'] += 1
+                stats['db_time'] += time.perf_counter() - start
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_queries):
+                response = self.get_response(request)
+        finally:
+            IN_FLIGHT.dec()
+            _request_stats.reset(token)
+
+        view, action = request._metrics_labels
+        REQUEST_LATENCY.labels(view, action).observe(time.perf_counter() - start)
+        RESPONSES.labels(view, action, str(response.status_code)).inc()
+        DB_QUERIES.labels(view, action).observe(stats['queries'])
+        DB_TIME.labels(view, action).observe(stats['db_time'])
+        if stats['view_start'] is not None:
+            # The response is rendered by now, so this includes rendering too
+            view_time = time.perf_counter() - stats['view_start']
+            view_sql_time = stats['db_time'] - stats['view_db_time']
+            VIEW_TIME.labels(view, action).observe(max(view_time - view_sql_time, 0.0))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_labels = view_labels(view_func, request.method)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats['view_start'] = time.perf_counter()
+            stats['view_db_time'] = stats['db_time']
+
+
+def _scrape_allowed(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if scheme.lower() == 'bearer' and constant_time_compare(credentials.strip(), token):
+            return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+
+
+def metrics_view(request):
+    if not _scrape_allowed(request):
+        return HttpResponseForbidden()
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def child_exit(server, worker):
+    """gunicorn hook: drop the live gauges of a worker that exited."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.20 on 2026-10-19 14:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookly_app', '0002_author_discussion_author_alter_book_author'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('reviews', models.PositiveIntegerField(default=0)),
+                ('shelvings', models.PositiveIntegerField(default=0)),
+                ('offers', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='bookly_app.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'book'], name='bookactivity_date_book_idx')],
+                'unique_together': {('book', 'date')},
+            },
+        ),
+    ]
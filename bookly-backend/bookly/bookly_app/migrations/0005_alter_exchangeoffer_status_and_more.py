@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-19 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookly_app', '0004_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exchangeoffer',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('ACCEPTED', 'Accepted'), ('REJECTED', 'Rejected'), ('COMPLETED', 'Completed')], db_index=True, default='PENDING', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='exchangerequest',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('ACCEPTED', 'Accepted'), ('REJECTED', 'Rejected'), ('COMPLETED', 'Completed')], db_index=True, default='PENDING', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='supportticket',
+            name='status',
+            field=models.CharField(choices=[('OPEN', 'Open'), ('IN_PROGRESS', 'In Progress'), ('CLOSED', 'Closed')], db_index=True, default='OPEN', max_length=15),
+        ),
+    ]
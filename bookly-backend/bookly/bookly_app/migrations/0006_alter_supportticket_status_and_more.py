@@ -0,0 +1,26 @@
+# Generated by Django 4.2.20 on 2026-10-19 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookly_app', '0005_alter_exchangeoffer_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='supportticket',
+            name='status',
+            field=models.CharField(choices=[('OPEN', 'Open'), ('IN_PROGRESS', 'In Progress'), ('CLOSED', 'Closed')], default='OPEN', max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='supportticket',
+            index=models.Index(fields=['status', 'created_at'], name='ticket_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketreply',
+            index=models.Index(fields=['ticket', 'created_at'], name='ticketreply_ticket_created_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.20 on 2026-10-19 14:29
+
+from django.db import migrations, models
+
+from bookly_app.isbn import to_isbn13
+
+
+def normalize_isbns(apps, schema_editor):
+    Book = apps.get_model('bookly_app', 'Book')
+    seen = set()
+    batch = []
+    for book in Book.objects.exclude(isbn='').only('id', 'isbn').order_by('id').iterator(chunk_size=2000):
+        isbn13 = to_isbn13(book.isbn)
+        if isbn13 is None:
+            continue
+        book.isbn = isbn13
+        # The oldest book keeps a duplicated ISBN; later copies stay unindexed
+        book.isbn13 = isbn13 if isbn13 not in seen else None
+        seen.add(isbn13)
+        batch.append(book)
+        if len(batch) == 2000:
+            Book.objects.bulk_update(batch, ['isbn', 'isbn13'])
+            batch = []
+    Book.objects.bulk_update(batch, ['isbn', 'isbn13'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookly_app', '0010_inboxstate_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='isbn13',
+            field=models.CharField(blank=True, editable=False, max_length=13, null=True),
+        ),
+        migrations.RunPython(normalize_isbns, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.UniqueConstraint(condition=models.Q(('isbn13__isnull', False)), fields=('isbn13',), name='book_isbn13_uniq'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.20 on 2026-10-19 14:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('bookly_app', '0011_book_isbn13'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('bookshelves', 'Bookshelf'), ('reviews', 'Review'), ('offers', 'Exchange offer'), ('requests', 'Exchange request'), ('tickets', 'Support ticket')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='syncchange_user_seq_idx'), models.Index(condition=models.Q(('deleted', True)), fields=['changed_at'], name='syncchange_tombstone_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='syncchange',
+            constraint=models.UniqueConstraint(fields=('user', 'kind', 'object_id'), name='syncchange_user_object_uniq'),
+        ),
+    ]
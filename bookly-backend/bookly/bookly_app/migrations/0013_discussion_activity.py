@@ -0,0 +1,57 @@
+# Generated by Django 4.2.20 on 2026-10-19 14:35
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+
+def backfill_counters(apps, schema_editor):
+    Discussion = apps.get_model('bookly_app', 'Discussion')
+    Comment = apps.get_model('bookly_app', 'Comment')
+    comments = Comment.objects.filter(discussion=models.OuterRef('pk')).order_by()
+    Discussion.objects.update(
+        comment_count=Coalesce(models.Subquery(
+            comments.values('discussion').annotate(n=models.Count('id')).values('n')
+        ), 0),
+        last_activity_at=Coalesce(models.Subquery(
+            comments.order_by('-created_at').values('created_at')[:1]
+        ), models.F('created_at')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookly_app', '0012_syncchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discussion',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='discussion',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['discussion', 'created_at'], name='comment_discussion_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='discussion',
+            index=models.Index(fields=['-last_activity_at', '-id'], name='discussion_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='discussion',
+            index=models.Index(fields=['book', '-last_activity_at', '-id'], name='discussion_book_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='discussion',
+            index=models.Index(fields=['author', '-last_activity_at', '-id'], name='discussion_author_activity_idx'),
+        ),
+        # After the comment index, which the backfill's subqueries use
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
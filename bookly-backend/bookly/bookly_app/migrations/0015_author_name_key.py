@@ -0,0 +1,41 @@
+# Generated by Django 4.2.20 on 2026-10-19 14:40
+
+from django.db import migrations, models
+
+from bookly_app.names import name_key
+
+
+def fill_name_keys(apps, schema_editor):
+    Author = apps.get_model('bookly_app', 'Author')
+    seen = set()
+    batch = []
+    for author in Author.objects.only('id', 'name').order_by('id').iterator(chunk_size=2000):
+        key = name_key(author.name)
+        # The oldest author keeps a duplicated name; later variants stay unindexed
+        author.name_key = key if key not in seen else None
+        seen.add(key)
+        batch.append(author)
+        if len(batch) == 2000:
+            Author.objects.bulk_update(batch, ['name_key'])
+            batch = []
+    Author.objects.bulk_update(batch, ['name_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookly_app', '0014_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='name_key',
+            field=models.CharField(blank=True, editable=False, max_length=200, null=True),
+        ),
+        migrations.RunPython(fill_name_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='author',
+            constraint=models.UniqueConstraint(condition=models.Q(('name_key__isnull', False)), fields=('name_key',), name='author_name_key_uniq'),
+        ),
+    ]
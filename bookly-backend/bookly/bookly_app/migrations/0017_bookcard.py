@@ -0,0 +1,52 @@
+# Generated by Django 4.2.20 on 2026-10-19 14:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from bookly_app.cards import render
+
+
+def build_cards(apps, schema_editor):
+    Book = apps.get_model('bookly_app', 'Book')
+    BookCard = apps.get_model('bookly_app', 'BookCard')
+    Genre = apps.get_model('bookly_app', 'Genre')
+    books = (
+        Book.objects.select_related('author')
+        .prefetch_related(models.Prefetch('genres', queryset=Genre.objects.order_by('name')))
+        .order_by('id')
+    )
+    batch = []
+    for book in books.iterator(chunk_size=500):
+        batch.append(BookCard(book_id=book.id, **render(
+            book.id, book.title, book.author_id, book.author.name, [genre.name for genre in book.genres.all()],
+            book.rating_avg, book.rating_count, book.cover_image.name,
+        )))
+        if len(batch) == 500:
+            BookCard.objects.bulk_create(batch)
+            batch = []
+    BookCard.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookly_app', '0016_userstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCard',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='bookly_app.book')),
+                ('title', models.CharField(max_length=200)),
+                ('author_name', models.CharField(max_length=200)),
+                ('genre_names', models.JSONField(blank=True, default=list)),
+                ('average_rating', models.FloatField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('cover_url', models.CharField(blank=True, max_length=255)),
+                ('data', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(build_cards, migrations.RunPython.noop),
+    ]
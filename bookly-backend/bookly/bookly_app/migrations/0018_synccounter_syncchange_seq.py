@@ -0,0 +1,55 @@
+# Generated by Django 4.2.20 on 2026-10-19 15:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Max
+import django.db.models.deletion
+
+
+def fill_sequences(apps, schema_editor):
+    # Existing tokens carry row ids, so the sequences continue from them
+    SyncChange = apps.get_model('bookly_app', 'SyncChange')
+    SyncCounter = apps.get_model('bookly_app', 'SyncCounter')
+    SyncChange.objects.update(seq=F('id'))
+    tops = SyncChange.objects.values_list('user_id').annotate(top=Max('id')).order_by()
+    SyncCounter.objects.bulk_create(
+        [SyncCounter(user_id=user_id, seq=top) for user_id, top in tops.iterator(chunk_size=2000)],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('bookly_app', '0017_bookcard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='syncchange',
+            name='syncchange_user_seq_idx',
+        ),
+        migrations.AddField(
+            model_name='syncchange',
+            name='seq',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunPython(fill_sequences, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='syncchange',
+            name='seq',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name='syncchange',
+            index=models.Index(fields=['user', 'seq'], name='syncchange_user_seq_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-19 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookly_app', '0018_synccounter_syncchange_seq'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('UPLOADING', 'Uploading'), ('WRITING', 'Writing a chunk'), ('COMPLETE', 'Complete'), ('FAILED', 'Failed')], default='UPLOADING', max_length=10),
+        ),
+    ]
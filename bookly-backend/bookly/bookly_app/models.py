@@ -1,6 +1,59 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+from .isbn import to_isbn13
+from .names import clean_name, name_key
+from .media import private_storage
+
+class AccessQuerySet(models.QuerySet):
+    """
+    Row-level access as a WHERE clause: ``visible_to(user)`` and
+    ``editable_by(user)`` only return rows the user may read or change, so
+    views never load (or check in Python) rows they must not show.
+    """
+    
+    def visible_to(self, user):
+        if user.is_staff and self.model.staff_access:
+            return self
+        return self.filter(self.model.visible_q(user))
+    
+    def editable_by(self, user):
+        if user.is_staff and self.model.staff_access:
+            return self
+        return self.filter(self.model.editable_q(user))
+
+class OwnedModel(models.Model):
+    """
+    Abstract base for models that belong to a user. ``owner_field`` names the
+    owning foreign key and is compared by id, without a join to User.
+    ``public`` rows are readable by everybody; staff see and change everything
+    unless ``staff_access`` is off. Models with other rules override
+    ``visible_q``/``editable_q``.
+    """
+    owner_field = 'user'
+    public = False
+    staff_access = True
+    
+    objects = AccessQuerySet.as_manager()
+    
+    class Meta:
+        abstract = True
+    
+    @classmethod
+    def owner_q(cls, user):
+        return models.Q(**{f'{cls.owner_field}_id': user.pk})
+    
+    @classmethod
+    def visible_q(cls, user):
+        return models.Q() if cls.public else cls.owner_q(user)
+    
+    @classmethod
+    def editable_q(cls, user):
+        return cls.owner_q(user)
 
 class Genre(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -10,35 +63,78 @@ class Genre(models.Model):
 
 class Author(models.Model):
     name = models.CharField(max_length=200, unique=True)
+    # Case- and whitespace-insensitive form of ``name``, the key for lookups
+    # (see authors.py); NULL only for duplicates that predate it
+    name_key = models.CharField(max_length=200, null=True, blank=True, editable=False)
     bio = models.TextField(blank=True)
     birth_date = models.DateField(null=True, blank=True)
     death_date = models.DateField(null=True, blank=True)
     photo = models.ImageField(upload_to='author_photos/', blank=True, null=True)
     
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name_key'], name='author_name_key_uniq',
+                                    condition=models.Q(name_key__isnull=False)),
+        ]
+    
     def __str__(self):
         return self.name
+    
+    def clean(self):
+        # name_key is not editable, so model validation skips its constraint
+        if Author.objects.filter(name_key=name_key(self.name)).exclude(pk=self.pk).exists():
+            raise ValidationError({'name': "An author with this name already exists."})
+    
+    def save(self, *args, **kwargs):
+        self.name = clean_name(self.name)
+        self.name_key = name_key(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_key'}
+        super().save(*args, **kwargs)
 
 class Book(models.Model):
     title = models.CharField(max_length=200)
     author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='books')
     description = models.TextField(blank=True)
     isbn = models.CharField(max_length=13, blank=True)
+    # Canonical ISBN-13 of ``isbn``, the key for lookups; NULL when missing or invalid
+    isbn13 = models.CharField(max_length=13, null=True, blank=True, editable=False)
     cover_image = models.ImageField(upload_to='book_covers/', blank=True, null=True)
     publication_date = models.DateField(null=True, blank=True)
     genres = models.ManyToManyField(Genre, related_name='books')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by the recompute_book_rating job whenever reviews change
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['isbn13'], name='book_isbn13_uniq',
+                                    condition=models.Q(isbn13__isnull=False)),
+        ]
     
     def __str__(self):
         return f"{self.title} by {self.author.name}"
     
+    def clean(self):
+        # isbn13 is not editable, so model validation skips its constraint
+        isbn13 = to_isbn13(self.isbn)
+        if isbn13 and Book.objects.filter(isbn13=isbn13).exclude(pk=self.pk).exists():
+            raise ValidationError({'isbn': "A book with this ISBN already exists."})
+    
+    def save(self, *args, **kwargs):
+        self.isbn13 = to_isbn13(self.isbn)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'isbn' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'isbn13'}
+        super().save(*args, **kwargs)
+    
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
-        return 0
+        return self.rating_avg
 
-class UserProfile(models.Model):
+class UserProfile(OwnedModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     full_name = models.CharField(max_length=200, blank=True)
     birth_date = models.DateField(null=True, blank=True)
@@ -47,16 +143,19 @@ class UserProfile(models.Model):
     def __str__(self):
         return self.user.username
 
-class Bookshelf(models.Model):
+class Bookshelf(OwnedModel):
     name = models.CharField(max_length=100)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookshelves')
     books = models.ManyToManyField(Book, related_name='bookshelves')
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Shelves are private, staff included
+    staff_access = False
+    
     def __str__(self):
         return f"{self.name} - {self.user.username}"
 
-class Review(models.Model):
+class Review(OwnedModel):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
     title = models.CharField(max_length=200)
@@ -65,13 +164,24 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    public = True
+    
     class Meta:
         unique_together = ('book', 'user')
     
     def __str__(self):
         return f"Review of {self.book.title} by {self.user.username}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The rating as loaded, so a changed rating moves between stats buckets
+        instance._loaded_rating = instance.__dict__.get('rating')
+        # The book as loaded, so a review moved to another book updates both
+        instance._loaded_book_id = instance.__dict__.get('book_id')
+        return instance
 
-class ExchangeOffer(models.Model):
+class ExchangeOffer(OwnedModel):
     STATUS_CHOICES = (
         ('PENDING', 'Pending'),
         ('ACCEPTED', 'Accepted'),
@@ -85,13 +195,16 @@ class ExchangeOffer(models.Model):
     exchange_type = models.CharField(max_length=10, choices=(('SELL', 'Sell'), ('EXCHANGE', 'Exchange')))
     price = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True)
     exchange_preferences = models.TextField(blank=True)
-    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    owner_field = 'owner'
+    public = True
+    
     def __str__(self):
         return f"{self.book.title} - {self.get_exchange_type_display()}"
 
-class ExchangeRequest(models.Model):
+class ExchangeRequest(OwnedModel):
     STATUS_CHOICES = (
         ('PENDING', 'Pending'),
         ('ACCEPTED', 'Accepted'),
@@ -102,34 +215,73 @@ class ExchangeRequest(models.Model):
     offer = models.ForeignKey(ExchangeOffer, on_delete=models.CASCADE, related_name='requests')
     requester = models.ForeignKey(User, on_delete=models.CASCADE, related_name='my_requests')
     message = models.TextField(blank=True)
-    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    owner_field = 'requester'
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The status as loaded, so stats count each completion once
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+    
+    @classmethod
+    def visible_q(cls, user):
+        # The requester, and the owner of the offer, who answers the request
+        return cls.owner_q(user) | models.Q(offer_id__in=ExchangeOffer.objects.filter(owner_id=user.pk).values('id'))
+    
+    @classmethod
+    def editable_q(cls, user):
+        return cls.visible_q(user)
+    
     def __str__(self):
         return f"Request for {self.offer.book.title} by {self.requester.username}"
 
-class Discussion(models.Model):
+class Discussion(OwnedModel):
     title = models.CharField(max_length=200)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='discussions')
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='discussions', null=True, blank=True)
     author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='discussions', null=True, blank=True)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by the comment signals (see discussions.py)
+    comment_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    
+    owner_field = 'created_by'
+    public = True
+    
+    class Meta:
+        indexes = [
+            # Most active first, overall and per book or author
+            models.Index(fields=['-last_activity_at', '-id'], name='discussion_activity_idx'),
+            models.Index(fields=['book', '-last_activity_at', '-id'], name='discussion_book_activity_idx'),
+            models.Index(fields=['author', '-last_activity_at', '-id'], name='discussion_author_activity_idx'),
+        ]
     
     def __str__(self):
         return self.title
 
-class Comment(models.Model):
+class Comment(OwnedModel):
     discussion = models.ForeignKey(Discussion, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     likes = models.ManyToManyField(User, related_name='liked_comments', blank=True)
     
+    public = True
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['discussion', 'created_at'], name='comment_discussion_created_idx'),
+        ]
+    
     def __str__(self):
         return f"Comment by {self.user.username}"
 
-class SupportTicket(models.Model):
+class SupportTicket(OwnedModel):
     STATUS_CHOICES = (
         ('OPEN', 'Open'),
         ('IN_PROGRESS', 'In Progress'),
@@ -142,14 +294,388 @@ class SupportTicket(models.Model):
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='OPEN')
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Staff triage queue: tickets by status, oldest first
+            models.Index(fields=['status', 'created_at'], name='ticket_status_created_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.subject} - {self.user.username}"
 
-class TicketReply(models.Model):
+class TicketReply(OwnedModel):
     ticket = models.ForeignKey(SupportTicket, on_delete=models.CASCADE, related_name='replies')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ticket_replies')
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    @classmethod
+    def visible_q(cls, user):
+        # The whole thread is visible to the ticket's owner; authors edit their own replies
+        return models.Q(ticket_id__in=SupportTicket.objects.filter(user_id=user.pk).values('id'))
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['ticket', 'created_at'], name='ticketreply_ticket_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Reply to {self.ticket.subject}"
+
+class BookActivity(models.Model):
+    # Daily per-book activity rollup, maintained incrementally by signals
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='activity')
+    date = models.DateField()
+    reviews = models.PositiveIntegerField(default=0)
+    shelvings = models.PositiveIntegerField(default=0)
+    offers = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('book', 'date')
+        indexes = [
+            models.Index(fields=['date', 'book'], name='bookactivity_date_book_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Activity of book {self.book_id} on {self.date}"
+
+class RequestProfile(models.Model):
+    # A profiled request captured by ProfilingMiddleware; the profile itself lives in PROFILING_DIR
+    MODE_CHOICES = (
+        ('sample', 'Sampling (folded stacks)'),
+        ('cprofile', 'Deterministic (cProfile)'),
+    )
+    
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='request_profiles')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    sql_time_ms = models.FloatField()
+    queries = models.JSONField(default=list)
+    profile_file = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+class Job(models.Model):
+    # A unit of deferred work, run by `manage.py run_jobs` (see jobs.py)
+    STATUS_CHOICES = (
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+    
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Workers poll for due jobs: status = QUEUED AND run_at <= now
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+class ImportJob(OwnedModel):
+    # A user's upload of ratings and shelves from another site (see imports.py)
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+    FORMAT_CHOICES = (
+        ('csv', 'CSV'),
+        ('json', 'JSON'),
+    )
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='imports')
+    file = models.FileField(upload_to='imports/', storage=private_storage)
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    reviews_created = models.PositiveIntegerField(default=0)
+    reviews_updated = models.PositiveIntegerField(default=0)
+    shelved = models.PositiveIntegerField(default=0)
+    unmatched = models.PositiveIntegerField(default=0)
+    # The first few problems, e.g. rows whose book couldn't be found
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Import #{self.pk} by {self.user.username} ({self.status})"
+
+# Archive tables: finished exchanges and closed tickets are moved here by
+# archive.py so the hot tables only hold live data. Rows keep their ids.
+
+class ArchivedExchangeOffer(OwnedModel):
+    id = models.BigIntegerField(primary_key=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='archived_offers')
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_offers')
+    condition = models.CharField(max_length=100)
+    exchange_type = models.CharField(max_length=10, choices=(('SELL', 'Sell'), ('EXCHANGE', 'Exchange')))
+    price = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True)
+    exchange_preferences = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=ExchangeOffer.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    owner_field = 'owner'
+    
+    def __str__(self):
+        return f"{self.book.title} - {self.get_exchange_type_display()} (archived)"
+
+class ArchivedExchangeRequest(OwnedModel):
+    id = models.BigIntegerField(primary_key=True)
+    # The offer may still be live or archived as well, so this is a plain id
+    offer_id = models.BigIntegerField(db_index=True)
+    requester = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_requests')
+    message = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=ExchangeRequest.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    owner_field = 'requester'
+    
+    @classmethod
+    def visible_q(cls, user):
+        # The offer can be live or archived
+        return (
+            cls.owner_q(user)
+            | models.Q(offer_id__in=ExchangeOffer.objects.filter(owner_id=user.pk).values('id'))
+            | models.Q(offer_id__in=ArchivedExchangeOffer.objects.filter(owner_id=user.pk).values('id'))
+        )
+    
+    def __str__(self):
+        return f"Request {self.id} for offer {self.offer_id} (archived)"
+
+class ArchivedSupportTicket(OwnedModel):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_tickets')
+    subject = models.CharField(max_length=200)
+    message = models.TextField()
+    status = models.CharField(max_length=15, choices=SupportTicket.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.subject} - {self.user.username} (archived)"
+
+class ArchivedTicketReply(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    ticket = models.ForeignKey(ArchivedSupportTicket, on_delete=models.CASCADE, related_name='replies')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_ticket_replies')
+    message = models.TextField()
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['ticket', 'created_at'], name='archreply_ticket_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Reply to {self.ticket.subject} (archived)"
+
+class Notification(models.Model):
+    # One inbox entry. Rows with a recipient are fanned out on write; rows
+    # without one are broadcasts about a popular book, read by everybody who
+    # has the book on a shelf (see notifications.py)
+    VERB_CHOICES = (
+        ('comment', 'New comment on your discussion'),
+        ('exchange_request', 'New request for your offer'),
+        ('ticket_reply', 'New reply to your ticket'),
+        ('review', 'New review of a book on your shelf'),
+    )
+    
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+    verb = models.CharField(max_length=20, choices=VERB_CHOICES)
+    object_id = models.BigIntegerField()
+    data = models.JSONField(default=dict, blank=True)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # Feed pages: WHERE recipient = ? AND id < ? ORDER BY id DESC
+            models.Index(fields=['recipient', '-id'], name='notification_recipient_id_idx'),
+            models.Index(fields=['book', '-id'], name='notification_book_id_idx',
+                         condition=models.Q(recipient__isnull=True)),
+        ]
+    
+    def __str__(self):
+        return f"{self.verb} #{self.object_id} for {self.recipient_id or 'book %s' % self.book_id}"
+
+class InboxState(models.Model):
+    # Per-user notification counters, so unread counts never COUNT(*) the inbox
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='inbox')
+    unread_count = models.PositiveIntegerField(default=0)
+    # Broadcast notifications up to this id count as read
+    broadcast_read_id = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Inbox of {self.user.username}: {self.unread_count} unread"
+
+class SyncChange(models.Model):
+    """
+    Change log for delta sync. There is one row per (user, object), replaced
+    on every change, so its ``seq`` is the object's latest sequence number
+    (see :class:`SyncCounter`). A deleted object leaves a tombstone row.
+    """
+    KIND_CHOICES = (
+        ('bookshelves', 'Bookshelf'),
+        ('reviews', 'Review'),
+        ('offers', 'Exchange offer'),
+        ('requests', 'Exchange request'),
+        ('tickets', 'Support ticket'),
+    )
+    
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    seq = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'object_id'], name='syncchange_user_object_uniq'),
+        ]
+        indexes = [
+            # Sync pages: WHERE user = ? AND seq > ? ORDER BY seq
+            models.Index(fields=['user', 'seq'], name='syncchange_user_seq_idx'),
+            models.Index(fields=['changed_at'], name='syncchange_tombstone_idx',
+                         condition=models.Q(deleted=True)),
+        ]
+    
+    def __str__(self):
+        return f"#{self.seq} {self.kind} {self.object_id}{' deleted' if self.deleted else ''} for user {self.user_id}"
+
+class SyncCounter(models.Model):
+    # The last sync sequence number handed out to the user. Its row stays
+    # locked until the writing transaction commits, so numbers are taken in
+    # commit order.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    seq = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Sync sequence {self.seq} for user {self.user_id}"
+
+class UploadSession(OwnedModel):
+    """
+    A chunked, resumable upload of a cover, author photo or profile picture
+    (see uploads.py). ``received`` bytes have been written to the temporary
+    file so far; the client resumes from there.
+    """
+    TARGET_CHOICES = (
+        ('book_cover', 'Book cover'),
+        ('author_photo', 'Author photo'),
+        ('profile_picture', 'Profile picture'),
+    )
+    STATUS_CHOICES = (
+        ('UPLOADING', 'Uploading'),
+        # A request holds the offset and is writing a chunk
+        ('WRITING', 'Writing a chunk'),
+        ('COMPLETE', 'Complete'),
+        ('FAILED', 'Failed'),
+    )
+    
+    # Random ids: the upload URL is not guessable
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    object_id = models.BigIntegerField()
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    # Detected from the first bytes, not taken from the client
+    content_type = models.CharField(max_length=50, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='UPLOADING')
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    # Uploads in progress are private, even from staff
+    staff_access = False
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Purging abandoned uploads: WHERE updated_at < ?
+            models.Index(fields=['updated_at'], name='uploadsession_updated_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Upload {self.id} of {self.target} #{self.object_id} ({self.received}/{self.size})"
+
+class UserStats(models.Model):
+    """
+    Read model of a user's reading statistics, kept current by signals (see
+    stats.py) so a profile page reads one row.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    # Distinct books on any of the user's shelves
+    books_shelved = models.PositiveIntegerField(default=0)
+    reviews_written = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    # The genres most common on the user's shelves: [{"id", "name", "count"}]
+    favourite_genres = models.JSONField(default=list, blank=True)
+    # Completed exchange requests, as requester or offer owner
+    exchanges_completed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'user stats'
+    
+    def __str__(self):
+        return f"Stats of {self.user.username}"
+
+class BookCard(models.Model):
+    """
+    Denormalized summary of a book as list views show it, with the response
+    JSON pre-rendered in ``data`` (see cards.py). Rewritten in the same
+    transaction as the book, author or genre change it depends on.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    title = models.CharField(max_length=200)
+    author_name = models.CharField(max_length=200)
+    genre_names = models.JSONField(default=list, blank=True)
+    average_rating = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    cover_url = models.CharField(max_length=255, blank=True)
+    data = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
     def __str__(self):
-        return f"Reply to {self.ticket.subject}"
\ No newline at end of file
+        return f"Card of {self.title}"
@@ -0,0 +1,18 @@
+"""
+Author name normalization.
+
+Authors are looked up by ``Author.name_key``: the name in Unicode NFKC form,
+case-folded, with runs of whitespace collapsed. ``Tolkien``, `` tolkien`` and
+``TOLKIEN`` therefore map to the same indexed key, and to one author.
+"""
+import unicodedata
+
+
+def clean_name(name):
+    """``name`` as it is stored: NFKC, trimmed, single spaces."""
+    return ' '.join(unicodedata.normalize('NFKC', str(name)).split())
+
+
+def name_key(name):
+    """The lookup key for ``name``; empty for a blank name."""
+    return clean_name(name).casefold()
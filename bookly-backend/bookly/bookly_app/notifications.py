@@ -0,0 +1,151 @@
+"""
+Per-user notification inboxes.
+
+Events are fanned out on write: each recipient gets a row, and the unread
+counter in :class:`~bookly_app.models.InboxState` goes up with one UPDATE per
+batch. A book that is on more than ``NOTIFICATION_FANOUT_LIMIT`` users' shelves
+would need too many rows for one review. For such a book, a single broadcast
+row with ``recipient=NULL`` is written instead, and feeds merge those rows in
+at read time (fan-out on read).
+"""
+import heapq
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.db.models.functions import Greatest
+
+from .models import Bookshelf, InboxState, Notification
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def _fanout_limit():
+    return getattr(settings, 'NOTIFICATION_FANOUT_LIMIT', 5000)
+
+
+def deliver(user_ids, verb, object_id, actor=None, book=None, data=None):
+    """Writes one notification per user in ``user_ids`` and bumps their unread counters."""
+    user_ids = {user_id for user_id in user_ids if user_id != getattr(actor, 'pk', actor)}
+    if not user_ids:
+        return 0
+    actor_id = getattr(actor, 'pk', actor)
+    book_id = getattr(book, 'pk', book)
+    with transaction.atomic():
+        Notification.objects.bulk_create([
+            Notification(recipient_id=user_id, actor_id=actor_id, book_id=book_id,
+                         verb=verb, object_id=object_id, data=data or {})
+            for user_id in user_ids
+        ])
+        _ensure_states(user_ids)
+        InboxState.objects.filter(user_id__in=user_ids).update(unread_count=F('unread_count') + 1)
+    return len(user_ids)
+
+
+def _ensure_states(user_ids):
+    # New inboxes start with every existing broadcast marked as read
+    watermark = Notification.objects.filter(recipient__isnull=True).aggregate(top=Max('id'))['top'] or 0
+    InboxState.objects.bulk_create(
+        [InboxState(user_id=user_id, broadcast_read_id=watermark) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+
+
+def get_state(user):
+    _ensure_states([user.pk])
+    return InboxState.objects.get(user=user)
+
+
+def shelved_book_ids(user):
+    return Bookshelf.books.through.objects.filter(bookshelf__user=user).values('book_id')
+
+
+def shelf_owner_ids(book_id):
+    return (
+        Bookshelf.books.through.objects
+        .filter(book_id=book_id)
+        .values_list('bookshelf__user_id', flat=True)
+        .distinct()
+    )
+
+
+def publish_review(review_id, book_id, actor_id, data):
+    """Notifies everybody with the book on a shelf, or broadcasts for a popular book."""
+    owners = shelf_owner_ids(book_id)
+    limit = _fanout_limit()
+    if len(owners[:limit + 1]) > limit:
+        Notification.objects.create(book_id=book_id, actor_id=actor_id, verb='review',
+                                    object_id=review_id, data=data)
+        return
+    batch = []
+    for user_id in owners.iterator(chunk_size=FANOUT_BATCH_SIZE):
+        batch.append(user_id)
+        if len(batch) == FANOUT_BATCH_SIZE:
+            _deliver_review(batch, review_id, actor_id, book_id, data)
+            batch = []
+    _deliver_review(batch, review_id, actor_id, book_id, data)
+
+
+def _deliver_review(user_ids, review_id, actor_id, book_id, data):
+    # A retried job skips the batches that were delivered before it failed
+    done = set(
+        Notification.objects
+        .filter(recipient_id__in=user_ids, verb='review', object_id=review_id)
+        .values_list('recipient_id', flat=True)
+    ) if user_ids else set()
+    deliver(set(user_ids) - done, 'review', review_id, actor=actor_id, book=book_id, data=data)
+
+
+def _broadcasts(user):
+    return Notification.objects.filter(recipient__isnull=True, book_id__in=shelved_book_ids(user)).exclude(actor=user)
+
+
+def unread_count(user):
+    state = get_state(user)
+    return state.unread_count + _broadcasts(user).filter(id__gt=state.broadcast_read_id).count()
+
+
+def feed(user, before=None, limit=20):
+    """
+    The newest ``limit`` notifications with ids below ``before``, as
+    ``(notifications, next_before)``. Personal rows and broadcasts come from
+    two index range scans that are merged here.
+    """
+    state = get_state(user)
+    personal = Notification.objects.filter(recipient=user)
+    broadcasts = _broadcasts(user)
+    if before is not None:
+        personal = personal.filter(id__lt=before)
+        broadcasts = broadcasts.filter(id__lt=before)
+    parts = [
+        part.select_related('actor').order_by('-id')[:limit + 1]
+        for part in (personal, broadcasts)
+    ]
+    items = list(heapq.merge(*parts, key=lambda n: -n.id))[:limit + 1]
+    for item in items:
+        if item.recipient_id is None:
+            item.is_read = item.id <= state.broadcast_read_id
+    has_more = len(items) > limit
+    items = items[:limit]
+    return items, (items[-1].id if has_more else None)
+
+
+def mark_read(user, ids=None):
+    """Marks ``ids`` (or everything when ``None``) as read; returns the number of rows changed."""
+    state = get_state(user)
+    personal = Notification.objects.filter(recipient=user, is_read=False)
+    broadcasts = _broadcasts(user).filter(id__gt=state.broadcast_read_id)
+    if ids is not None:
+        personal = personal.filter(id__in=ids)
+        broadcasts = broadcasts.filter(id__in=ids)
+    with transaction.atomic():
+        changed = personal.update(is_read=True)
+        # Broadcasts are read up to a watermark, so marking one marks the older ones too
+        top = broadcasts.aggregate(top=Max('id'))['top']
+        InboxState.objects.filter(user=user).update(
+            unread_count=Greatest(F('unread_count') - changed, 0),
+            broadcast_read_id=Greatest(F('broadcast_read_id'), top or 0),
+        )
+    if top is not None:
+        changed += _broadcasts(user).filter(id__gt=state.broadcast_read_id, id__lte=top).count()
+    return changed
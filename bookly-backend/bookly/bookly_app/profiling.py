@@ -0,0 +1,172 @@
+"""
+On-demand profiling of single requests.
+
+Staff can add ``X-Profile: 1`` (or ``?profile=1``) to a request; ``sample`` or
+``cprofile`` instead of ``1`` picks the profiler. A fraction
+``PROFILING_SAMPLE_RATE`` of those requests is profiled together with its SQL, and
+the result is stored as a :class:`~bookly_app.models.RequestProfile`. Sampling
+profiles are written in the folded-stack format read by ``flamegraph.pl`` and
+speedscope; cProfile profiles are ``pstats`` dumps for snakeviz or flameprof.
+"""
+import cProfile
+import collections
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+TRIGGER_HEADER = 'HTTP_X_PROFILE'
+TRIGGER_PARAM = 'profile'
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='bookly-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def _requested_mode(request):
+    value = request.META.get(TRIGGER_HEADER)
+    if not value and TRIGGER_PARAM in request.META.get('QUERY_STRING', ''):
+        value = request.GET.get(TRIGGER_PARAM)
+    if not value:
+        return None
+    if value in ('sample', 'cprofile'):
+        return value
+    return getattr(settings, 'PROFILING_MODE', 'sample')
+
+
+def _staff_user(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user if user.is_staff else None
+    # API clients authenticate with JWT inside the view, so check the token here
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except Exception:
+        return None
+    if result is not None and result[0].is_staff:
+        return result[0]
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    Must come after AuthenticationMiddleware. Requests without the trigger pay
+    for one header and one query-string lookup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = _requested_mode(request) if getattr(settings, 'PROFILING_ENABLED', False) else None
+        if mode is None:
+            return self.get_response(request)
+        if random.random() >= getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0):
+            return self.get_response(request)
+        user = _staff_user(request)
+        if user is None:
+            return self.get_response(request)
+        return self._profile(request, user, mode)
+
+    def _profile(self, request, user, mode):
+        max_queries = getattr(settings, 'PROFILING_MAX_QUERIES', 500)
+        queries = []
+        query_count = 0
+        sql_time = 0.0
+
+        def capture_sql(execute, sql, params, many, context):
+            nonlocal query_count, sql_time
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                elapsed = time.perf_counter() - start
+                query_count += 1
+                sql_time += elapsed
+                if len(queries) < max_queries:
+                    queries.append({'sql': sql, 'time_ms': round(elapsed * 1000, 3)})
+
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            start_profiler, stop_profiler = profiler.enable, profiler.disable
+        else:
+            profiler = SamplingProfiler(getattr(settings, 'PROFILING_INTERVAL', 0.001))
+            start_profiler, stop_profiler = profiler.start, profiler.stop
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(capture_sql):
+            start_profiler()
+            try:
+                response = self.get_response(request)
+            finally:
+                stop_profiler()
+        duration = time.perf_counter() - start
+
+        try:
+            self._save(request, user, mode, profiler, response, duration, queries, query_count, sql_time)
+        except Exception:
+            logger.exception("Could not store profile for %s %s", request.method, request.path)
+        return response
+
+    def _save(self, request, user, mode, profiler, response, duration, queries, query_count, sql_time):
+        from .models import RequestProfile
+
+        directory = settings.PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+        filename = f"{uuid.uuid4().hex}.{'prof' if mode == 'cprofile' else 'folded'}"
+        if mode == 'cprofile':
+            profiler.dump_stats(os.path.join(directory, filename))
+        else:
+            profiler.write(os.path.join(directory, filename))
+
+        RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            mode=mode,
+            status_code=response.status_code,
+            duration_ms=duration * 1000,
+            query_count=query_count,
+            sql_time_ms=sql_time * 1000,
+            queries=queries,
+            profile_file=filename,
+        )
@@ -0,0 +1,161 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import BookActivity, Bookshelf, ExchangeOffer, Review
+
+# Relative weight of each kind of activity in the trending score
+ACTIVITY_WEIGHTS = {
+    'reviews': 3.0,
+    'shelvings': 1.0,
+    'offers': 2.0,
+}
+ACTIVITY_FIELDS = tuple(ACTIVITY_WEIGHTS)
+
+# Longest trending window. Trending weights every row by its own date, so
+# compact() never folds rows this recent into a month: a month's total dated
+# day 1 would be scored as a single day.
+TRENDING_MAX_DAYS = 90
+
+
+def record_activity(book_ids, field, amount=1):
+    """Add ``amount`` to today's ``field`` counter for every book in ``book_ids``."""
+    if field not in ACTIVITY_FIELDS:
+        raise ValueError(f"Unknown activity field: {field}")
+    book_ids = set(book_ids)
+    if not book_ids:
+        return
+    today = timezone.localdate()
+    with transaction.atomic():
+        # Make sure today's rows exist, then bump them with a single UPDATE so
+        # concurrent writers never lose increments
+        BookActivity.objects.bulk_create(
+            [BookActivity(book_id=book_id, date=today) for book_id in book_ids],
+            ignore_conflicts=True,
+        )
+        BookActivity.objects.filter(book_id__in=book_ids, date=today).update(
+            **{field: F(field) + amount}
+        )
+
+
+def _window(days, genre=None):
+    today = timezone.localdate()
+    rows = BookActivity.objects.filter(date__gt=today - datetime.timedelta(days=days))
+    if genre:
+        rows = rows.filter(book__genres=genre)
+    return today, rows
+
+
+def trending(days=7, half_life=2.0, genre=None):
+    """
+    Books ordered by time-decayed activity over the last ``days`` days.
+
+    Every day's counts are weighted by ``0.5 ** (age / half_life)``; the weights are
+    computed here and inlined as a CASE so the query only touches the rollup.
+    """
+    today, rows = _window(days, genre)
+    weighted = sum(
+        (F(field) * weight for field, weight in ACTIVITY_WEIGHTS.items()),
+        Value(0),
+    )
+    decay = Case(
+        *[
+            When(date=today - datetime.timedelta(days=age), then=Value(0.5 ** (age / half_life)))
+            for age in range(days)
+        ],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    score = Sum(ExpressionWrapper(weighted * decay, output_field=FloatField()))
+    return (
+        rows.values('book')
+        .annotate(score=score)
+        .filter(score__gt=0)
+        .order_by('-score', 'book')
+    )
+
+
+def most_reviewed(days=30, genre=None):
+    """Books ordered by the number of reviews written in the last ``days`` days."""
+    _, rows = _window(days, genre)
+    return (
+        rows.values('book')
+        .annotate(score=Sum('reviews'))
+        .filter(score__gt=0)
+        .order_by('-score', 'book')
+    )
+
+
+def compact(keep_days=TRENDING_MAX_DAYS, max_age_days=730):
+    """
+    Fold daily rows older than ``keep_days`` into one row per book and month and
+    drop rows older than ``max_age_days``. Returns ``(folded_months, deleted_rows)``.
+    ``keep_days`` is raised to ``TRENDING_MAX_DAYS`` if it is shorter.
+    """
+    keep_days = max(keep_days, TRENDING_MAX_DAYS)
+    today = timezone.localdate()
+    cutoff = today - datetime.timedelta(days=keep_days)
+    deleted, _ = BookActivity.objects.filter(
+        date__lt=today - datetime.timedelta(days=max_age_days)
+    ).delete()
+
+    # Months that still hold daily rows; already compacted months only have day 1
+    months = (
+        BookActivity.objects.filter(date__lt=cutoff)
+        .exclude(date__day=1)
+        .dates('date', 'month')
+    )
+    folded = 0
+    for month in months:
+        next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+        with transaction.atomic():
+            month_rows = BookActivity.objects.select_for_update().filter(
+                date__gte=month, date__lt=min(next_month, cutoff)
+            )
+            totals = list(
+                month_rows.values('book').annotate(
+                    **{f'total_{field}': Sum(field) for field in ACTIVITY_FIELDS}
+                )
+            )
+            month_rows.delete()
+            BookActivity.objects.bulk_create([
+                BookActivity(
+                    book_id=row['book'],
+                    date=month,
+                    **{field: row[f'total_{field}'] for field in ACTIVITY_FIELDS},
+                )
+                for row in totals
+            ])
+        folded += 1
+    return folded, deleted
+
+
+def rebuild():
+    """Recreate the rollup from the raw tables, e.g. after deploying it on existing data."""
+    sources = (
+        ('reviews', Review.objects.values(book_ref=F('book_id'), day=TruncDate('created_at'))),
+        ('offers', ExchangeOffer.objects.values(book_ref=F('book_id'), day=TruncDate('created_at'))),
+        # Shelf memberships carry no timestamp, so date them by the shelf itself
+        ('shelvings', Bookshelf.books.through.objects.values(
+            book_ref=F('book_id'), day=TruncDate('bookshelf__created_at'),
+        )),
+    )
+    counts = {}
+    for field, rows in sources:
+        for row in rows.annotate(total=Count('*')):
+            key = (row['book_ref'], row['day'])
+            counts.setdefault(key, dict.fromkeys(ACTIVITY_FIELDS, 0))[field] = row['total']
+
+    with transaction.atomic():
+        BookActivity.objects.all().delete()
+        BookActivity.objects.bulk_create(
+            [
+                BookActivity(book_id=book_id, date=day, **values)
+                for (book_id, day), values in counts.items()
+            ],
+            batch_size=1000,
+        )
+    return len(counts)
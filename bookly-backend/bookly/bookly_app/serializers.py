@@ -1,29 +1,71 @@
+import logging
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
 from .models import (
     Book, Genre, Author, UserProfile, Bookshelf, Review, 
     ExchangeOffer, ExchangeRequest, Discussion, 
-    Comment, SupportTicket, TicketReply
+    Comment, SupportTicket, TicketReply, ImportJob,
+    ArchivedExchangeOffer, ArchivedExchangeRequest, ArchivedSupportTicket, ArchivedTicketReply,
+    Notification, UploadSession, UserStats
 )
+from . import auth, authors
+from .isbn import to_isbn13
+from .names import clean_name, name_key
+from .fieldsets import DynamicFieldsMixin
 
-class AuthorSerializer(serializers.ModelSerializer):
+logger = logging.getLogger(__name__)
+
+class AuthorSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Author
         fields = ['id', 'name', 'bio', 'birth_date', 'death_date', 'photo']
+    
+    def validate_name(self, value):
+        # Names differing only in case or spacing are the same author
+        others = Author.objects.filter(name_key=name_key(value))
+        if self.instance:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError("An author with this name already exists.")
+        return clean_name(value)
 
-class GenreSerializer(serializers.ModelSerializer):
+class GenreSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Genre
         fields = ['id', 'name']
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.name', read_only=True)
     genres = GenreSerializer(many=True, read_only=True)
+    # Accepts hyphenated ISBN-10/13 input; stored as the canonical ISBN-13
+    isbn = serializers.CharField(max_length=32, required=False, allow_blank=True)
     
     class Meta:
         model = Book
         fields = ['id', 'title', 'author', 'author_name', 'description', 'isbn', 
                   'cover_image', 'publication_date', 'genres', 'average_rating']
+        expandable_fields = {'author': ('AuthorSerializer', {})}
+        query_hints = {'average_rating': {'only': ['rating_avg']}}
+    
+    def validate_isbn(self, value):
+        if not value:
+            return value
+        isbn13 = to_isbn13(value)
+        if isbn13 is None:
+            raise serializers.ValidationError("Enter a valid ISBN-10 or ISBN-13.")
+        return isbn13
+    
+    def validate(self, attrs):
+        isbn = attrs.get('isbn', self.instance.isbn if self.instance else '')
+        isbn13 = to_isbn13(isbn)
+        if isbn13:
+            others = Book.objects.filter(isbn13=isbn13)
+            if self.instance:
+                others = others.exclude(pk=self.instance.pk)
+            if others.exists():
+                raise serializers.ValidationError({"isbn": ["A book with this ISBN already exists."]})
+        return attrs
     
     def create(self, validated_data):
         # Get the author data from validated_data
@@ -32,8 +74,7 @@ class BookSerializer(serializers.ModelSerializer):
         # If author_id is a string (name), try to find or create the author
         if isinstance(author_id, str):
             try:
-                author, created = Author.objects.get_or_create(name=author_id)
-                validated_data['author'] = author
+                validated_data['author_id'] = authors.resolve(validated_data.pop('author'))
             except Exception as e:
                 raise serializers.ValidationError(f"Error with author: {str(e)}")
                 
@@ -67,8 +108,7 @@ class BookSerializer(serializers.ModelSerializer):
         if author_id:
             try:
                 if isinstance(author_id, str):
-                    author, created = Author.objects.get_or_create(name=author_id)
-                    instance.author = author
+                    instance.author_id = authors.resolve(author_id)
                 elif isinstance(author_id, int):
                     author = Author.objects.get(id=author_id)
                     instance.author = author
@@ -91,14 +131,14 @@ class BookSerializer(serializers.ModelSerializer):
         return instance
 
 # Create a simplified BookSerializer for use in nested relationships
-class SimpleBookSerializer(serializers.ModelSerializer):
+class SimpleBookSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.name', read_only=True)
     
     class Meta:
         model = Book
         fields = ['id', 'title', 'author_name', 'cover_image']
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     
     class Meta:
@@ -107,16 +147,24 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
     
     def create(self, validated_data):
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password'],
+        user = User(
+            username=User.normalize_username(validated_data['username']),
+            email=User.objects.normalize_email(validated_data['email']),
             first_name=validated_data.get('first_name', ''),
             last_name=validated_data.get('last_name', '')
         )
+        # Hash in the bounded pool rather than on the request thread
+        user.password = auth.hash_password(validated_data['password'])
+        user.save()
         return user
 
-class UserProfileSerializer(serializers.ModelSerializer):
+# Public part of a user, used when expanding relations to other users
+class PublicUserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username')
+
+class UserProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     email = serializers.EmailField(source='user.email', read_only=True)
     
@@ -124,7 +172,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         model = UserProfile
         fields = ('id', 'username', 'email', 'full_name', 'birth_date', 'profile_picture')
 
-class BookshelfSerializer(serializers.ModelSerializer):
+class BookshelfSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     # Use the SimpleBookSerializer for listing books in a bookshelf to reduce payload size
     books = SimpleBookSerializer(many=True, read_only=True)
     
@@ -139,6 +187,21 @@ class BookshelfSerializer(serializers.ModelSerializer):
         bookshelf = Bookshelf.objects.create(user=user, **validated_data)
         return bookshelf
 
+# Summary of a bookshelf without its contents, used by the Bookshelves overview
+class BookshelfSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    book_count = serializers.IntegerField(read_only=True)
+    covers = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Bookshelf
+        fields = ['id', 'name', 'user', 'book_count', 'covers', 'created_at']
+        read_only_fields = ['user']
+        query_hints = {'book_count': {}, 'covers': {}}
+    
+    def get_covers(self, obj):
+        # Filled in by BookshelfViewSet.list with a single windowed query
+        return getattr(obj, 'cover_previews', [])
+
 # This is critical for updating the books in a bookshelf
 class BookshelfBooksUpdateSerializer(serializers.ModelSerializer):
     books = serializers.PrimaryKeyRelatedField(
@@ -155,20 +218,21 @@ class BookshelfBooksUpdateSerializer(serializers.ModelSerializer):
         # Replace the books in the bookshelf with the provided list
         if 'books' in validated_data:
             # Log for debugging
-            print(f"Updating books for bookshelf {instance.id}. Books: {validated_data['books']}")
+            logger.debug("Updating books for bookshelf %s. Books: %s", instance.id, validated_data['books'])
             instance.books.set(validated_data['books'])
         
         instance.save()
         return instance
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     
     class Meta:
         model = Review
         fields = ('id', 'book', 'user', 'username', 'title', 'content', 'rating', 'created_at', 'updated_at')
+        expandable_fields = {'book': ('SimpleBookSerializer', {})}
 
-class ExchangeOfferSerializer(serializers.ModelSerializer):
+class ExchangeOfferSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     book_title = serializers.CharField(source='book.title', read_only=True)
     owner_username = serializers.CharField(source='owner.username', read_only=True)
     
@@ -176,8 +240,9 @@ class ExchangeOfferSerializer(serializers.ModelSerializer):
         model = ExchangeOffer
         fields = ('id', 'book', 'book_title', 'owner', 'owner_username', 'condition', 
                   'exchange_type', 'price', 'exchange_preferences', 'status', 'created_at')
+        expandable_fields = {'book': ('SimpleBookSerializer', {})}
 
-class ExchangeRequestSerializer(serializers.ModelSerializer):
+class ExchangeRequestSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     book_title = serializers.CharField(source='offer.book.title', read_only=True)
     requester_username = serializers.CharField(source='requester.username', read_only=True)
     
@@ -185,8 +250,9 @@ class ExchangeRequestSerializer(serializers.ModelSerializer):
         model = ExchangeRequest
         fields = ('id', 'offer', 'book_title', 'requester', 'requester_username', 
                   'message', 'status', 'created_at')
+        expandable_fields = {'offer': ('ExchangeOfferSerializer', {})}
 
-class DiscussionSerializer(serializers.ModelSerializer):
+class DiscussionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     book_id = serializers.IntegerField(source='book.id', read_only=True)
     book_title = serializers.CharField(source='book.title', read_only=True)
     author_id = serializers.IntegerField(source='author.id', read_only=True)  # Добавляем
@@ -198,30 +264,144 @@ class DiscussionSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'title', 'created_by', 'creator_username',
             'book_id', 'book_title', 'author_id', 'author_name',
-            'content', 'created_at'
+            'content', 'created_at', 'comment_count', 'last_activity_at'
         )
+        read_only_fields = ('comment_count', 'last_activity_at')
+        expandable_fields = {
+            'book': ('SimpleBookSerializer', {}),
+            'author': ('AuthorSerializer', {}),
+            'created_by': ('PublicUserSerializer', {}),
+        }
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     likes_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Comment
         fields = ('id', 'discussion', 'user', 'username', 'content', 'created_at', 'likes_count')
+        query_hints = {'likes_count': {'prefetch': ['likes']}}
     
     def get_likes_count(self, obj):
         return obj.likes.count()
 
-class SupportTicketSerializer(serializers.ModelSerializer):
+class SupportTicketSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     
     class Meta:
         model = SupportTicket
         fields = ('id', 'user', 'username', 'subject', 'message', 'status', 'created_at')
 
-class TicketReplySerializer(serializers.ModelSerializer):
+# Ticket row of the staff triage queue, with annotated reply statistics
+class SupportTicketQueueSerializer(SupportTicketSerializer):
+    reply_count = serializers.IntegerField(read_only=True)
+    last_reply_at = serializers.DateTimeField(read_only=True)
+    last_reply_from_staff = serializers.BooleanField(read_only=True, allow_null=True)
+    last_activity_at = serializers.DateTimeField(read_only=True)
+    
+    class Meta(SupportTicketSerializer.Meta):
+        fields = SupportTicketSerializer.Meta.fields + (
+            'reply_count', 'last_reply_at', 'last_reply_from_staff', 'last_activity_at'
+        )
+
+class TicketReplySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     
     class Meta:
         model = TicketReply
-        fields = ('id', 'ticket', 'user', 'username', 'message', 'created_at')
\ No newline at end of file
+        fields = ('id', 'ticket', 'user', 'username', 'message', 'created_at')
+        expandable_fields = {'ticket': ('SupportTicketSerializer', {})}
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    format = serializers.ChoiceField(choices=ImportJob.FORMAT_CHOICES, required=False)
+    progress = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'file', 'format', 'status', 'total_rows', 'processed_rows', 'progress',
+                  'reviews_created', 'reviews_updated', 'shelved', 'unmatched', 'errors',
+                  'created_at', 'finished_at')
+        read_only_fields = ('status', 'total_rows', 'processed_rows', 'reviews_created', 'reviews_updated',
+                            'shelved', 'unmatched', 'errors', 'created_at', 'finished_at')
+        extra_kwargs = {'file': {'write_only': True}}
+    
+    def get_progress(self, obj):
+        # Percentage of rows processed
+        if obj.status == 'DONE':
+            return 100
+        if not obj.total_rows:
+            return 0
+        return int(obj.processed_rows * 100 / obj.total_rows)
+
+# Read-only views of the archive tables (see archive.py)
+class ArchivedExchangeOfferSerializer(serializers.ModelSerializer):
+    book_title = serializers.CharField(source='book.title', read_only=True)
+    owner_username = serializers.CharField(source='owner.username', read_only=True)
+    
+    class Meta:
+        model = ArchivedExchangeOffer
+        fields = ('id', 'book', 'book_title', 'owner', 'owner_username', 'condition',
+                  'exchange_type', 'price', 'exchange_preferences', 'status', 'created_at', 'archived_at')
+
+class ArchivedExchangeRequestSerializer(serializers.ModelSerializer):
+    offer = serializers.IntegerField(source='offer_id', read_only=True)
+    requester_username = serializers.CharField(source='requester.username', read_only=True)
+    
+    class Meta:
+        model = ArchivedExchangeRequest
+        fields = ('id', 'offer', 'requester', 'requester_username', 'message', 'status', 'created_at', 'archived_at')
+
+class ArchivedTicketReplySerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+    
+    class Meta:
+        model = ArchivedTicketReply
+        fields = ('id', 'user', 'username', 'message', 'created_at')
+
+class ArchivedSupportTicketSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+    replies = ArchivedTicketReplySerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = ArchivedSupportTicket
+        fields = ('id', 'user', 'username', 'subject', 'message', 'status', 'created_at', 'archived_at', 'replies')
+
+class NotificationSerializer(serializers.ModelSerializer):
+    actor_username = serializers.CharField(source='actor.username', read_only=True, default=None)
+    
+    class Meta:
+        model = Notification
+        fields = ('id', 'verb', 'object_id', 'book', 'actor', 'actor_username', 'data', 'is_read', 'created_at')
+
+class ISBNLookupSerializer(serializers.Serializer):
+    isbns = serializers.ListField(child=serializers.CharField(max_length=32), allow_empty=False)
+    
+    def validate_isbns(self, value):
+        limit = getattr(settings, 'ISBN_LOOKUP_MAX', 5000)
+        if len(value) > limit:
+            raise serializers.ValidationError(f"At most {limit} ISBNs per request.")
+        return value
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    max_chunk_size = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'target', 'object_id', 'filename', 'size', 'received', 'content_type', 'status',
+                  'error', 'max_chunk_size', 'created_at', 'updated_at')
+        read_only_fields = ('received', 'content_type', 'status', 'error', 'created_at', 'updated_at')
+    
+    def get_max_chunk_size(self, obj):
+        return getattr(settings, 'UPLOAD_CHUNK_MAX_BYTES', 4 * 1024 * 1024)
+
+class UserStatsSerializer(serializers.ModelSerializer):
+    rating_distribution = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UserStats
+        fields = ('books_shelved', 'reviews_written', 'rating_distribution', 'favourite_genres',
+                  'exchanges_completed', 'updated_at')
+    
+    def get_rating_distribution(self, obj):
+        # Reviews per star rating, e.g. {"1": 0, ..., "5": 12}
+        return {str(rating): getattr(obj, f'rating_{rating}') for rating in range(1, 6)}
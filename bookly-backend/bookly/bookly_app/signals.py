@@ -0,0 +1,226 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import auth, authors, cards, discussions, notifications, rankings, stats, sync, tasks
+from .models import (
+    Author, Book, Bookshelf, Comment, ExchangeOffer, ExchangeRequest, Genre, Review, SupportTicket, TicketReply,
+)
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    if created:
+        rankings.record_activity([instance.book_id], 'reviews')
+        # Shelf owners can be many; fan out in the background
+        tasks.publish_review.enqueue_on_commit(instance.pk)
+    tasks.recompute_book_rating_on_commit(instance.book_id)
+    old_book_id = getattr(instance, '_loaded_book_id', None)
+    if old_book_id is not None and old_book_id != instance.book_id:
+        # The review left that book's rating too
+        tasks.recompute_book_rating_on_commit(old_book_id)
+    instance._loaded_book_id = instance.book_id
+    stats.review_saved(instance, created)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    tasks.recompute_book_rating_on_commit(instance.book_id)
+    stats.review_removed(instance)
+
+
+@receiver(post_save, sender=ExchangeOffer)
+def exchange_offer_saved(sender, instance, created, **kwargs):
+    if created:
+        rankings.record_activity([instance.book_id], 'offers')
+
+
+@receiver(post_save, sender=ExchangeRequest)
+def exchange_request_saved(sender, instance, created, **kwargs):
+    if created:
+        offer = instance.offer
+        notifications.deliver([offer.owner_id], 'exchange_request', instance.pk, actor=instance.requester_id,
+                              book=offer.book_id, data={'offer': offer.pk})
+    stats.exchange_request_saved(instance, created)
+
+
+@receiver(post_delete, sender=ExchangeRequest)
+def exchange_request_deleted(sender, instance, **kwargs):
+    stats.exchange_request_removed(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        discussions.comment_added(instance)
+        discussion = instance.discussion
+        notifications.deliver([discussion.created_by_id], 'comment', instance.pk, actor=instance.user_id,
+                              book=discussion.book_id,
+                              data={'discussion': discussion.pk, 'discussion_title': discussion.title})
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    discussions.comment_removed(instance)
+
+
+@receiver(post_save, sender=TicketReply)
+def ticket_reply_saved(sender, instance, created, **kwargs):
+    if created:
+        ticket = instance.ticket
+        notifications.deliver([ticket.user_id], 'ticket_reply', instance.pk, actor=instance.user_id,
+                              data={'ticket': ticket.pk, 'subject': ticket.subject})
+
+
+@receiver(m2m_changed, sender=Bookshelf.books.through)
+def bookshelf_books_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Only newly added memberships count; set() reports just the added ids here
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        # book.bookshelves.add(...): instance is the book, pk_set holds shelves
+        rankings.record_activity([instance.pk], 'shelvings', amount=len(pk_set))
+    else:
+        rankings.record_activity(pk_set, 'shelvings')
+
+
+# Reading statistics: shelf changes recompute the shelf part for the owners
+
+@receiver(m2m_changed, sender=Bookshelf.books.through)
+def bookshelf_books_stats(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            stats.refresh_shelves([instance.user_id])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        stats.refresh_shelves(Bookshelf.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+    elif action == 'pre_clear':
+        # book.bookshelves.clear(): the shelves are only known before, the counts only after
+        user_ids = list(Bookshelf.objects.filter(books=instance).values_list('user_id', flat=True))
+        transaction.on_commit(lambda: stats.refresh_shelves(user_ids))
+
+
+@receiver(post_delete, sender=Bookshelf)
+def bookshelf_deleted(sender, instance, **kwargs):
+    stats.refresh_shelves([instance.user_id])
+
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, created, **kwargs):
+    # A rename changes the key; the cached entry for the old name is stale
+    if not created:
+        authors.forget(instance.pk)
+
+
+@receiver(post_delete, sender=Author)
+def author_deleted(sender, instance, **kwargs):
+    authors.forget(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    # A cached "unknown username" would keep the new account from logging in
+    if created:
+        auth.forget_unknown_user(instance.get_username())
+
+
+# Delta sync: every change to an object a user syncs gets a new sequence number
+
+def _request_users(request):
+    owner_id = ExchangeOffer.objects.filter(pk=request.offer_id).values_list('owner_id', flat=True).first()
+    return [request.requester_id, owner_id]
+
+
+SYNC_USERS = {
+    Bookshelf: ('bookshelves', lambda shelf: [shelf.user_id]),
+    Review: ('reviews', lambda review: [review.user_id]),
+    ExchangeOffer: ('offers', lambda offer: [offer.owner_id]),
+    ExchangeRequest: ('requests', _request_users),
+    SupportTicket: ('tickets', lambda ticket: [ticket.user_id]),
+}
+
+
+def synced_saved(sender, instance, **kwargs):
+    kind, users = SYNC_USERS[sender]
+    sync.record(users(instance), kind, [instance.pk])
+
+
+def synced_deleted(sender, instance, **kwargs):
+    kind, users = SYNC_USERS[sender]
+    sync.record(users(instance), kind, [instance.pk], deleted=True)
+
+
+for model in SYNC_USERS:
+    post_save.connect(synced_saved, sender=model, dispatch_uid=f'sync_saved_{model.__name__}')
+    post_delete.connect(synced_deleted, sender=model, dispatch_uid=f'sync_deleted_{model.__name__}')
+
+
+@receiver(m2m_changed, sender=Bookshelf.books.through)
+def bookshelf_books_synced(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        sync.record([instance.user_id], 'bookshelves', [instance.pk])
+    elif pk_set:
+        sync.record_owned('bookshelves', dict(Bookshelf.objects.filter(pk__in=pk_set).values_list('id', 'user_id')))
+
+
+@receiver(pre_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    # The memberships go with the book without m2m signals; the shelves still changed
+    shelves = dict(Bookshelf.objects.filter(books=instance).values_list('id', 'user_id'))
+    sync.record_owned('bookshelves', shelves)
+    # Deletion runs in a transaction; the owners' counts are right once it commits
+    transaction.on_commit(lambda: stats.refresh_shelves(shelves.values()))
+
+
+@receiver(post_save, sender=TicketReply)
+def ticket_reply_synced(sender, instance, created, **kwargs):
+    # A reply changes its ticket's thread
+    if created:
+        user_id = SupportTicket.objects.filter(pk=instance.ticket_id).values_list('user_id', flat=True).first()
+        sync.record([user_id], 'tickets', [instance.ticket_id])
+
+
+# Book cards: rewritten in the transaction of the change they depend on
+
+@receiver(post_save, sender=Book)
+def book_card_saved(sender, instance, **kwargs):
+    cards.refresh([instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def book_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            cards.refresh([instance.pk])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        cards.refresh(pk_set)
+    elif action == 'pre_clear':
+        # genre.books.clear(): remember the books while the rows still exist
+        instance._card_book_ids = list(instance.books.values_list('id', flat=True))
+    elif action == 'post_clear':
+        cards.refresh(getattr(instance, '_card_book_ids', []))
+
+
+@receiver(post_save, sender=Author)
+def author_card_saved(sender, instance, created, **kwargs):
+    if not created:
+        cards.refresh(instance.books.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Genre)
+def genre_card_saved(sender, instance, created, **kwargs):
+    if not created:
+        cards.refresh(instance.books.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Genre)
+def genre_card_deleting(sender, instance, **kwargs):
+    # The memberships are deleted without m2m signals before post_delete
+    instance._card_book_ids = list(instance.books.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+def genre_card_deleted(sender, instance, **kwargs):
+    cards.refresh(getattr(instance, '_card_book_ids', []))
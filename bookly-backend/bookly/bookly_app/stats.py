@@ -0,0 +1,187 @@
+"""
+Per-user reading statistics.
+
+:class:`~bookly_app.models.UserStats` holds one row per user, so a profile
+page never aggregates the user's history. Review and exchange signals keep
+the counters current with single UPDATE statements built on F()
+expressions. A distinct-book count can't be kept that way, because a book
+may sit on several shelves. So shelf changes recompute ``books_shelved``
+and ``favourite_genres`` for the affected users only. Rows are built on
+first read, and :func:`rebuild` (``manage.py rebuild_user_stats``)
+recomputes everything from the source tables.
+"""
+import collections
+
+from django.contrib.auth.models import User
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import (
+    ArchivedExchangeOffer, ArchivedExchangeRequest, Book, Bookshelf, ExchangeOffer, ExchangeRequest, Review,
+    UserStats,
+)
+
+TOP_GENRES = 5
+RATINGS = range(1, 6)
+
+COUNTER_FIELDS = ('books_shelved', 'reviews_written', *(f'rating_{rating}' for rating in RATINGS),
+                  'favourite_genres', 'exchanges_completed')
+
+
+def _bump(user_ids, **deltas):
+    # Users without a row yet get theirs built, correct, on first read
+    UserStats.objects.filter(user_id__in=user_ids).update(
+        updated_at=timezone.now(),
+        **{field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()},
+    )
+
+
+def review_saved(review, created):
+    if created:
+        _bump([review.user_id], reviews_written=1, **{f'rating_{review.rating}': 1})
+    else:
+        old = getattr(review, '_loaded_rating', None)
+        if old is None or old == review.rating:
+            return
+        _bump([review.user_id], **{f'rating_{old}': -1, f'rating_{review.rating}': 1})
+    # The next save of this instance is compared with what was just counted
+    review._loaded_rating = review.rating
+
+
+def review_removed(review):
+    _bump([review.user_id], reviews_written=-1, **{f'rating_{review.rating}': -1})
+
+
+def _exchange_sides(request):
+    owner_id = ExchangeOffer.objects.filter(pk=request.offer_id).values_list('owner_id', flat=True).first()
+    return {request.requester_id, owner_id} - {None}
+
+
+def exchange_request_saved(request, created):
+    """Counts a request that just became (or stopped being) COMPLETED for both sides."""
+    was_completed = not created and getattr(request, '_loaded_status', None) == 'COMPLETED'
+    is_completed = request.status == 'COMPLETED'
+    if was_completed == is_completed:
+        return
+    _bump(_exchange_sides(request), exchanges_completed=1 if is_completed else -1)
+    request._loaded_status = request.status
+
+
+def exchange_request_removed(request):
+    # Archiving deletes finished requests too; those still count
+    if request.status != 'COMPLETED' or ArchivedExchangeRequest.objects.filter(pk=request.pk).exists():
+        return
+    _bump(_exchange_sides(request), exchanges_completed=-1)
+
+
+def _shelf_stats(user_ids):
+    """``{user_id: (books_shelved, favourite_genres)}`` for users with shelved books."""
+    Membership = Bookshelf.books.through
+    books_shelved = dict(
+        Membership.objects
+        .filter(bookshelf__user_id__in=user_ids)
+        .values_list('bookshelf__user_id')
+        .annotate(n=Count('book_id', distinct=True))
+        .order_by()
+    )
+    genre_counts = collections.defaultdict(list)
+    rows = (
+        Book.genres.through.objects
+        .filter(book__bookshelves__user_id__in=user_ids)
+        .values_list('book__bookshelves__user_id', 'genre_id', 'genre__name')
+        .annotate(n=Count('book_id', distinct=True))
+        .order_by()
+    )
+    for user_id, genre_id, name, n in rows:
+        genre_counts[user_id].append({'id': genre_id, 'name': name, 'count': n})
+    return {
+        user_id: (count, sorted(genre_counts[user_id], key=lambda g: (-g['count'], g['id']))[:TOP_GENRES])
+        for user_id, count in books_shelved.items()
+    }
+
+
+def refresh_shelves(user_ids):
+    """Recomputes the shelf statistics of ``user_ids`` after their shelves changed."""
+    user_ids = set(user_ids) - {None}
+    if not user_ids:
+        return
+    shelf_stats = _shelf_stats(user_ids)
+    for user_id in UserStats.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True):
+        books_shelved, favourite_genres = shelf_stats.get(user_id, (0, []))
+        UserStats.objects.filter(user_id=user_id).update(
+            books_shelved=books_shelved, favourite_genres=favourite_genres, updated_at=timezone.now()
+        )
+
+
+def _count_by(queryset, field):
+    return dict(queryset.values_list(field).annotate(n=Count('id')).order_by())
+
+
+def _exchange_counts(user_ids):
+    live = ExchangeRequest.objects.filter(status='COMPLETED')
+    archived = ArchivedExchangeRequest.objects.filter(status='COMPLETED')
+    # Archived requests only keep the offer id; the offer may be live or archived
+    archived_owner = Coalesce(
+        Subquery(ExchangeOffer.objects.filter(id=OuterRef('offer_id')).values('owner_id')[:1]),
+        Subquery(ArchivedExchangeOffer.objects.filter(id=OuterRef('offer_id')).values('owner_id')[:1]),
+    )
+    counts = collections.Counter()
+    for part in (
+        _count_by(live.filter(requester_id__in=user_ids), 'requester_id'),
+        _count_by(live.filter(offer__owner_id__in=user_ids), 'offer__owner_id'),
+        _count_by(archived.filter(requester_id__in=user_ids), 'requester_id'),
+        _count_by(archived.annotate(owner_id=archived_owner).filter(owner_id__in=user_ids), 'owner_id'),
+    ):
+        counts.update(part)
+    return counts
+
+
+def rebuild(user_ids):
+    """Recomputes (or creates) the statistics rows of ``user_ids`` from the source tables."""
+    user_ids = list(user_ids)
+    reviews = {
+        row['user_id']: row
+        for row in Review.objects.filter(user_id__in=user_ids).values('user_id').annotate(
+            reviews_written=Count('id'),
+            **{f'rating_{rating}': Count('id', filter=Q(rating=rating)) for rating in RATINGS},
+        ).order_by()
+    }
+    shelf_stats = _shelf_stats(user_ids)
+    exchanges = _exchange_counts(user_ids)
+    rows = []
+    for user_id in user_ids:
+        review_counts = reviews.get(user_id, {})
+        books_shelved, favourite_genres = shelf_stats.get(user_id, (0, []))
+        rows.append(UserStats(
+            user_id=user_id,
+            books_shelved=books_shelved,
+            reviews_written=review_counts.get('reviews_written', 0),
+            **{f'rating_{rating}': review_counts.get(f'rating_{rating}', 0) for rating in RATINGS},
+            favourite_genres=favourite_genres,
+            exchanges_completed=exchanges[user_id],
+            updated_at=timezone.now(),
+        ))
+    UserStats.objects.bulk_create(rows, update_conflicts=True, unique_fields=['user'],
+                                  update_fields=[*COUNTER_FIELDS, 'updated_at'])
+    return len(rows)
+
+
+def rebuild_all(batch_size=500):
+    """Rebuilds the statistics of every user; returns the number of rows written."""
+    rebuilt = 0
+    last_id = 0
+    while True:
+        ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return rebuilt
+        last_id = ids[-1]
+        rebuilt += rebuild(ids)
+
+
+def get(user):
+    stats = UserStats.objects.filter(user=user).first()
+    if stats is None:
+        rebuild([user.pk])
+        stats = UserStats.objects.get(user=user)
+    return stats
@@ -0,0 +1,146 @@
+"""
+Delta sync for offline and mobile clients.
+
+Signals record every change to a user's shelves, reviews, offers, exchange
+requests and tickets in :class:`~bookly_app.models.SyncChange`. A change
+replaces the object's previous row with a new sequence number, and deletions
+stay behind as tombstones. A sync token is a signed ``(user, sequence)`` pair.
+Reading the changes after it is one range scan over the ``(user, seq)`` index.
+
+Sequence numbers come from the user's :class:`~bookly_app.models.SyncCounter`
+row, not from an autoincrement id. An id is taken at INSERT, so a slow
+transaction could commit a lower id after a client had already synced past a
+higher one, and that change would never be sent. The counter row stays locked
+until the writing transaction commits, so a user's numbers are handed out in
+commit order, and every number up to the committed counter is visible. The
+price is that writes touching the same user's sync data queue behind each
+other until commit.
+
+Tombstones are purged after ``SYNC_TOKEN_MAX_AGE_DAYS``, and tokens expire at
+the same age. A client that has been away longer gets a 410 and reloads its
+lists in full.
+"""
+import collections
+import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import SyncChange, SyncCounter
+
+TOKEN_SALT = 'bookly.sync'
+
+
+class SyncTokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'The sync token has expired; reload everything and start from a new token.'
+    default_code = 'sync_token_expired'
+
+
+def _max_age():
+    return datetime.timedelta(days=getattr(settings, 'SYNC_TOKEN_MAX_AGE_DAYS', 30))
+
+
+def make_token(user, seq):
+    return signing.dumps({'u': user.pk, 's': seq}, salt=TOKEN_SALT)
+
+
+def read_token(user, token):
+    """Returns the sequence number in ``token``."""
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT, max_age=_max_age())
+    except signing.SignatureExpired:
+        raise SyncTokenExpired()
+    except signing.BadSignature:
+        raise ValidationError({"token": ["Invalid sync token."]})
+    if data.get('u') != user.pk:
+        raise ValidationError({"token": ["Invalid sync token."]})
+    return data['s']
+
+
+def current_token(user):
+    seq = SyncCounter.objects.filter(user=user).values_list('seq', flat=True).first() or 0
+    return make_token(user, seq)
+
+
+def _reserve(counts):
+    """
+    Takes the next ``n`` sequence numbers for each user in ``counts``
+    (``{user_id: n}``) and returns ``{user_id: first number}``. Must run in a
+    transaction, which keeps the counters locked until it ends.
+    """
+    SyncCounter.objects.bulk_create([SyncCounter(user_id=user_id) for user_id in counts], ignore_conflicts=True)
+    # Locked in user order, so two writers for the same users can't deadlock
+    counters = list(SyncCounter.objects.select_for_update().filter(user_id__in=counts).order_by('user_id'))
+    first = {}
+    for counter in counters:
+        first[counter.user_id] = counter.seq + 1
+        counter.seq += counts[counter.user_id]
+    SyncCounter.objects.bulk_update(counters, ['seq'])
+    return first
+
+
+def record(user_ids, kind, object_ids, deleted=False):
+    """Gives ``object_ids`` of ``kind`` a new sequence number for every user in ``user_ids``."""
+    user_ids = sorted({user_id for user_id in user_ids if user_id is not None})
+    object_ids = sorted(set(object_ids))
+    if not user_ids or not object_ids:
+        return
+    with transaction.atomic():
+        first = _reserve({user_id: len(object_ids) for user_id in user_ids})
+        SyncChange.objects.filter(user_id__in=user_ids, kind=kind, object_id__in=object_ids).delete()
+        SyncChange.objects.bulk_create([
+            SyncChange(user_id=user_id, kind=kind, object_id=object_id, seq=first[user_id] + i, deleted=deleted)
+            for user_id in user_ids for i, object_id in enumerate(object_ids)
+        ])
+
+
+def record_owned(kind, owners, deleted=False):
+    """
+    Like :func:`record` for many objects with one owner each, given as
+    ``{object_id: user_id}``; one DELETE and one INSERT in total.
+    """
+    owners = {object_id: user_id for object_id, user_id in owners.items() if user_id is not None}
+    if not owners:
+        return
+    with transaction.atomic():
+        next_seq = _reserve(collections.Counter(owners.values()))
+        # Only the owner ever has a row for these objects
+        SyncChange.objects.filter(user_id__in=set(owners.values()), kind=kind, object_id__in=owners).delete()
+        rows = []
+        for object_id, user_id in sorted(owners.items()):
+            rows.append(SyncChange(user_id=user_id, kind=kind, object_id=object_id, seq=next_seq[user_id],
+                                   deleted=deleted))
+            next_seq[user_id] += 1
+        SyncChange.objects.bulk_create(rows)
+
+
+def changes(user, since, limit):
+    """
+    The first ``limit`` changes after sequence number ``since``, as
+    ``(changed, deleted, last_seq, has_more)``. ``changed`` and ``deleted`` map
+    kinds to object ids.
+    """
+    rows = list(
+        SyncChange.objects
+        .filter(user=user, seq__gt=since)
+        .order_by('seq')
+        .values_list('seq', 'kind', 'object_id', 'deleted')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changed = collections.defaultdict(set)
+    deleted = collections.defaultdict(set)
+    for seq, kind, object_id, gone in rows:
+        (deleted if gone else changed)[kind].add(object_id)
+    return changed, deleted, (rows[-1][0] if rows else since), has_more
+
+
+def purge_tombstones():
+    cutoff = timezone.now() - _max_age()
+    deleted, _ = SyncChange.objects.filter(deleted=True, changed_at__lt=cutoff).delete()
+    return deleted
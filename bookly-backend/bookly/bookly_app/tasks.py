@@ -0,0 +1,129 @@
+import io
+import os
+import re
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db.models import Avg, Count
+
+from . import archive, cards, facets, jobs, notifications, rankings, sync, uploads
+from .jobs import task
+from .media import HASH_LENGTH
+from .models import Book, Review
+
+
+def update_book_ratings(book_ids):
+    """Recomputes the stored rating aggregates of ``book_ids`` in one pass."""
+    book_ids = list(book_ids)
+    if not book_ids:
+        return
+    stats = {
+        row['book_id']: row
+        for row in Review.objects.filter(book_id__in=book_ids).values('book_id')
+        .annotate(count=Count('id'), avg=Avg('rating'))
+    }
+    books = [
+        Book(pk=book_id, rating_count=stats[book_id]['count'], rating_avg=stats[book_id]['avg'])
+        if book_id in stats else Book(pk=book_id, rating_count=0, rating_avg=0)
+        for book_id in book_ids
+    ]
+    Book.objects.bulk_update(books, ['rating_count', 'rating_avg'], batch_size=500)
+    cards.refresh(book_ids)
+
+
+@task(name='recompute_book_rating', unique_pending=True)
+def recompute_book_rating(book_id):
+    update_book_ratings([book_id])
+
+
+def recompute_book_rating_on_commit(book_id):
+    # One pending job per book, however many of its reviews change before it runs
+    recompute_book_rating.enqueue_on_commit(book_id, idempotency_key=f'rating:{book_id}')
+
+
+@task(name='process_cover_image')
+def process_cover_image(book_id):
+    """Scales an uploaded cover down to ``COVER_MAX_SIZE`` and re-encodes it."""
+    from PIL import Image
+
+    book = Book.objects.get(pk=book_id)
+    if not book.cover_image:
+        return
+    max_size = getattr(settings, 'COVER_MAX_SIZE', (800, 1200))
+    with book.cover_image.open('rb') as f:
+        image = Image.open(f)
+        image.load()
+    if image.width <= max_size[0] and image.height <= max_size[1]:
+        return
+
+    image.thumbnail(max_size)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85, optimize=True)
+    name = os.path.splitext(os.path.basename(book.cover_image.name))[0]
+    # Drop the content hash of the original name; storage adds a new one
+    name = re.sub(r'\.[0-9a-f]{%d}$' % HASH_LENGTH, '', name)
+    saved = book.cover_image.storage.save(f'book_covers/{name}.jpg', ContentFile(buffer.getvalue()))
+    # Skip the update if another upload replaced the cover meanwhile
+    if Book.objects.filter(pk=book_id, cover_image=book.cover_image.name).update(cover_image=saved):
+        cards.refresh([book_id])
+
+
+@task(name='attach_cover_file')
+def attach_cover_file(book_id, path):
+    """Copies a local image file into storage as the cover of a book."""
+    book = Book.objects.get(pk=book_id)
+    with open(path, 'rb') as f:
+        book.cover_image.save(os.path.basename(path), File(f), save=False)
+    Book.objects.filter(pk=book_id).update(cover_image=book.cover_image.name)
+    cards.refresh([book_id])
+    process_cover_image(book_id)
+
+
+@task(name='compact_book_activity', max_attempts=3)
+def compact_book_activity(keep_days=rankings.TRENDING_MAX_DAYS, max_age_days=730):
+    rankings.compact(keep_days=keep_days, max_age_days=max_age_days)
+
+
+@task(name='refresh_catalog_facets', max_attempts=1)
+def refresh_catalog_facets():
+    facets.refresh_catalog()
+
+
+@task(name='publish_review')
+def publish_review(review_id):
+    review = Review.objects.filter(pk=review_id).values('book_id', 'user_id', 'rating', 'book__title').first()
+    if review is None:
+        return
+    notifications.publish_review(review_id, review['book_id'], review['user_id'], data={
+        'book_title': review['book__title'],
+        'rating': review['rating'],
+    })
+
+
+@task(name='purge_sync_tombstones', max_attempts=3)
+def purge_sync_tombstones():
+    sync.purge_tombstones()
+
+
+@task(name='purge_upload_sessions', max_attempts=3)
+def purge_upload_sessions():
+    uploads.purge_expired()
+
+
+@task(name='purge_finished_jobs', max_attempts=3)
+def purge_finished_jobs():
+    jobs.purge_finished()
+
+
+@task(name='archive_records', max_attempts=3)
+def archive_records():
+    archive.archive_all()
+
+
+@task(name='run_import', max_attempts=1)
+def run_import(import_id):
+    from . import imports
+    imports.run(import_id)
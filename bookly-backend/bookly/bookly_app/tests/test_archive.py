@@ -0,0 +1,81 @@
+import datetime
+import io
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from bookly_app.models import (
+    ArchivedExchangeOffer, ArchivedExchangeRequest, ArchivedSupportTicket, ArchivedTicketReply, Author, Book,
+    ExchangeOffer, ExchangeRequest, SupportTicket, TicketReply,
+)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.requester = User.objects.create_user('requester')
+        staff = User.objects.create_user('staff', is_staff=True)
+        book = Book.objects.create(title='Book', author=Author.objects.create(name='Author'))
+
+        def offer(owner, status):
+            return ExchangeOffer.objects.create(book=book, owner=owner, condition='Good', exchange_type='SELL',
+                                                status=status)
+
+        self.completed = offer(self.owner, 'COMPLETED')
+        self.negotiating = offer(self.owner, 'REJECTED')
+        self.pending = offer(self.requester, 'PENDING')
+        ExchangeRequest.objects.create(offer=self.completed, requester=self.requester, status='COMPLETED')
+        ExchangeRequest.objects.create(offer=self.negotiating, requester=self.requester, status='PENDING')
+        self.rejected = ExchangeRequest.objects.create(offer=self.pending, requester=self.owner, status='REJECTED')
+        self.quiet = SupportTicket.objects.create(user=self.owner, subject='Quiet', message='m', status='CLOSED')
+        self.recent_reply = SupportTicket.objects.create(user=self.owner, subject='Busy', message='m', status='CLOSED')
+        TicketReply.objects.create(ticket=self.quiet, user=staff, message='Fixed')
+        TicketReply.objects.create(ticket=self.recent_reply, user=staff, message='Fixed')
+
+        old = timezone.now() - datetime.timedelta(days=400)
+        for model in (ExchangeOffer, ExchangeRequest, SupportTicket):
+            model.objects.update(created_at=old)
+        TicketReply.objects.filter(ticket=self.quiet).update(created_at=old)
+
+    def archive(self, *args):
+        out = io.StringIO()
+        call_command('archive_records', *args, stdout=out)
+        return out.getvalue()
+
+    def test_only_finished_records_are_moved(self):
+        self.archive('--dry-run')
+        self.assertFalse(ArchivedExchangeOffer.objects.exists())
+
+        self.archive('--batch-size', '1')
+        # The completed offer goes with its request; the other offer still has a pending request
+        self.assertEqual(set(ArchivedExchangeOffer.objects.values_list('id', flat=True)), {self.completed.pk})
+        self.assertEqual(ArchivedExchangeRequest.objects.count(), 2)
+        self.assertEqual(set(ExchangeOffer.objects.values_list('id', flat=True)), {self.negotiating.pk, self.pending.pk})
+        self.assertEqual(list(ArchivedSupportTicket.objects.values_list('id', flat=True)), [self.quiet.pk])
+        self.assertEqual(ArchivedTicketReply.objects.get().message, 'Fixed')
+        self.assertEqual(list(SupportTicket.objects.values_list('id', flat=True)), [self.recent_reply.pk])
+
+    def test_archive_and_history_endpoints(self):
+        self.archive()
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        ticket = client.get(f'/api/archive/support-tickets/{self.quiet.pk}/').json()
+        self.assertEqual([reply['message'] for reply in ticket['replies']], ['Fixed'])
+        self.assertEqual(client.post('/api/archive/exchange-offers/', {}).status_code, 405)
+
+        history = client.get('/api/history/exchanges/').json()['results']
+        self.assertEqual(
+            {(row['type'], row['id'], row['archived']) for row in history},
+            {('offer', self.completed.pk, True), ('offer', self.negotiating.pk, False),
+             ('request', self.rejected.pk, True)},
+        )
+        tickets = client.get('/api/history/tickets/').json()['results']
+        self.assertEqual({(row['id'], row['archived']) for row in tickets},
+                         {(self.quiet.pk, True), (self.recent_reply.pk, False)})
+
+        client.force_authenticate(self.requester)
+        self.assertEqual(client.get('/api/history/exchanges/').json()['count'], 3)
+        self.assertEqual(client.get(f'/api/archive/support-tickets/{self.quiet.pk}/').status_code, 404)
@@ -0,0 +1,60 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from bookly_app import auth
+
+
+class PooledHashingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+
+    def login(self, username, password):
+        return self.client.post('/api/token/', {'username': username, 'password': password})
+
+    def test_old_hashes_are_upgraded_to_scrypt_on_login(self):
+        user = User.objects.create(username='old', password=make_password('secret', hasher='pbkdf2_sha256'))
+        self.assertEqual(self.login('old', 'secret').status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$'))
+        self.assertEqual(self.login('old', 'wrong').status_code, 401)
+
+    def test_unknown_usernames_are_remembered_until_registration(self):
+        self.assertEqual(self.login('ghost', 'x').status_code, 401)
+        self.assertIsNotNone(cache.get(auth._unknown_user_key('ghost')))
+        response = self.client.post('/api/users/', {'username': 'ghost', 'password': 'secret', 'email': 'g@example.com'})
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(cache.get(auth._unknown_user_key('ghost')))
+        self.assertEqual(self.login('ghost', 'secret').status_code, 200)
+
+    def test_unknown_usernames_cost_a_hash_every_time(self):
+        User.objects.create_user('reader', password='secret')
+        with mock.patch.object(auth, 'hash_password', wraps=auth.hash_password) as hashed:
+            for _ in range(2):
+                self.assertEqual(self.login('ghost', 'x').status_code, 401)
+        self.assertEqual(hashed.call_count, 2)
+        # The same count of pool hashes as a wrong password for a real account
+        with mock.patch.object(auth.HashingPool, 'run', autospec=True, side_effect=auth.HashingPool.run) as run:
+            self.login('ghost', 'x')
+            self.login('reader', 'wrong')
+        self.assertEqual(run.call_count, 2)
+
+    def test_full_pool_rejects_quickly(self):
+        User.objects.create_user('reader', password='secret')
+        pool = auth.get_pool()
+        saved = pool.slots
+        pool.slots = threading.BoundedSemaphore(1)
+        pool.slots.acquire()
+        try:
+            response = self.login('reader', 'secret')
+        finally:
+            pool.slots = saved
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
@@ -0,0 +1,75 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from bookly_app import authors
+from bookly_app.models import Author, Book, Discussion
+
+
+class ResolveTests(TestCase):
+    def setUp(self):
+        authors._cache.clear()
+        self.addCleanup(authors._cache.clear)
+
+    def test_names_are_matched_on_their_key(self):
+        tolkien = Author.objects.create(name='  J.R.R.   Tolkien ')
+        self.assertEqual(tolkien.name, 'J.R.R. Tolkien')
+        self.assertEqual(tolkien.name_key, 'j.r.r. tolkien')
+        # One lookup, one INSERT for the new authors, one read-back
+        with self.assertNumQueries(3), self.captureOnCommitCallbacks(execute=True):
+            ids = authors.resolve_many(['j.r.r. TOLKIEN', 'Frank Herbert', 'frank  herbert', 'Ursula'])
+        self.assertEqual(ids['j.r.r. TOLKIEN'], tolkien.pk)
+        self.assertEqual(ids['Frank Herbert'], ids['frank  herbert'])
+        self.assertEqual(Author.objects.get(pk=ids['frank  herbert']).name, 'Frank Herbert')
+        self.assertEqual(Author.objects.count(), 3)
+        with self.assertNumQueries(0):
+            authors.resolve('URSULA')
+        self.assertIsNone(authors.resolve('Nobody', create=False))
+        with self.assertRaises(ValueError):
+            authors.resolve('   ')
+
+    def test_renamed_authors_leave_the_cache(self):
+        tolkien = Author.objects.create(name='J.R.R. Tolkien')
+        authors.resolve('J.R.R. Tolkien')
+        self.assertIn('j.r.r. tolkien', authors._cache)
+        tolkien.name = 'Tolkien'
+        tolkien.save()
+        self.assertNotIn('j.r.r. tolkien', authors._cache)
+
+
+class AuthorApiTests(TestCase):
+    def setUp(self):
+        authors._cache.clear()
+        self.addCleanup(authors._cache.clear)
+        self.user = User.objects.create_user('reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_books_resolve_author_names(self):
+        response = self.client.post('/api/books/', {'title': 'Dune', 'author': 'frank herbert'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/books/', {'title': 'Dune Messiah', 'author': 'Frank  Herbert'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Author.objects.count(), 1)
+        self.assertEqual(self.client.post('/api/authors/', {'name': 'FRANK HERBERT'}, format='json').status_code, 400)
+
+    def test_author_page(self):
+        author = Author.objects.create(name='Frank Herbert')
+        dune = Book.objects.create(title='Dune', author=author, rating_count=3, rating_avg=5.0)
+        Book.objects.create(title='Dune Messiah', author=author, rating_count=1, rating_avg=1.0)
+        for i in range(12):
+            Book.objects.create(title=f'Book {i}', author=author)
+        Discussion.objects.create(title='On the book', created_by=self.user, book=dune, content='c')
+        Discussion.objects.create(title='On the author', created_by=self.user, author=author, content='c')
+        Discussion.objects.create(title='On both', created_by=self.user, author=author, book=dune, content='c')
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/authors/{author.pk}/page/')
+        page = response.json()
+        self.assertEqual(page['book_count'], 14)
+        # Weighted by the number of ratings, unrated books left out
+        self.assertEqual(page['average_rating'], 4.0)
+        self.assertEqual(page['discussion_count'], 3)
+        self.assertEqual(page['books']['count'], 14)
+        self.assertIsNotNone(page['books']['next'])
+        self.assertEqual(self.client.get('/api/authors/999/page/').status_code, 404)
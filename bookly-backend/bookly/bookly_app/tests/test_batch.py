@@ -0,0 +1,58 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from bookly_app.models import Author, Book, Bookshelf
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        author = Author.objects.create(name='Author')
+        self.books = [Book.objects.create(title=f'Book {i}', author=author) for i in range(2)]
+        self.client = APIClient()
+        # Sub-requests authenticate with the batch request's own credentials
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def batch(self, requests, atomic=False):
+        return self.client.post('/api/batch/', {'atomic': atomic, 'requests': requests}, format='json')
+
+    def test_later_requests_refer_to_earlier_responses(self):
+        response = self.batch([
+            {'name': 'shelf', 'method': 'POST', 'path': '/api/bookshelves/', 'body': {'name': 'Read'}},
+            {'method': 'PATCH', 'path': '/api/bookshelves/{$shelf.id}/update_books/',
+             'body': {'books': [book.pk for book in self.books]}},
+            {'method': 'GET', 'path': '/api/users/me/?fields=username'},
+        ], atomic=True)
+        body = response.json()
+        self.assertTrue(body['committed'])
+        self.assertEqual([item['status'] for item in body['responses']], [201, 200, 200])
+        self.assertEqual(len(body['responses'][1]['body']['books']), 2)
+        self.assertEqual(body['responses'][2]['body'], {'username': 'reader'})
+
+    def test_atomic_batch_rolls_back_at_the_first_failure(self):
+        response = self.batch([
+            {'name': 'shelf', 'method': 'POST', 'path': '/api/bookshelves/', 'body': {'name': 'Read'}},
+            {'method': 'PATCH', 'path': '/api/bookshelves/{$shelf.id}/update_books/', 'body': {'books': [999]}},
+            {'method': 'GET', 'path': '/api/bookshelves/'},
+        ], atomic=True)
+        body = response.json()
+        self.assertFalse(body['committed'])
+        self.assertEqual([item['status'] for item in body['responses']], [201, 400, 424])
+        self.assertFalse(Bookshelf.objects.exists())
+
+    def test_failures_are_reported_per_item(self):
+        response = self.batch([
+            {'method': 'GET', 'path': '/api/batch/'},
+            {'method': 'GET', 'path': '/api/books/{$missing.id}/'},
+            {'method': 'GET', 'path': '/api/nothing/'},
+            {'method': 'GET', 'path': f'/api/books/{self.books[0].pk}/'},
+        ])
+        self.assertEqual([item['status'] for item in response.json()['responses']], [400, 424, 404, 200])
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch([{'method': 'GET', 'path': '/api/books/'}] * 3).status_code, 400)
+        self.assertEqual(APIClient().post('/api/batch/', {'requests': []}, format='json').status_code, 401)
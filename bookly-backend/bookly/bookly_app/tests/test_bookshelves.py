@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from bookly_app.models import Author, Book, Bookshelf
+
+
+class BookshelfSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        author = Author.objects.create(name='Author')
+        self.books = [
+            Book.objects.create(title=f'Book {i}', author=author, cover_image=f'book_covers/{i}.jpg' if i % 2 else '')
+            for i in range(6)
+        ]
+        self.shelf = Bookshelf.objects.create(name='Read', user=self.user)
+        self.shelf.books.add(*self.books)
+        Bookshelf.objects.create(name='Empty', user=self.user)
+        Bookshelf.objects.create(name='Theirs', user=User.objects.create_user('other'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_summary_counts_and_cover_previews(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/bookshelves/?summary=1&covers=2')
+        shelves = response.json()['results']
+        self.assertEqual([(shelf['name'], shelf['book_count']) for shelf in shelves], [('Read', 6), ('Empty', 0)])
+        self.assertEqual([cover['id'] for cover in shelves[0]['covers']], [self.books[1].pk, self.books[3].pk])
+        self.assertTrue(shelves[0]['covers'][0]['cover_image'].startswith('http://testserver/media/'))
+        self.assertEqual(shelves[1]['covers'], [])
+
+    def test_shelf_contents_are_paginated_and_ordered(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/bookshelves/{self.shelf.pk}/books/?ordering=-title')
+        body = response.json()
+        self.assertEqual(body['count'], 6)
+        self.assertEqual([book['title'] for book in body['results']], [f'Book {i}' for i in range(5, -1, -1)])
+        self.assertEqual(body['results'][0]['author_name'], 'Author')
+
+    def test_contents_reject_unknown_ordering_and_other_users_shelves(self):
+        self.assertEqual(self.client.get(f'/api/bookshelves/{self.shelf.pk}/books/?ordering=zzz').status_code, 400)
+        theirs = Bookshelf.objects.get(name='Theirs')
+        self.assertEqual(self.client.get(f'/api/bookshelves/{theirs.pk}/books/').status_code, 404)
@@ -0,0 +1,103 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from bookly_app import authors, cards, jobs, tasks
+from bookly_app.models import Author, Book, BookCard, Bookshelf, Genre, Review
+
+
+@override_settings(JOBS_RUN_INLINE=False)
+class BookCardTests(TestCase):
+    def setUp(self):
+        authors._cache.clear()
+        self.addCleanup(authors._cache.clear)
+        self.user = User.objects.create_user('reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.author = Author.objects.create(name='Frank Herbert')
+        self.book = Book.objects.create(title='Dune', author=self.author)
+
+    def card(self, book=None):
+        return json.loads(BookCard.objects.get(pk=(book or self.book).pk).data)
+
+    def test_card_follows_genres_and_author(self):
+        response = self.client.post('/api/books/', {'title': 'Children of Dune', 'author': 'frank herbert'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.card(Book.objects.get(pk=response.json()['id']))['author_name'], 'Frank Herbert')
+
+        sf = Genre.objects.create(name='SF')
+        adventure = Genre.objects.create(name='Adventure')
+        self.book.genres.add(sf, adventure)
+        self.assertEqual(self.card()['genres'], ['Adventure', 'SF'])
+        sf.name = 'Sci-Fi'
+        sf.save()
+        self.assertEqual(self.card()['genres'], ['Adventure', 'Sci-Fi'])
+        adventure.delete()
+        self.assertEqual(self.card()['genres'], ['Sci-Fi'])
+        sf.books.clear()
+        self.assertEqual(self.card()['genres'], [])
+
+        self.author.name = 'F. Herbert'
+        self.author.save()
+        self.assertEqual(self.card()['author_name'], 'F. Herbert')
+
+    def test_card_follows_rating(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(book=self.book, user=self.user, title='t', content='c', rating=4)
+        for job_id in jobs.claim('worker', 10):
+            jobs.run(job_id)
+        self.assertEqual((self.card()['average_rating'], self.card()['rating_count']), (4.0, 1))
+
+    def test_card_follows_cover(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(MEDIA_ROOT=os.path.join(root, 'media'), COVER_MAX_SIZE=(100, 100))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        path = os.path.join(root, 'cover.png')
+        Image.new('RGB', (200, 300), 'red').save(path, 'PNG')
+
+        tasks.attach_cover_file(self.book.pk, path)
+        self.book.refresh_from_db()
+        # Scaled down and re-encoded; the card points at the final file
+        self.assertTrue(self.book.cover_image.name.endswith('.jpg'))
+        self.assertEqual(self.card()['cover_image'], self.book.cover_image.url)
+
+    def test_card_listings(self):
+        for i in range(12):
+            Book.objects.create(title=f'Book {i}', author=self.author)
+        with self.assertNumQueries(2):
+            body = json.loads(self.client.get('/api/books/cards/?search=Book 1').content)
+        self.assertEqual(sorted(card['title'] for card in body['results']), ['Book 1', 'Book 10', 'Book 11'])
+        body = json.loads(self.client.get('/api/books/cards/').content)
+        self.assertEqual(body['count'], 13)
+        self.assertIsNotNone(body['next'])
+
+        shelf = Bookshelf.objects.create(name='Shelf', user=self.user)
+        shelf.books.add(self.book, *Book.objects.filter(title__in=['Book 1', 'Book 2']))
+        body = json.loads(self.client.get(f'/api/bookshelves/{shelf.pk}/cards/?ordering=-title').content)
+        self.assertEqual([card['title'] for card in body['results']], ['Dune', 'Book 2', 'Book 1'])
+        self.assertEqual(self.client.get(f'/api/bookshelves/{shelf.pk}/cards/?ordering=zzz').status_code, 400)
+
+    def test_check_and_fix(self):
+        other = Book.objects.create(title='Dune Messiah', author=self.author)
+        self.assertEqual(cards.check(), (2, 0, 0))
+        BookCard.objects.filter(pk=self.book.pk).update(title='Wrong')
+        BookCard.objects.filter(pk=other.pk).delete()
+        self.assertEqual(cards.check(batch_size=1), (2, 1, 1))
+        with self.assertRaises(CommandError):
+            call_command('check_book_cards', stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('check_book_cards', '--fix', stdout=out)
+        self.assertIn('1 missing, 1 outdated, all rewritten', out.getvalue())
+        self.assertEqual(cards.check(), (2, 0, 0))
+        self.assertEqual(self.card()['title'], 'Dune')
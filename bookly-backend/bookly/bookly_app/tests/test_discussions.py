@@ -0,0 +1,66 @@
+import datetime
+import io
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from bookly_app.models import Author, Book, Comment, Discussion
+
+
+class DiscussionCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        self.author = Author.objects.create(name='Author')
+        self.book = Book.objects.create(title='Book', author=self.author)
+        self.on_book = Discussion.objects.create(title='On the book', created_by=self.user, content='c', book=self.book)
+        self.on_author = Discussion.objects.create(title='On the author', created_by=self.user, content='c',
+                                                   author=self.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_comments_keep_counters(self):
+        first = Comment.objects.create(discussion=self.on_book, user=self.user, content='x')
+        last = Comment.objects.create(discussion=self.on_book, user=self.user, content='y')
+        self.on_book.refresh_from_db()
+        self.assertEqual(self.on_book.comment_count, 2)
+        self.assertEqual(self.on_book.last_activity_at, last.created_at)
+
+        # Removing the latest comment falls back to the one before it
+        last.delete()
+        self.on_book.refresh_from_db()
+        self.assertEqual(self.on_book.comment_count, 1)
+        self.assertEqual(self.on_book.last_activity_at, first.created_at)
+
+    def test_index_orders_and_filters(self):
+        Comment.objects.create(discussion=self.on_book, user=self.user, content='x')
+        Comment.objects.create(discussion=self.on_author, user=self.user, content='z')
+        results = self.client.get('/api/discussions/').json()['results']
+        self.assertEqual([(d['title'], d['comment_count']) for d in results],
+                         [('On the author', 1), ('On the book', 1)])
+        results = self.client.get('/api/discussions/?ordering=newest').json()['results']
+        self.assertEqual([d['title'] for d in results], ['On the author', 'On the book'])
+        self.assertEqual(self.client.get(f'/api/discussions/?book={self.book.pk}').json()['count'], 1)
+        self.assertEqual(self.client.get(f'/api/discussions/?author={self.author.pk}').json()['count'], 1)
+        self.assertEqual(self.client.get('/api/discussions/?ordering=x').status_code, 400)
+
+    def test_counters_are_read_only(self):
+        response = self.client.patch(f'/api/discussions/{self.on_book.pk}/', {'comment_count': 50}, format='json')
+        self.assertEqual(response.json()['comment_count'], 0)
+
+    def test_repair(self):
+        Comment.objects.create(discussion=self.on_book, user=self.user, content='x')
+        Discussion.objects.update(comment_count=9, last_activity_at=timezone.now() + datetime.timedelta(days=1))
+        out = io.StringIO()
+        call_command('repair_discussion_counters', '--batch-size', '1', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Repaired 2 discussion(s)')
+        counts = dict(Discussion.objects.values_list('id', 'comment_count'))
+        self.assertEqual(counts, {self.on_book.pk: 1, self.on_author.pk: 0})
+        self.on_author.refresh_from_db()
+        self.assertEqual(self.on_author.last_activity_at, self.on_author.created_at)
+
+        out = io.StringIO()
+        call_command('repair_discussion_counters', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Repaired 0 discussion(s)')
@@ -0,0 +1,62 @@
+import datetime
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from bookly_app.models import Author, Book, Genre
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.ann = Author.objects.create(name='Ann')
+        self.bob = Author.objects.create(name='Bob')
+        self.fantasy = Genre.objects.create(name='Fantasy')
+        self.sf = Genre.objects.create(name='SF')
+        # Published 1985, 1988, ... 2000; rated 0.0, 0.9, ... 4.5 by 0..5 readers
+        for i in range(6):
+            book = Book.objects.create(title=f'Book {i}', author=self.ann if i % 2 else self.bob,
+                                       publication_date=datetime.date(1985 + i * 3, 1, 1),
+                                       rating_count=i, rating_avg=i * 0.9)
+            book.genres.add(self.fantasy)
+            if i < 2:
+                book.genres.add(self.sf)
+        self.client = APIClient()
+
+    def counts(self, facets):
+        return {facet: {entry['value']: entry['count'] for entry in entries} for facet, entries in facets.items()}
+
+    def test_catalog_facets(self):
+        response = self.client.get('/api/books/?facets=1').json()
+        self.assertEqual(response['count'], 6)
+        self.assertEqual(self.counts(response['facets']), {
+            'genre': {self.fantasy.pk: 6, self.sf.pk: 2},
+            'author': {self.ann.pk: 3, self.bob.pk: 3},
+            'decade': {1980: 2, 1990: 3, 2000: 1},
+            # The unrated book has no bucket
+            'rating': {0: 1, 1: 1, 2: 1, 3: 1, 4: 1},
+        })
+        self.assertEqual(response['facets']['decade'][0]['label'], '2000s')
+        with self.assertNumQueries(0):
+            self.client.get('/api/books/facets/')
+
+    def test_filters_narrow_listing_and_counts(self):
+        response = self.client.get(f'/api/books/?facets=1&genre={self.sf.pk}&decade=1980').json()
+        self.assertEqual(response['count'], 2)
+        self.assertEqual(self.counts(response['facets'])['author'], {self.ann.pk: 1, self.bob.pk: 1})
+
+        # Values of one facet are OR-ed, different facets AND-ed
+        titles = [book['title'] for book in self.client.get('/api/books/?rating=0,4&decade=1990,2000').json()['results']]
+        self.assertEqual(sorted(titles), ['Book 5'])
+        facets = self.client.get(f'/api/books/facets/?author={self.ann.pk}&decade=0').json()
+        self.assertEqual(self.counts(facets)['author'], {})
+
+    def test_bad_values_are_rejected(self):
+        for query in ('genre=x', 'genre=0', 'decade=9990', 'decade=10000', 'rating=6',
+                      'author=99999999999999999999'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/books/?{query}').status_code, 400)
+                self.assertEqual(self.client.get(f'/api/books/facets/?{query}').status_code, 400)
+        self.assertEqual(self.client.get('/api/books/?decade=9980').status_code, 200)
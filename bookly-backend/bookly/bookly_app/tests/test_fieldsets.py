@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from bookly_app.models import Author, Book, Genre
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(name='Author', bio='Bio')
+        genre = Genre.objects.create(name='Fantasy')
+        for i in range(3):
+            Book.objects.create(title=f'Book {i}', author=self.author, description='Long text').genres.add(genre)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader'))
+
+    def test_fields_keeps_only_the_listed_fields(self):
+        response = self.client.get('/api/books/?fields=id,title')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+        response = self.client.get('/api/users/me/?fields=username')
+        self.assertEqual(response.json(), {'username': 'reader'})
+
+    def test_expand_nests_the_related_object(self):
+        book = Book.objects.first()
+        response = self.client.get(f'/api/books/{book.pk}/?fields=id,author&expand=author')
+        self.assertEqual(response.json()['author']['name'], 'Author')
+        self.assertEqual(response.json()['author']['bio'], 'Bio')
+        self.assertEqual(self.client.get(f'/api/books/{book.pk}/').json()['author'], self.author.pk)
+
+    def test_unused_relations_and_columns_are_not_loaded(self):
+        with CaptureQueriesContext(connection) as full:
+            self.client.get('/api/books/')
+        with CaptureQueriesContext(connection) as sparse:
+            self.client.get('/api/books/?fields=id,title')
+        self.assertLess(len(sparse), len(full))
+        book_query = sparse.captured_queries[-1]['sql']
+        self.assertNotIn('description', book_query)
+        self.assertNotIn('bookly_app_genre', ' '.join(query['sql'] for query in sparse.captured_queries))
+
+    def test_writes_ignore_the_fields_parameter(self):
+        response = self.client.post('/api/genres/?fields=id', {'name': 'Horror'}, format='json')
+        self.assertEqual(response.json()['name'], 'Horror')
@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from bookly_app import jobs
+from bookly_app.models import Author, Book, Bookshelf, ImportJob, Review
+
+GOODREADS_CSV = '''Book Id,Title,Author,ISBN,ISBN13,My Rating,My Review,Bookshelves,Exclusive Shelf
+1,Dune,Frank Herbert,"=""""","=""9780441013593""",5,Great,"favorites, scifi",read
+2,hobbit,j.r.r. tolkien,,,4,,,read
+3,Missing,Nobody,,,2,,,read
+4,Dune,Frank Herbert,,,x,,,read
+'''
+
+
+@override_settings(JOBS_RUN_INLINE=False)
+class ImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.real_imports = os.path.join(settings.PRIVATE_MEDIA_ROOT, 'imports')
+        self.real_files = self.listing(self.real_imports)
+        self.private_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.private_root)
+        private = override_settings(PRIVATE_MEDIA_ROOT=self.private_root)
+        private.enable()
+        self.addCleanup(private.disable)
+
+        self.user = User.objects.create_user('reader')
+        self.dune = Book.objects.create(title='Dune', author=Author.objects.create(name='Frank Herbert'),
+                                        isbn='9780441013593')
+        self.hobbit = Book.objects.create(title='The Hobbit', author=Author.objects.create(name='J.R.R. Tolkien'))
+        Book.objects.create(title='Hobbit', author=self.hobbit.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def listing(self, path):
+        return set(os.listdir(path)) if os.path.isdir(path) else set()
+
+    def upload(self, name, content):
+        return self.client.post('/api/imports/', {'file': SimpleUploadedFile(name, content.encode())}, format='multipart')
+
+    def test_goodreads_export_is_upserted(self):
+        Review.objects.create(book=self.dune, user=self.user, title='Old', content='Old text', rating=1)
+        response = self.upload('goodreads.csv', GOODREADS_CSV)
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertEqual(body['status'], 'DONE')
+        self.assertEqual((body['reviews_created'], body['reviews_updated'], body['unmatched']), (1, 1, 1))
+        self.assertEqual(sorted(error['row'] for error in body['errors']), [3, 4])
+
+        self.assertEqual(Review.objects.get(book=self.dune).rating, 5)
+        self.assertEqual(Review.objects.get(book__title='Hobbit').rating, 4)
+        self.assertEqual(set(Bookshelf.objects.filter(user=self.user).values_list('name', 'books__title')),
+                         {('favorites', 'Dune'), ('scifi', 'Dune'), ('read', 'Dune'), ('read', 'Hobbit')})
+        self.dune.refresh_from_db()
+        self.assertEqual((self.dune.rating_count, self.dune.average_rating), (1, 5))
+
+        # Importing again changes nothing
+        body = self.upload('goodreads.csv', GOODREADS_CSV).json()
+        self.assertEqual((body['reviews_created'], body['reviews_updated'], body['shelved']), (0, 2, 0))
+        self.assertEqual(Review.objects.filter(user=self.user).count(), 2)
+
+    def test_bad_ratings_fail_only_their_row(self):
+        content = 'title,author,rating\nDune,Frank Herbert,inf\nDune,Frank Herbert,1e400\nDune,Frank Herbert,6\nDune,Frank Herbert,0\n'
+        body = self.upload('ratings.csv', content).json()
+        self.assertEqual(body['status'], 'DONE')
+        self.assertEqual([error['row'] for error in body['errors']], [1, 2, 3])
+        self.assertIn('outside 0-5', body['errors'][2]['error'])
+        # A 0 rating shelves nothing and rates nothing, but isn't an error
+        self.assertFalse(Review.objects.exists())
+
+    def test_json_overflowing_rating(self):
+        body = self.upload('ratings.json', '[{"isbn": "9780441013593", "rating": 1e400}]').json()
+        self.assertEqual(body['status'], 'DONE')
+        self.assertEqual(body['errors'][0]['error'], "Invalid rating 'inf'.")
+
+    def test_malformed_files(self):
+        self.assertEqual(self.upload('notes.txt', 'a').status_code, 400)
+        body = self.upload('ratings.json', '{"a": 1}').json()
+        self.assertEqual((body['status'], body['errors'][0]['error']),
+                         ('FAILED', 'A JSON import must be a list of objects.'))
+
+    @override_settings(IMPORT_SYNC_MAX_BYTES=100)
+    def test_large_files_are_imported_by_a_job(self):
+        data = [{'isbn': '9780441013593', 'rating': 2, 'shelves': ['a']}] * 50
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload('ratings.json', json.dumps(data))
+        self.assertEqual((response.status_code, response.json()['status']), (202, 'PENDING'))
+        for job_id in jobs.claim('worker', 10):
+            jobs.run(job_id)
+        body = self.client.get(f"/api/imports/{response.json()['id']}/").json()
+        self.assertEqual((body['status'], body['processed_rows'], body['reviews_created']), ('DONE', 50, 1))
+        self.assertEqual(ImportJob.objects.get().total_rows, 50)
+
+    def test_uploads_stay_in_the_private_root(self):
+        self.upload('goodreads.csv', GOODREADS_CSV)
+        path = ImportJob.objects.get().file.path
+        self.assertTrue(path.startswith(os.path.join(self.private_root, 'imports', '')), path)
+        self.assertEqual(self.listing(self.real_imports), self.real_files)
@@ -0,0 +1,64 @@
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from bookly_app.isbn import to_isbn13
+from bookly_app.models import Author, Book
+
+
+class ToIsbn13Tests(SimpleTestCase):
+    def test_notations(self):
+        for value in ('0-345-39180-2', '978-0-345-39180-3', '="9780345391803"', '0345391802'):
+            with self.subTest(value=value):
+                self.assertEqual(to_isbn13(value), '9780345391803')
+        self.assertEqual(to_isbn13('080442957X'), '9780804429573')
+
+    def test_invalid(self):
+        # Wrong check digit, not an ISBN, nothing at all
+        for value in ('0345391801', 'abc', '12345', '', None):
+            with self.subTest(value=value):
+                self.assertIsNone(to_isbn13(value))
+
+
+class IsbnApiTests(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(name='Author')
+        self.book = Book.objects.create(title='Hitchhiker', author=self.author, isbn='0-345-39180-2')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader'))
+
+    def create(self, isbn):
+        return self.client.post('/api/books/', {'title': 'New', 'author': self.author.pk, 'isbn': isbn}, format='json')
+
+    def test_isbn13_is_kept_unique(self):
+        self.assertEqual(self.book.isbn13, '9780345391803')
+        response = self.create('978-0-345-39180-3')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'isbn': ['A book with this ISBN already exists.']})
+        self.assertEqual(self.create('12345').status_code, 400)
+        response = self.create('080442957X')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Book.objects.get(pk=response.json()['id']).isbn13, '9780804429573')
+        # Saving a book doesn't clash with its own ISBN
+        response = self.client.patch(f'/api/books/{self.book.pk}/', {'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_search_by_any_notation(self):
+        Book.objects.create(title='0345391802 and other numbers', author=self.author)
+        results = self.client.get('/api/books/?search=978-0345391803').json()['results']
+        self.assertEqual([book['id'] for book in results], [self.book.pk])
+
+    def test_lookup_answers_in_request_order(self):
+        isbns = ['0345391802', 'junk', '9780804429573'] + ['9780000000002'] * 100
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/books/isbn-lookup/', {'isbns': isbns}, format='json')
+        body = response.json()
+        self.assertEqual(body['found'], 1)
+        self.assertEqual(len(body['results']), len(isbns))
+        self.assertEqual(body['results'][0]['book']['id'], self.book.pk)
+        self.assertEqual(body['results'][1], {'isbn': 'junk', 'isbn13': None, 'book': None})
+        self.assertIsNone(body['results'][2]['book'])
+
+    def test_lookup_size_is_limited(self):
+        response = self.client.post('/api/books/isbn-lookup/', {'isbns': ['1'] * 6000}, format='json')
+        self.assertEqual(response.status_code, 400)
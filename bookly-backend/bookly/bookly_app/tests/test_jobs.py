@@ -0,0 +1,140 @@
+import datetime
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from bookly_app import jobs
+from bookly_app.models import Author, Book, Job, Review
+
+
+@jobs.task(name='tests.flaky', max_attempts=2)
+def flaky():
+    raise RuntimeError('boom')
+
+
+# These tests run the queued jobs themselves, as a worker would
+@override_settings(JOBS_RUN_INLINE=False)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        self.book = Book.objects.create(title='Book', author=Author.objects.create(name='Author'))
+
+    def review(self, rating, user=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Review.objects.create(book=self.book, user=user or self.user, title='t', content='c', rating=rating)
+
+    def run_due_jobs(self):
+        # In this thread: run_jobs' worker threads can't see the test transaction
+        for job_id in jobs.claim('worker', 100):
+            jobs.run(job_id)
+
+    def test_rating_recompute_runs_in_the_worker(self):
+        self.review(4)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.rating_count, 0)
+        self.run_due_jobs()
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_count, self.book.average_rating), (1, 4))
+
+    def test_moving_a_review_recomputes_both_books(self):
+        other = Book.objects.create(title='Other', author=self.book.author)
+        self.review(4)
+        self.run_due_jobs()
+        review = Review.objects.get()
+        review.book = other
+        with self.captureOnCommitCallbacks(execute=True):
+            review.save()
+        self.run_due_jobs()
+        self.book.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.book.rating_count, self.book.rating_avg), (0, 0))
+        self.assertEqual((other.rating_count, other.average_rating), (1, 4))
+        self.assertEqual(json.loads(self.book.card.data)['rating_count'], 0)
+
+    def test_pending_rating_recomputes_are_merged(self):
+        for i in range(3):
+            self.review(i + 1, user=User.objects.create_user(f'reader{i}'))
+        self.assertEqual(Job.objects.filter(task='recompute_book_rating', status='QUEUED').count(), 1)
+
+    def test_a_change_during_a_run_queues_a_new_recompute(self):
+        self.review(4)
+        job = Job.objects.get(task='recompute_book_rating')
+        self.run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.idempotency_key), ('DONE', None))
+        self.review(2, user=User.objects.create_user('other'))
+        self.assertEqual(Job.objects.filter(task='recompute_book_rating', status='QUEUED').count(), 1)
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_inline_mode_runs_jobs_without_a_worker(self):
+        self.review(5)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.rating_count, 1)
+        self.assertFalse(Job.objects.exists())
+
+    def test_idempotency_keys(self):
+        first = jobs.enqueue('recompute_book_rating', self.book.pk, idempotency_key='key')
+        self.assertEqual(jobs.enqueue('recompute_book_rating', self.book.pk, idempotency_key='key'), first)
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        job = jobs.enqueue('tests.flaky')
+        self.assertEqual(jobs.claim('worker', 5), [job.id])
+        self.assertEqual(jobs.claim('worker', 5), [])
+        self.assertFalse(jobs.run(job.id))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('QUEUED', 1))
+        self.assertGreater(job.run_at, timezone.now())
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.claim('worker', 5)
+        jobs.run(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertIn('RuntimeError: boom', job.last_error)
+
+    def test_stale_running_jobs_are_requeued(self):
+        job = jobs.enqueue('tests.flaky')
+        jobs.claim('worker', 1)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('QUEUED', 1))
+
+        # The lost run was the last attempt
+        jobs.claim('worker', 1)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('FAILED', 2))
+        self.assertEqual(job.last_error, 'The worker running this job was lost.')
+
+    def test_heartbeats_keep_long_jobs_from_being_requeued(self):
+        job = jobs.enqueue('tests.flaky')
+        jobs.claim('worker', 1)
+        other = jobs.enqueue('tests.flaky')
+        jobs.claim('other-worker', 1)
+        Job.objects.update(locked_at=timezone.now() - datetime.timedelta(seconds=599))
+        self.assertEqual(jobs.heartbeat('worker'), 1)
+        with mock.patch.object(jobs.timezone, 'now', return_value=timezone.now() + datetime.timedelta(seconds=2)):
+            self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'RUNNING')
+        self.assertEqual(Job.objects.get(pk=other.pk).status, 'QUEUED')
+
+    def test_periodic_jobs_are_queued_once_per_slot(self):
+        now = timezone.now()
+        jobs.enqueue_periodic(now)
+        jobs._periodic_slots.clear()
+        jobs.enqueue_periodic(now)
+        self.assertEqual(Job.objects.filter(task='purge_finished_jobs').count(), 1)
+
+    def test_finished_jobs_are_purged_after_their_retention(self):
+        now = timezone.now()
+        old, recent = now - datetime.timedelta(days=10), now - datetime.timedelta(days=1)
+        for status, finished_at in (('DONE', old), ('DONE', recent), ('FAILED', old),
+                                    ('FAILED', now - datetime.timedelta(days=40)), ('QUEUED', None)):
+            Job.objects.create(task='tests.flaky', status=status, finished_at=finished_at)
+        self.assertEqual(jobs.purge_finished(now), 2)
+        self.assertEqual(sorted(Job.objects.values_list('status', flat=True)), ['DONE', 'FAILED', 'QUEUED'])
@@ -0,0 +1,83 @@
+import json
+import logging
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from bookly_app.log import JSONFormatter, QueueListenerHandler, RequestIDFilter, SamplingFilter, request_id
+from bookly_app.metrics import LOG_RECORDS_DROPPED
+
+
+class RequestIDTests(TestCase):
+    def test_request_id_is_echoed_or_generated(self):
+        self.client.force_login(User.objects.create_user('reader'))
+        self.assertEqual(self.client.get('/api/genres/', HTTP_X_REQUEST_ID='abc123')['X-Request-ID'], 'abc123')
+        self.assertRegex(self.client.get('/api/genres/')['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+
+class FormattingTests(SimpleTestCase):
+    def record(self, level=logging.INFO, **extra):
+        record = logging.getLogger('bookly_app.tests').makeRecord(
+            'bookly_app.tests', level, __file__, 1, 'Imported %d rows', (3,), None, extra=extra,
+        )
+        RequestIDFilter().filter(record)
+        return record
+
+    def test_records_are_json_with_extras_and_request_id(self):
+        token = request_id.set('req-1')
+        try:
+            data = json.loads(JSONFormatter().format(self.record(user_id=7)))
+        finally:
+            request_id.reset(token)
+        self.assertEqual((data['message'], data['request_id'], data['user_id']), ('Imported 3 rows', 'req-1', 7))
+
+    def test_sampling_only_drops_low_levels(self):
+        sampler = SamplingFilter(rate=0)
+        self.assertFalse(sampler.filter(self.record(logging.DEBUG)))
+        self.assertTrue(sampler.filter(self.record(logging.WARNING)))
+
+
+class QueueListenerHandlerTests(SimpleTestCase):
+    def record(self):
+        return logging.makeLogRecord({'msg': 'hello', 'levelno': logging.INFO})
+
+    def handler(self, **kwargs):
+        handler = QueueListenerHandler('logging.NullHandler', **kwargs)
+        self.addCleanup(handler._stop)
+        return handler
+
+    def test_listener_starts_with_the_first_record_of_each_process(self):
+        handler = self.handler()
+        self.assertIsNone(handler.listener)
+        handler.handle(self.record())
+        listener, records = handler.listener, handler.queue
+        handler.handle(self.record())
+        self.assertIs(handler.listener, listener)
+
+        # A worker forked after logging was configured gets its own thread and queue
+        with mock.patch('bookly_app.log.os.getpid', return_value=-1):
+            handler.handle(self.record())
+            self.assertIsNot(handler.listener, listener)
+            self.assertIsNot(handler.queue, records)
+            handler._stop()
+        listener.stop()
+
+    def test_dropped_records_are_counted_in_metrics(self):
+        handler = self.handler(queue_size=1)
+        before = LOG_RECORDS_DROPPED._value.get()
+        with mock.patch('bookly_app.log.QueueListener.start'):
+            for _ in range(3):
+                handler.handle(self.record())
+        handler._pid = None  # Never started, so there is nothing to stop
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(LOG_RECORDS_DROPPED._value.get() - before, 2)
+
+
+@override_settings(DEBUG=False, ADMINS=[('Ops', 'ops@example.com')])
+class ErrorReportingTests(SimpleTestCase):
+    def test_server_errors_are_still_mailed_to_admins(self):
+        logging.getLogger('django.request').error('Internal Server Error: /api/books/')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Internal Server Error', mail.outbox[0].subject)
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+from urllib.parse import quote, unquote
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+
+from bookly_app.models import Author, Book
+
+CONTENT = b'0123456789' * 10
+
+
+class MediaTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.book = Book.objects.create(title='Book', author=Author.objects.create(name='Author'))
+        self.book.cover_image.save('Cover.JPG', ContentFile(CONTENT))
+        self.url = '/media/' + self.book.cover_image.name
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_files_are_stored_once_under_their_content_hash(self):
+        self.assertRegex(self.book.cover_image.name, r'^book_covers/Cover\.[0-9a-f]{12}\.jpg$')
+        self.assertEqual(default_storage.save('book_covers/Cover.JPG', ContentFile(CONTENT)), self.book.cover_image.name)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'book_covers'))), 1)
+
+    def test_hashed_files_are_cached_and_revalidated(self):
+        response = self.client.get(self.url)
+        self.assertEqual(self.body(response), CONTENT)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.head(self.url)['Content-Length'], '100')
+
+    def test_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5-14')
+        self.assertEqual((response.status_code, response['Content-Range']), (206, 'bytes 5-14/100'))
+        self.assertEqual(self.body(response), b'5678901234')
+        self.assertEqual(self.body(self.client.get(self.url, HTTP_RANGE='bytes=-3')), b'789')
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=500-').status_code, 416)
+        # A stale If-Range gets the whole file
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=5-14', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_missing_files_and_paths_outside_media(self):
+        self.assertEqual(self.client.get('/media/nope.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+    def test_proxy_offload(self):
+        with self.settings(MEDIA_SERVE_MODE='x-accel'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.book.cover_image.name)
+
+    def test_proxy_offload_of_non_ascii_names(self):
+        name = default_storage.save('book_covers/Мастер и Маргарита.jpg', ContentFile(CONTENT))
+        url = '/media/' + quote(name)
+        with self.settings(MEDIA_SERVE_MODE='x-accel'):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + quote(name))
+        with self.settings(MEDIA_SERVE_MODE='x-sendfile'):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(unquote(response['X-Sendfile']), os.path.join(self.media_root, name))
@@ -0,0 +1,58 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+
+from bookly_app.models import Author, Book
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        Book.objects.create(title='Book', author=Author.objects.create(name='Author'))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader'))
+
+    def test_requests_are_recorded_per_view_and_action(self):
+        labels = {'view': 'BookViewSet', 'action': 'list'}
+        before = {
+            name: sample(name, **labels)
+            for name in ('bookly_request_duration_seconds_count', 'bookly_db_queries_per_request_sum',
+                         'bookly_view_python_seconds_per_request_count')
+        }
+        responses = sample('bookly_responses_total', status='200', **labels)
+        self.client.get('/api/books/')
+
+        self.assertEqual(sample('bookly_request_duration_seconds_count', **labels),
+                         before['bookly_request_duration_seconds_count'] + 1)
+        self.assertEqual(sample('bookly_responses_total', status='200', **labels), responses + 1)
+        self.assertGreater(sample('bookly_db_queries_per_request_sum', **labels),
+                           before['bookly_db_queries_per_request_sum'])
+        self.assertEqual(sample('bookly_view_python_seconds_per_request_count', **labels),
+                         before['bookly_view_python_seconds_per_request_count'] + 1)
+
+    def test_view_time_covers_serializers_without_the_fields_mixin(self):
+        labels = {'view': 'UserViewSet', 'action': 'me_stats'}
+        before = sample('bookly_view_python_seconds_per_request_count', **labels)
+        self.client.get('/api/users/me/stats/')
+        self.assertEqual(sample('bookly_view_python_seconds_per_request_count', **labels), before + 1)
+
+    def test_scraping_is_closed_by_default(self):
+        # Behind the local proxy every request comes from 127.0.0.1
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_scraping_with_the_token(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertIn(b'bookly_request_duration_seconds_bucket', response.content)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Basic s3cret').status_code, 403)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_scraping_from_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
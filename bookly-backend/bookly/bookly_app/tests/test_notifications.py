@@ -0,0 +1,72 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from bookly_app import jobs
+from bookly_app.models import (
+    Author, Book, Bookshelf, Comment, Discussion, ExchangeOffer, ExchangeRequest, Notification, Review,
+)
+
+
+@override_settings(JOBS_RUN_INLINE=False)
+class NotificationTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.critic = User.objects.create_user('critic')
+        self.trader = User.objects.create_user('trader')
+        self.book = Book.objects.create(title='Book', author=Author.objects.create(name='Author'))
+        for user in (self.reader, self.critic, self.trader):
+            Bookshelf.objects.create(user=user, name='Shelf').books.add(self.book)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def review(self, user, rating):
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(book=self.book, user=user, rating=rating, title='t', content='c')
+        for job_id in jobs.claim('worker', 10):
+            jobs.run(job_id)
+
+    def test_feed_pages_and_marks_read(self):
+        discussion = Discussion.objects.create(book=self.book, title='Talk', created_by=self.reader)
+        Comment.objects.create(discussion=discussion, user=self.critic, content='Hi')
+        offer = ExchangeOffer.objects.create(book=self.book, owner=self.reader, condition='Good', exchange_type='SELL')
+        ExchangeRequest.objects.create(offer=offer, requester=self.trader)
+        self.review(self.critic, 4)
+
+        first = self.client.get('/api/notifications/?limit=2').json()
+        self.assertEqual(first['unread_count'], 3)
+        self.assertEqual([n['verb'] for n in first['results']], ['review', 'exchange_request'])
+        rest = self.client.get(f"/api/notifications/?before={first['next_before']}").json()
+        self.assertEqual([n['verb'] for n in rest['results']], ['comment'])
+        self.assertIsNone(rest['next_before'])
+
+        marked = self.client.post('/api/notifications/mark-read/', {'ids': [first['results'][0]['id']]},
+                                  format='json').json()
+        self.assertEqual(marked, {'marked': 1, 'unread_count': 2})
+        marked = self.client.post('/api/notifications/mark-read/', {'all': True}, format='json').json()
+        self.assertEqual(marked, {'marked': 2, 'unread_count': 0})
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/notifications/?before=x').status_code, 400)
+        response = self.client.post('/api/notifications/mark-read/', {'ids': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(NOTIFICATION_FANOUT_LIMIT=1)
+    def test_popular_book_broadcasts(self):
+        # New inboxes start with the existing broadcasts read, so open this one first
+        self.client.get('/api/notifications/unread-count/')
+        self.review(self.critic, 2)
+        broadcast = Notification.objects.get()
+        self.assertIsNone(broadcast.recipient_id)
+
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').json(), {'unread_count': 1})
+        feed = self.client.get('/api/notifications/').json()
+        self.assertEqual([n['id'] for n in feed['results']], [broadcast.pk])
+        # The author of the review isn't told about it
+        critic = APIClient()
+        critic.force_authenticate(self.critic)
+        self.assertEqual(critic.get('/api/notifications/unread-count/').json(), {'unread_count': 0})
+
+        marked = self.client.post('/api/notifications/mark-read/', {'all': True}, format='json').json()
+        self.assertEqual(marked, {'marked': 1, 'unread_count': 0})
+        self.assertTrue(self.client.get('/api/notifications/').json()['results'][0]['is_read'])
@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from bookly_app.models import (
+    Author, Book, Bookshelf, Comment, Discussion, ExchangeOffer, ExchangeRequest, Review, SupportTicket, TicketReply,
+)
+
+
+class RowAccessTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.other = User.objects.create_user('other')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.book = Book.objects.create(title='Book', author=Author.objects.create(name='Author'))
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_reviews(self):
+        review = Review.objects.create(book=self.book, user=self.owner, rating=4, title='t', content='c')
+        url = f'/api/reviews/{review.pk}/'
+        other = self.client_for(self.other)
+        self.assertEqual(other.get(url).status_code, 200)
+        # ?book= used to let anybody edit any review of the book
+        self.assertEqual(other.patch(f'{url}?book={self.book.pk}', {'rating': 1}, format='json').status_code, 404)
+        self.assertEqual(other.delete(url).status_code, 404)
+        self.assertEqual(self.client_for(self.owner).patch(url, {'rating': 3}, format='json').status_code, 200)
+        self.assertEqual(self.client_for(self.staff).patch(url, {'rating': 2}, format='json').status_code, 200)
+        self.assertEqual(Review.objects.get().rating, 2)
+
+    def test_exchange_requests_are_seen_by_both_sides_only(self):
+        offer = ExchangeOffer.objects.create(book=self.book, owner=self.owner, condition='Good', exchange_type='SELL')
+        request = ExchangeRequest.objects.create(offer=offer, requester=self.other)
+        outsider = self.client_for(User.objects.create_user('outsider'))
+        self.assertEqual(self.client_for(self.owner).get('/api/exchange-requests/').json()['count'], 1)
+        self.assertEqual(self.client_for(self.other).get('/api/exchange-requests/').json()['count'], 1)
+        self.assertEqual(outsider.get('/api/exchange-requests/').json()['count'], 0)
+        self.assertEqual(outsider.get(f'/api/exchange-requests/{request.pk}/').status_code, 404)
+        # The visibility rule is one query, not a load-then-check
+        owner = self.client_for(self.owner)
+        with self.assertNumQueries(1):
+            self.assertEqual(owner.get(f'/api/exchange-requests/{request.pk}/').status_code, 200)
+        response = owner.patch(f'/api/exchange-requests/{request.pk}/', {'status': 'ACCEPTED'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_tickets_and_replies(self):
+        ticket = SupportTicket.objects.create(user=self.owner, subject='Help', message='m')
+        reply = TicketReply.objects.create(ticket=ticket, user=self.staff, message='Hi')
+        owner, other = self.client_for(self.owner), self.client_for(self.other)
+        self.assertEqual(other.get(f'/api/support-tickets/{ticket.pk}/').status_code, 404)
+        self.assertEqual(other.get(f'/api/support-tickets/{ticket.pk}/thread/').status_code, 404)
+        self.assertEqual(owner.get(f'/api/support-tickets/{ticket.pk}/thread/').status_code, 200)
+        self.assertEqual(owner.get('/api/ticket-replies/').json()['count'], 1)
+        self.assertEqual(other.get('/api/ticket-replies/').json()['count'], 0)
+        # The ticket's owner reads the staff reply but may not change it
+        self.assertEqual(owner.patch(f'/api/ticket-replies/{reply.pk}/', {'message': 'x'}, format='json').status_code,
+                         404)
+
+    def test_discussions_and_comments(self):
+        discussion = Discussion.objects.create(title='Talk', created_by=self.owner, content='c', book=self.book)
+        comment = Comment.objects.create(discussion=discussion, user=self.owner, content='c')
+        other = self.client_for(self.other)
+        self.assertEqual(other.get(f'/api/discussions/{discussion.pk}/').status_code, 200)
+        self.assertEqual(other.post(f'/api/comments/{comment.pk}/like/').status_code, 200)
+        self.assertEqual(other.delete(f'/api/comments/{comment.pk}/').status_code, 404)
+        response = other.patch(f'/api/discussions/{discussion.pk}/', {'title': 'Mine'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(Comment.objects.filter(pk=comment.pk).exists())
+
+    def test_bookshelves_are_private(self):
+        shelf = Bookshelf.objects.create(user=self.owner, name='Shelf')
+        self.assertEqual(self.client_for(self.owner).get(f'/api/bookshelves/{shelf.pk}/').status_code, 200)
+        self.assertEqual(self.client_for(self.other).get(f'/api/bookshelves/{shelf.pk}/').status_code, 404)
+        self.assertEqual(self.client_for(self.staff).get(f'/api/bookshelves/{shelf.pk}/').status_code, 404)
@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from bookly_app.models import Author, Book, RequestProfile
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        settings = override_settings(PROFILING_DIR=self.profile_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.staff = User.objects.create_user('staff', is_staff=True, is_superuser=True)
+        Book.objects.create(title='Book', author=Author.objects.create(name='Author'))
+
+    def get(self, user, url='/api/books/', **extra):
+        return self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}', **extra)
+
+    def test_only_staff_requests_are_profiled(self):
+        self.get(User.objects.create_user('reader'), '/api/books/?profile=1')
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_sampling_and_cprofile_modes(self):
+        self.get(self.staff, '/api/books/?profile=1')
+        self.get(self.staff, HTTP_X_PROFILE='cprofile')
+        profiles = {profile.mode: profile for profile in RequestProfile.objects.all()}
+        self.assertEqual(set(profiles), {'sample', 'cprofile'})
+        for profile in profiles.values():
+            self.assertEqual(profile.status_code, 200)
+            self.assertEqual(profile.query_count, len(profile.queries))
+            self.assertTrue(os.path.exists(os.path.join(self.profile_dir, profile.profile_file)))
+
+    def test_admin_downloads_the_profile_file(self):
+        self.get(self.staff, HTTP_X_PROFILE='cprofile')
+        profile = RequestProfile.objects.get()
+        self.client.force_login(self.staff)
+        response = self.client.get(f'/admin/bookly_app/requestprofile/{profile.pk}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(profile.profile_file, response['Content-Disposition'])
@@ -0,0 +1,83 @@
+import datetime
+import io
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from bookly_app import rankings
+from bookly_app.models import Author, Book, BookActivity, Bookshelf, ExchangeOffer, Genre, Review
+
+
+class RankingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        author = Author.objects.create(name='Author')
+        self.genre = Genre.objects.create(name='Fantasy')
+        self.book = Book.objects.create(title='First', author=author)
+        self.other = Book.objects.create(title='Second', author=author)
+        self.book.genres.add(self.genre)
+        self.client = APIClient()
+
+    def activity(self, book):
+        return BookActivity.objects.get(book=book, date=timezone.localdate())
+
+    def test_writes_bump_todays_rollup(self):
+        Review.objects.create(book=self.book, user=self.user, title='t', content='c', rating=4)
+        shelf = Bookshelf.objects.create(name='Read', user=self.user)
+        shelf.books.add(self.book, self.other)
+        ExchangeOffer.objects.create(book=self.book, owner=self.user, condition='Good', exchange_type='SELL')
+
+        activity = self.activity(self.book)
+        self.assertEqual((activity.reviews, activity.shelvings, activity.offers), (1, 1, 1))
+        self.assertEqual(self.activity(self.other).shelvings, 1)
+
+    def test_trending_orders_by_weighted_activity(self):
+        rankings.record_activity([self.other.pk], 'shelvings')
+        rankings.record_activity([self.book.pk], 'reviews')
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/rankings/trending/')
+        results = response.json()['results']
+        self.assertEqual([row['book']['id'] for row in results], [self.book.pk, self.other.pk])
+        self.assertEqual(results[0]['score'], 3.0)
+
+        response = self.client.get(f'/api/rankings/trending/?genre={self.genre.pk}')
+        self.assertEqual([row['book']['id'] for row in response.json()['results']], [self.book.pk])
+
+    def test_most_reviewed_and_bad_params(self):
+        rankings.record_activity([self.other.pk], 'reviews', amount=2)
+        response = self.client.get('/api/rankings/most-reviewed/')
+        self.assertEqual([(row['book']['id'], row['score']) for row in response.json()['results']], [(self.other.pk, 2)])
+        self.assertEqual(self.client.get('/api/rankings/trending/?days=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/rankings/trending/?days=91').status_code, 400)
+        self.assertEqual(self.client.get('/api/rankings/trending/?genre=x').status_code, 400)
+
+    def test_compact_folds_old_days_into_months(self):
+        month = (timezone.localdate() - datetime.timedelta(days=120)).replace(day=1)
+        BookActivity.objects.create(book=self.book, date=month + datetime.timedelta(days=2), reviews=2)
+        BookActivity.objects.create(book=self.book, date=month + datetime.timedelta(days=5), reviews=3)
+        BookActivity.objects.create(book=self.book, date=month.replace(year=month.year - 3), reviews=1)
+
+        call_command('compact_book_activity', stdout=io.StringIO())
+        self.assertEqual(list(BookActivity.objects.values_list('date', 'reviews')), [(month, 5)])
+
+    def test_compaction_leaves_the_trending_window_daily(self):
+        today = timezone.localdate()
+        for age, reviews in ((1, 1), (40, 2), (80, 4), (150, 8)):
+            BookActivity.objects.create(book=self.book, date=today - datetime.timedelta(days=age), reviews=reviews)
+        before = rankings.trending(days=rankings.TRENDING_MAX_DAYS, half_life=30).get()['score']
+
+        rankings.compact(keep_days=5)
+        recent = BookActivity.objects.filter(date__gte=today - datetime.timedelta(days=rankings.TRENDING_MAX_DAYS))
+        self.assertEqual(sorted(recent.values_list('reviews', flat=True)), [1, 2, 4])
+        old_month = (today - datetime.timedelta(days=150)).replace(day=1)
+        self.assertEqual(BookActivity.objects.get(date=old_month).reviews, 8)
+        self.assertEqual(rankings.trending(days=rankings.TRENDING_MAX_DAYS, half_life=30).get()['score'], before)
+
+    def test_rebuild_recomputes_from_source_tables(self):
+        Review.objects.create(book=self.book, user=self.user, title='t', content='c', rating=4)
+        BookActivity.objects.all().delete()
+        self.assertEqual(rankings.rebuild(), 1)
+        self.assertEqual(self.activity(self.book).reviews, 1)
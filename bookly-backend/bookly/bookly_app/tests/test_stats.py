@@ -0,0 +1,106 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from bookly_app import stats
+from bookly_app.models import Author, Book, Bookshelf, ExchangeOffer, ExchangeRequest, Genre, Review, UserStats
+
+
+class UserStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        self.other = User.objects.create_user('trader')
+        author = Author.objects.create(name='Author')
+        self.sf = Genre.objects.create(name='SF')
+        self.fantasy = Genre.objects.create(name='Fantasy')
+        self.books = [Book.objects.create(title=f'Book {i}', author=author) for i in range(4)]
+        for book in self.books[:3]:
+            book.genres.add(self.sf)
+        self.books[0].genres.add(self.fantasy)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Counters only move for users that already have a row
+        stats.rebuild([self.user.pk, self.other.pk])
+
+    def snapshot(self, user=None):
+        row = UserStats.objects.get(user=user or self.user)
+        return {field: getattr(row, field) for field in stats.COUNTER_FIELDS}
+
+    def assertConsistent(self):
+        """The counters kept by the signals match a rebuild from the source tables."""
+        live = {user.pk: self.snapshot(user) for user in (self.user, self.other)}
+        stats.rebuild([self.user.pk, self.other.pk])
+        self.assertEqual(live, {user.pk: self.snapshot(user) for user in (self.user, self.other)})
+
+    def ratings(self):
+        row = self.snapshot()
+        return [row[f'rating_{rating}'] for rating in stats.RATINGS]
+
+    def test_shelves(self):
+        first = Bookshelf.objects.create(name='First', user=self.user)
+        second = Bookshelf.objects.create(name='Second', user=self.user)
+        first.books.add(*self.books[:3])
+        second.books.add(self.books[0], self.books[3])
+        self.assertConsistent()
+        self.assertEqual(self.snapshot()['books_shelved'], 4)
+        self.assertEqual(self.snapshot()['favourite_genres'][0], {'id': self.sf.pk, 'name': 'SF', 'count': 3})
+
+        first.books.remove(self.books[0])
+        self.assertConsistent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[1].bookshelves.clear()
+        self.assertConsistent()
+        self.assertEqual(self.snapshot()['books_shelved'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[0].delete()
+        self.assertConsistent()
+        second.delete()
+        self.assertConsistent()
+
+    def test_changed_rating_moves_bucket(self):
+        review = Review.objects.create(book=self.books[0], user=self.user, title='t', content='c', rating=4)
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 2
+        review.save()
+        self.assertEqual(self.ratings(), [0, 1, 0, 0, 0])
+        self.assertConsistent()
+
+    def test_same_instance_saved_repeatedly(self):
+        # Each save is compared with the previous save, not with the original load
+        review = Review.objects.create(book=self.books[0], user=self.user, title='t', content='c', rating=5)
+        review.rating = 3
+        review.save()
+        self.assertEqual(self.ratings(), [0, 0, 1, 0, 0])
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 1
+        review.save()
+        review.rating = 4
+        review.save()
+        review.save()
+        self.assertEqual(self.ratings(), [0, 0, 0, 1, 0])
+        self.assertConsistent()
+        review.delete()
+        self.assertEqual(self.snapshot()['reviews_written'], 0)
+        self.assertConsistent()
+
+    def test_completed_exchanges_count_for_both_sides(self):
+        offer = ExchangeOffer.objects.create(book=self.books[0], owner=self.other, condition='Good', exchange_type='SELL')
+        request = ExchangeRequest.objects.create(offer=offer, requester=self.user)
+        request = ExchangeRequest.objects.get(pk=request.pk)
+        request.status = 'COMPLETED'
+        request.save()
+        request.save()
+        self.assertEqual(self.snapshot()['exchanges_completed'], 1)
+        self.assertEqual(self.snapshot(self.other)['exchanges_completed'], 1)
+        self.assertConsistent()
+        request.delete()
+        self.assertEqual(self.snapshot()['exchanges_completed'], 0)
+
+    def test_endpoint(self):
+        UserStats.objects.all().delete()
+        Review.objects.create(book=self.books[0], user=self.user, title='t', content='c', rating=5)
+        # The row is built on first read
+        body = self.client.get('/api/users/me/stats/').json()
+        self.assertEqual(body['reviews_written'], 1)
+        self.assertEqual(body['rating_distribution'], {'1': 0, '2': 0, '3': 0, '4': 0, '5': 1})
+        self.assertEqual(APIClient().get('/api/users/me/stats/').status_code, 401)
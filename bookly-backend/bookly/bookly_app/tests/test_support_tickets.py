@@ -0,0 +1,53 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from bookly_app.models import SupportTicket, TicketReply
+
+
+class SupportTicketQueueTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.user = User.objects.create_user('reader')
+        self.answered = SupportTicket.objects.create(user=self.user, subject='Answered', message='m')
+        self.waiting = SupportTicket.objects.create(user=self.user, subject='Waiting', message='m')
+        self.closed = SupportTicket.objects.create(user=self.user, subject='Closed', message='m', status='CLOSED')
+        TicketReply.objects.create(ticket=self.answered, user=self.staff, message='Done?')
+        TicketReply.objects.create(ticket=self.waiting, user=self.staff, message='Done?')
+        TicketReply.objects.create(ticket=self.waiting, user=self.user, message='No')
+        SupportTicket.objects.filter(pk=self.answered.pk).update(created_at=timezone.now() - datetime.timedelta(hours=5))
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def subjects(self, query=''):
+        response = self.client.get('/api/support-tickets/queue/' + query)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [ticket['subject'] for ticket in response.json()['results']]
+
+    def test_queue_filters(self):
+        self.assertEqual(self.subjects(), ['Answered', 'Waiting'])
+        self.assertEqual(self.subjects('?awaiting=staff'), ['Waiting'])
+        self.assertEqual(self.subjects('?awaiting=user'), ['Answered'])
+        self.assertEqual(self.subjects('?older_than=1'), ['Answered'])
+        self.assertEqual(self.subjects('?newer_than=1'), ['Waiting'])
+        self.assertEqual(self.subjects('?status=CLOSED'), ['Closed'])
+
+    def test_queue_rejects_bad_parameters(self):
+        for query in ('older_than=inf', 'newer_than=1e300', 'idle_for=nan', 'older_than=-1', 'idle_for=x',
+                      'status=OPEN,DONE', 'status=', 'ordering=zz'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get('/api/support-tickets/queue/?' + query).status_code, 400)
+
+    def test_queue_is_staff_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/support-tickets/queue/').status_code, 403)
+
+    def test_thread_is_one_query_and_private(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/support-tickets/{self.waiting.pk}/thread/')
+        self.assertEqual([reply['message'] for reply in response.json()['replies']], ['Done?', 'No'])
+        self.client.force_authenticate(User.objects.create_user('other'))
+        self.assertEqual(self.client.get(f'/api/support-tickets/{self.waiting.pk}/thread/').status_code, 404)
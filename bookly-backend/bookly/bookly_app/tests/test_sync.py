@@ -0,0 +1,98 @@
+import datetime
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from bookly_app import sync
+from bookly_app.models import (
+    Author, Book, Bookshelf, ExchangeOffer, ExchangeRequest, Review, SupportTicket, SyncChange, SyncCounter,
+)
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        self.other = User.objects.create_user('trader')
+        author = Author.objects.create(name='Author')
+        self.book = Book.objects.create(title='One', author=author)
+        self.second = Book.objects.create(title='Two', author=author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, token, client=None):
+        response = (client or self.client).get('/api/sync/', {'token': token})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        body['changes'] = {kind: sorted(item['id'] for item in items) for kind, items in body['changes'].items()}
+        return body
+
+    def test_changes_since_token(self):
+        start = self.client.get('/api/sync/').json()['token']
+        shelf = Bookshelf.objects.create(user=self.user, name='Shelf')
+        shelf.books.add(self.book, self.second)
+        review = Review.objects.create(book=self.book, user=self.user, rating=5, title='t', content='c')
+        offer = ExchangeOffer.objects.create(book=self.book, owner=self.user, condition='Good', exchange_type='SELL')
+        request = ExchangeRequest.objects.create(offer=offer, requester=self.other)
+        ticket = SupportTicket.objects.create(user=self.user, subject='Help', message='m')
+        SupportTicket.objects.create(user=self.other, subject='Not mine', message='m')
+
+        body = self.sync(start)
+        self.assertEqual(body['changes'], {
+            'bookshelves': [shelf.pk], 'reviews': [review.pk], 'offers': [offer.pk],
+            'requests': [request.pk], 'tickets': [ticket.pk],
+        })
+        self.assertEqual(body['deleted'], {})
+        self.assertFalse(body['has_more'])
+        # Nothing new since the returned token
+        self.assertEqual(self.sync(body['token'])['changes'], {})
+
+        with override_settings(SYNC_PAGE_SIZE=2):
+            page = self.sync(start)
+        self.assertTrue(page['has_more'])
+        self.assertEqual(sum(len(ids) for ids in page['changes'].values()), 2)
+
+    def test_deletions_leave_tombstones(self):
+        shelf = Bookshelf.objects.create(user=self.user, name='Shelf')
+        shelf.books.add(self.book, self.second)
+        review = Review.objects.create(book=self.book, user=self.user, rating=5, title='t', content='c')
+        token = self.client.get('/api/sync/').json()['token']
+
+        review_id = review.pk
+        review.delete()
+        self.book.delete()
+        body = self.sync(token)
+        self.assertEqual(body['deleted'], {'reviews': [review_id]})
+        # Deleting a shelved book changes the shelf
+        self.assertEqual(body['changes'], {'bookshelves': [shelf.pk]})
+
+        SyncChange.objects.update(changed_at=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(sync.purge_tombstones(), 1)
+        self.assertFalse(SyncChange.objects.filter(deleted=True).exists())
+
+    def test_sequence_numbers_follow_the_user_counter(self):
+        shelf = Bookshelf.objects.create(user=self.user, name='Shelf')
+        Bookshelf.objects.create(user=self.other, name='Shelf')
+        shelf.books.add(self.book)
+        self.assertEqual(list(SyncChange.objects.filter(user=self.user).values_list('seq', flat=True)), [2])
+        self.assertEqual(SyncCounter.objects.get(user=self.user).seq, 2)
+        self.assertEqual(SyncCounter.objects.get(user=self.other).seq, 1)
+
+        # A rolled-back change takes no number
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            shelf.books.add(self.second)
+            raise RuntimeError
+        self.assertEqual(SyncCounter.objects.get(user=self.user).seq, 2)
+        self.assertEqual(sync.read_token(self.user, sync.current_token(self.user)), 2)
+
+    def test_bad_tokens(self):
+        token = self.client.get('/api/sync/').json()['token']
+        other = APIClient()
+        other.force_authenticate(self.other)
+        self.assertEqual(other.get('/api/sync/', {'token': token}).status_code, 400)
+        self.assertEqual(self.client.get('/api/sync/', {'token': 'garbage'}).status_code, 400)
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 40 * 86400):
+            self.assertEqual(self.client.get('/api/sync/', {'token': token}).status_code, 410)
@@ -0,0 +1,118 @@
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from bookly_app import throttling
+from bookly_app.models import Author, Book
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('reader', password='secret')
+        self.book = Book.objects.create(title='Book', author=Author.objects.create(name='Author'))
+        self.client = APIClient()
+
+    def test_login_is_limited_per_ip(self):
+        codes = [self.client.post('/api/token/', {'username': 'reader', 'password': 'bad'}).status_code
+                 for _ in range(11)]
+        self.assertEqual(codes, [401] * 10 + [429])
+        response = self.client.post('/api/token/', {'username': 'reader', 'password': 'secret'})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+
+    def test_spoofed_forwarded_for_shares_the_proxy_reported_address(self):
+        # nginx appends the address it saw; anything before it came from the client
+        codes = [
+            self.client.post('/api/token/', {'username': 'reader', 'password': 'bad'},
+                             HTTP_X_FORWARDED_FOR=f'10.0.0.{i}, 203.0.113.7').status_code
+            for i in range(11)
+        ]
+        self.assertEqual(codes[-1], 429)
+        response = self.client.post('/api/token/', {'username': 'reader', 'password': 'bad'},
+                                    HTTP_X_FORWARDED_FOR='203.0.113.8')
+        self.assertEqual(response.status_code, 401)
+
+    def test_forwarded_for_is_ignored_without_a_proxy(self):
+        rest_framework = {**settings.REST_FRAMEWORK, 'NUM_PROXIES': 0}
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            codes = [
+                self.client.post('/api/token/', {'username': 'reader', 'password': 'bad'},
+                                 HTTP_X_FORWARDED_FOR=f'10.0.0.{i}').status_code
+                for i in range(11)
+            ]
+        self.assertEqual(codes[-1], 429)
+
+    def test_only_creates_are_throttled(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual({self.client.get('/api/reviews/').status_code for _ in range(25)}, {200})
+        codes = [
+            self.client.post('/api/reviews/', {'book': self.book.pk, 'title': 't', 'content': 'c', 'rating': 3}).status_code
+            for _ in range(21)
+        ]
+        self.assertEqual(codes[-1], 429)
+        self.assertNotIn(429, codes[:20])
+
+    def test_previous_window_still_counts_while_it_overlaps(self):
+        throttle = throttling.IPBucketThrottle()
+        view = mock.Mock(throttle_scope='login')
+        request = RequestFactory().post('/api/token/')
+        with mock.patch.object(throttling.time, 'time', return_value=6000.0):
+            self.assertEqual(sum(throttle.allow_request(request, view) for _ in range(12)), 10)
+        # Halfway through the next minute half of the previous one still counts
+        with mock.patch.object(throttling.time, 'time', return_value=6090.0):
+            self.assertEqual(sum(throttle.allow_request(request, view) for _ in range(12)), 5)
+            # 6s from now the weight of the previous window is down to 4
+            self.assertEqual(throttle.wait(), 6)
+
+    def test_concurrent_requests_cannot_share_an_allowance(self):
+        view = mock.Mock(throttle_scope='login')
+        request = RequestFactory().post('/api/token/')
+        start = threading.Barrier(30)
+        allowed = []
+
+        def attempt():
+            start.wait()
+            allowed.append(throttling.IPBucketThrottle().allow_request(request, view))
+
+        threads = [threading.Thread(target=attempt) for _ in range(30)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(allowed.count(True), 10)
+
+    def test_deploy_check_warns_about_a_per_process_cache(self):
+        self.assertEqual([warning.id for warning in throttling.check_shared_throttle_cache(None)], ['bookly_app.W001'])
+
+
+class ConcurrencyLimitTests(TestCase):
+    def test_requests_beyond_capacity_are_shed(self):
+        release = threading.Event()
+
+        def slow_view(request):
+            if request.path == '/api/books/':
+                release.wait(5)
+            return HttpResponse('ok')
+
+        with override_settings(MAX_CONCURRENT_REQUESTS=1):
+            middleware = throttling.ConcurrencyLimitMiddleware(slow_view)
+        factory = RequestFactory()
+        busy = threading.Thread(target=middleware, args=(factory.get('/api/books/'),))
+        busy.start()
+        time.sleep(0.1)
+        try:
+            response = middleware(factory.get('/api/books/'))
+            self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+            self.assertEqual(middleware(factory.get('/metrics')).status_code, 200)
+        finally:
+            release.set()
+            busy.join()
@@ -0,0 +1,151 @@
+import io
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from bookly_app import uploads
+from bookly_app.models import Author, Book, UploadSession, UserProfile
+from bookly_app.uploads import UploadOffsetMismatch
+
+CHUNK = 4096
+
+
+def png(size=(1200, 1600)):
+    data = io.BytesIO()
+    Image.new('RGB', size, 'red').save(data, 'PNG')
+    return data.getvalue()
+
+
+class UploadTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.temp_dir = os.path.join(root, 'uploads')
+        settings = override_settings(UPLOAD_TEMP_DIR=self.temp_dir, MEDIA_ROOT=os.path.join(root, 'media'),
+                                     UPLOAD_CHUNK_MAX_BYTES=CHUNK)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('reader')
+        self.author = Author.objects.create(name='Author')
+        self.book = Book.objects.create(title='Book', author=self.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def open(self, target, object_id, size, filename='cover.png'):
+        return self.client.post('/api/uploads/', {'target': target, 'object_id': object_id, 'filename': filename,
+                                                  'size': size}, format='json')
+
+    def put(self, upload_id, data, offset):
+        return self.client.generic('PUT', f'/api/uploads/{upload_id}/', data,
+                                   content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunked_upload_resumes_and_completes(self):
+        data = png()
+        response = self.open('book_cover', self.book.pk, len(data), filename='c/../dune.png')
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.data['id']
+        self.assertEqual(response.data['filename'], 'dune.png')
+
+        self.assertEqual(self.put(upload_id, data[:CHUNK + 1], 0).status_code, 413)
+        response = self.put(upload_id, data[:4000], 0)
+        self.assertEqual(response['Upload-Offset'], '4000')
+        self.assertEqual(response.data['content_type'], 'image/png')
+        # A repeated chunk is told where to continue
+        response = self.put(upload_id, data[:4000], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 4000)
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/')['Upload-Offset'], '4000')
+
+        offset = 4000
+        while offset < len(data):
+            response = self.put(upload_id, data[offset:offset + CHUNK], offset)
+            self.assertEqual(response.status_code, 200)
+            offset += CHUNK
+        self.assertEqual(response.data['status'], 'COMPLETE')
+        self.book.refresh_from_db()
+        self.assertTrue(self.book.cover_image.name.startswith('book_covers/dune.'))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, f'{upload_id}.part')))
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other'))
+        self.assertEqual(other.get(f'/api/uploads/{upload_id}/').status_code, 404)
+
+    def test_offset_is_claimed_before_the_chunk_is_read(self):
+        data = png((10, 10))
+        upload_id = self.open('author_photo', self.author.pk, len(data)).data['id']
+        stale = UploadSession.objects.get(pk=upload_id)
+        self.put(upload_id, data[:20], 0)
+        # A request that read the session before the first chunk landed must not overwrite it
+        with self.assertRaises(UploadOffsetMismatch):
+            uploads.write_chunk(stale, 0, io.BytesIO(b'\0' * 20), 20)
+        with open(os.path.join(self.temp_dir, f'{upload_id}.part'), 'rb') as f:
+            self.assertEqual(f.read(), data[:20])
+
+        session = UploadSession.objects.get(pk=upload_id)
+        outer = len(connection.atomic_blocks)
+        seen = []
+
+        class Client(io.BytesIO):
+            def read(stream, size=-1):
+                if not seen:
+                    # No transaction is held open while the client sends, and
+                    # the same chunk sent again meanwhile is turned away
+                    seen.append(len(connection.atomic_blocks))
+                    with self.assertRaises(UploadOffsetMismatch):
+                        uploads.write_chunk(session, 20, io.BytesIO(b'\0' * 20), 20)
+                return io.BytesIO.read(stream, size)
+
+        session = uploads.write_chunk(session, 20, Client(data[20:40]), 20)
+        self.assertEqual((seen, session.status, session.received), ([outer], 'UPLOADING', 40))
+
+    def test_failed_chunks_release_the_claim(self):
+        data = png((10, 10))
+        upload_id = self.open('author_photo', self.author.pk, len(data)).data['id']
+        session = UploadSession.objects.get(pk=upload_id)
+
+        class Dropped(io.BytesIO):
+            def read(self, size=-1):
+                raise OSError('Connection reset')
+
+        with self.assertRaises(OSError):
+            uploads.write_chunk(session, 0, Dropped(), 20)
+        self.assertEqual(UploadSession.objects.filter(pk=upload_id).values_list('status', 'received').get(),
+                         ('UPLOADING', 0))
+
+        # A claim left by a worker that died is taken over once it times out
+        UploadSession.objects.filter(pk=upload_id).update(status='WRITING')
+        self.assertEqual(self.put(upload_id, data[:20], 0).status_code, 409)
+        UploadSession.objects.filter(pk=upload_id).update(updated_at='2000-01-01T00:00:00Z')
+        self.assertEqual(self.put(upload_id, data[:20], 0)['Upload-Offset'], '20')
+
+    def test_rejected_uploads(self):
+        upload_id = self.open('author_photo', self.author.pk, 100).data['id']
+        self.assertEqual(self.put(upload_id, b'%PDF-1.4 hello world', 0).status_code, 415)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).status, 'FAILED')
+        self.assertEqual(self.put(upload_id, b'\x89PNG\r\n\x1a\n', 0).status_code, 400)
+
+        self.assertEqual(self.open('author_photo', self.author.pk, 10 ** 9).status_code, 413)
+        profile = UserProfile.objects.create(user=User.objects.create_user('other'))
+        self.assertEqual(self.open('profile_picture', profile.pk, 10).status_code, 400)
+
+        data = png((10, 10))
+        damaged = data[:-20] + b'\0' * 20
+        upload_id = self.open('author_photo', self.author.pk, len(damaged)).data['id']
+        self.assertEqual(self.put(upload_id, damaged, 0).status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).status, 'FAILED')
+
+    def test_cancel_and_purge(self):
+        upload_id = self.open('author_photo', self.author.pk, 100).data['id']
+        self.assertEqual(self.client.delete(f'/api/uploads/{upload_id}/').status_code, 204)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, f'{upload_id}.part')))
+        upload_id = self.open('author_photo', self.author.pk, 100).data['id']
+        self.assertEqual(uploads.purge_expired(), 0)
+        UploadSession.objects.update(updated_at='2000-01-01T00:00:00Z')
+        self.assertEqual(uploads.purge_expired(), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, f'{upload_id}.part')))
@@ -0,0 +1,182 @@
+"""
+Rate limiting and load shedding.
+
+The throttles count requests in the default cache using only ``add`` and
+``incr``, which are atomic in Redis, Memcached and the local-memory cache, so
+a burst of concurrent requests can't all spend the same allowance. Each
+bucket (one per user, IP or endpoint) is a sliding window: a rate such as
+``'10/min'`` in ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']`` lets through 10
+requests in any minute, with the previous minute's count weighted by how
+much of it still overlaps. Short bursts pass, sustained floods don't.
+Scopes are named ``<view scope>.<user|ip|endpoint>``, e.g. ``login.ip``.
+
+The limits only hold across workers when they share the cache. With the
+default per-process cache every worker counts on its own, so deployments
+must set ``REDIS_URL``; ``manage.py check --deploy`` warns when they don't.
+"""
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from rest_framework.throttling import SimpleRateThrottle
+
+from . import metrics
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Base class; subclasses pick what a bucket is keyed on. The view names the
+    rate with ``throttle_scope``. Views without a configured rate for this
+    kind of bucket are not throttled by it.
+    """
+    kind = None
+    cache = cache
+
+    def __init__(self):
+        # The scope comes from the view, so rate parsing waits for allow_request
+        pass
+
+    def get_ident_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        view_scope = getattr(view, 'throttle_scope', None)
+        if not view_scope:
+            return True
+        self.scope = f'{view_scope}.{self.kind}'
+        self.rate = self.get_rate_or_none()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+        self.key = f'throttle:{self.scope}:{ident}'
+
+        now = time.time()
+        window, self.elapsed = divmod(now / self.duration, 1)
+        key = f'{self.key}:{int(window)}'
+        # Each request takes its own number from incr(); concurrent requests
+        # never see the same count
+        self.cache.add(key, 0, self.duration * 2)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.add(key, 1, self.duration * 2)
+            count = 1
+        self.previous = self.cache.get(f'{self.key}:{int(window) - 1}', 0)
+        self.excess = self.previous * (1 - self.elapsed) + count - self.num_requests
+        allowed = self.excess <= 0
+        if not allowed:
+            # Rejected requests don't use up the window
+            self.cache.decr(key)
+
+        metrics.record_throttle_decision(self.scope, allowed)
+        return allowed
+
+    def get_rate_or_none(self):
+        return self.THROTTLE_RATES.get(self.scope)
+
+    def wait(self):
+        remaining = (1 - self.elapsed) * self.duration
+        if self.previous and self.excess <= self.previous * (1 - self.elapsed):
+            # The previous window's weight runs out before this one ends
+            return min(self.excess / self.previous * self.duration, remaining)
+        return remaining
+
+
+class UserBucketThrottle(SlidingWindowThrottle):
+    """One bucket per authenticated user; anonymous requests fall back to IP."""
+    kind = 'user'
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f'u{request.user.pk}'
+        return f'ip{self.get_ident(request)}'
+
+
+class IPBucketThrottle(SlidingWindowThrottle):
+    kind = 'ip'
+
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+class EndpointBucketThrottle(SlidingWindowThrottle):
+    """A single bucket for everybody: caps the total rate of an endpoint."""
+    kind = 'endpoint'
+
+    def get_ident_key(self, request, view):
+        return 'all'
+
+
+BUCKET_THROTTLES = [UserBucketThrottle, IPBucketThrottle, EndpointBucketThrottle]
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_throttle_cache(app_configs, **kwargs):
+    if isinstance(caches['default'], LocMemCache):
+        return [checks.Warning(
+            "Rate limits are counted in a per-process cache, so each worker enforces them separately.",
+            hint="Set REDIS_URL so that all workers share the default cache.",
+            id='bookly_app.W001',
+        )]
+    return []
+
+
+class CreateThrottleMixin:
+    """
+    Viewset mixin that throttles only ``create`` under ``create_throttle_scope``;
+    reads keep the default (unthrottled) behaviour.
+    """
+    create_throttle_scope = None
+
+    @property
+    def throttle_scope(self):
+        if getattr(self, 'action', None) == 'create':
+            return self.create_throttle_scope
+        return None
+
+    def get_throttles(self):
+        if getattr(self, 'action', None) == 'create' and self.create_throttle_scope:
+            return [throttle() for throttle in BUCKET_THROTTLES]
+        return super().get_throttles()
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Sheds load when this worker already has ``MAX_CONCURRENT_REQUESTS``
+    requests in flight: the extra request gets an immediate 503 with
+    ``Retry-After`` instead of queueing behind the others. Paths in
+    ``CONCURRENCY_LIMIT_EXEMPT`` (health checks, /metrics) are never shed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.capacity = getattr(settings, 'MAX_CONCURRENT_REQUESTS', None)
+        self.retry_after = getattr(settings, 'CONCURRENCY_RETRY_AFTER', 1)
+        self.exempt = tuple(getattr(settings, 'CONCURRENCY_LIMIT_EXEMPT', ()))
+        self.slots = threading.BoundedSemaphore(self.capacity) if self.capacity else None
+
+    def __call__(self, request):
+        if self.slots is None or request.path.startswith(self.exempt):
+            return self.get_response(request)
+        if not self.slots.acquire(blocking=False):
+            metrics.LOAD_SHED.inc()
+            response = HttpResponse(
+                json.dumps({"detail": "Server is busy, please retry shortly."}),
+                content_type='application/json', status=503,
+            )
+            response['Retry-After'] = str(self.retry_after)
+            return response
+        try:
+            return self.get_response(request)
+        finally:
+            self.slots.release()
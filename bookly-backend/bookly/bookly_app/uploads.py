@@ -0,0 +1,242 @@
+"""
+Chunked, resumable uploads of book covers, author photos and profile pictures.
+
+A client opens an :class:`~bookly_app.models.UploadSession` with the target and
+the file size, then sends the bytes in chunks with their offsets. Each chunk is
+copied from the request stream to a temporary file in ``READ_SIZE`` pieces, so
+a worker holds at most one piece of any upload in memory. The size is checked
+before a chunk is read and the image type as soon as its first bytes arrive.
+When the last byte is in, the file is verified and copied into storage, again
+piece by piece, and attached to the target. After a dropped connection, the
+session's ``received`` count says where to resume.
+"""
+import datetime
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, UnsupportedMediaType, ValidationError
+
+from . import cards, jobs
+from .models import Author, Book, OwnedModel, UploadSession, UserProfile
+
+READ_SIZE = 64 * 1024
+
+TARGETS = {
+    'book_cover': (Book, 'cover_image'),
+    'author_photo': (Author, 'photo'),
+    'profile_picture': (UserProfile, 'profile_picture'),
+}
+
+# Leading bytes of the accepted image formats
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+SNIFF_BYTES = 12
+EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif', 'image/webp': '.webp'}
+
+
+class UploadOffsetMismatch(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_code = 'upload_offset_mismatch'
+
+    def __init__(self, offset):
+        super().__init__({'detail': f'The upload continues at offset {offset}.'})
+        # Kept a number; APIException would turn it into a string
+        self.detail['offset'] = offset
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'The upload is too large.'
+    default_code = 'upload_too_large'
+
+
+def max_bytes():
+    return getattr(settings, 'UPLOAD_MAX_BYTES', 20 * 1024 * 1024)
+
+
+def chunk_max_bytes():
+    return getattr(settings, 'UPLOAD_CHUNK_MAX_BYTES', 4 * 1024 * 1024)
+
+
+def temp_path(session):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, f'{session.pk}.part')
+
+
+def sniff(head):
+    """The content type of the image starting with ``head``, or ``None``."""
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def _targets(user, target):
+    model, _ = TARGETS[target]
+    if issubclass(model, OwnedModel):
+        return model.objects.editable_by(user)
+    return model.objects.all()
+
+
+def open_session(user, target, object_id, filename, size):
+    if size > max_bytes():
+        raise UploadTooLarge(f'Files up to {max_bytes() // (1024 * 1024)} MB can be uploaded.')
+    if not _targets(user, target).filter(pk=object_id).exists():
+        raise ValidationError({"object_id": ["No such object, or you may not change it."]})
+    session = UploadSession.objects.create(user=user, target=target, object_id=object_id,
+                                           filename=os.path.basename(filename), size=size)
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    open(temp_path(session), 'wb').close()
+    return session
+
+
+def _fail(session, error):
+    UploadSession.objects.filter(pk=session.pk).update(status='FAILED', error=error[:255], updated_at=timezone.now())
+    discard(session)
+
+
+def claim_timeout():
+    return datetime.timedelta(seconds=getattr(settings, 'UPLOAD_CLAIM_TIMEOUT', 300))
+
+
+def write_chunk(session, offset, stream, length):
+    """
+    Writes the next ``length`` bytes of ``stream`` at ``offset``, which must be
+    where the upload stopped. A chunk cut short by the client still counts for
+    the bytes that arrived. The last chunk completes the upload. Returns the
+    session, reloaded.
+
+    The offset is claimed with a single conditional UPDATE that moves the
+    session from UPLOADING to WRITING, so a second request for the same offset
+    gets a 409 at once instead of writing over the first. The chunk is then
+    read from the client with no transaction open and no row locked, and the
+    claim is released together with the new ``received`` count. A claim left
+    by a worker that died mid-chunk can be taken over after
+    ``UPLOAD_CLAIM_TIMEOUT`` seconds.
+    """
+    session = UploadSession.objects.filter(pk=session.pk).first()
+    if session is None:
+        raise NotFound("The upload has expired.")
+    if length > chunk_max_bytes():
+        raise UploadTooLarge(f'Chunks may be at most {chunk_max_bytes()} bytes.')
+    if offset + length > session.size:
+        raise UploadTooLarge('The chunk goes past the size declared for the upload.')
+
+    claimed_at = timezone.now()
+    claimable = Q(status='UPLOADING') | Q(status='WRITING', updated_at__lt=claimed_at - claim_timeout())
+    if not UploadSession.objects.filter(claimable, pk=session.pk, received=offset).update(
+        status='WRITING', updated_at=claimed_at
+    ):
+        session = UploadSession.objects.filter(pk=session.pk).first()
+        if session is None:
+            raise NotFound("The upload has expired.")
+        if session.status not in ('UPLOADING', 'WRITING'):
+            raise ValidationError({"detail": ["This upload is no longer in progress."]})
+        raise UploadOffsetMismatch(session.received)
+    # Only the holder of this claim may record the chunk: updated_at is its token
+    claim = UploadSession.objects.filter(pk=session.pk, status='WRITING', updated_at=claimed_at)
+
+    received, content_type = offset, session.content_type
+    try:
+        received, content_type = _write(session, offset, stream, length)
+        if not content_type and received >= min(SNIFF_BYTES, session.size):
+            _fail(session, 'Not a JPEG, PNG, GIF or WebP image.')
+            raise UnsupportedMediaType('', detail='Only JPEG, PNG, GIF and WebP images can be uploaded.')
+        if received == session.size:
+            session.received, session.content_type = received, content_type
+            complete(session)
+    except BaseException:
+        # Nothing is recorded: the client sends the chunk again
+        claim.update(status='UPLOADING', updated_at=timezone.now())
+        raise
+    claim.update(status='UPLOADING', received=received, content_type=content_type or '', updated_at=timezone.now())
+    session.refresh_from_db()
+    return session
+
+
+def _write(session, offset, stream, length):
+    """Copies the chunk into the temporary file; returns ``(received, content_type)``."""
+    path = temp_path(session)
+    written = 0
+    try:
+        with open(path, 'r+b') as f:
+            f.seek(offset)
+            while written < length:
+                piece = stream.read(min(READ_SIZE, length - written))
+                if not piece:
+                    break
+                f.write(piece)
+                written += len(piece)
+            received = offset + written
+            content_type = session.content_type
+            if not content_type and received >= min(SNIFF_BYTES, session.size):
+                f.seek(0)
+                content_type = sniff(f.read(SNIFF_BYTES))
+    except FileNotFoundError:
+        raise NotFound("The upload has expired.")
+    return received, content_type
+
+
+def _stored_name(session):
+    # Named after the client's file, with the extension of the detected type
+    root = os.path.splitext(session.filename)[0][:80] or session.target
+    return root + EXTENSIONS[session.content_type]
+
+
+def complete(session):
+    """Verifies the assembled image and attaches it to the target."""
+    from PIL import Image
+
+    path = temp_path(session)
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        _fail(session, 'The image is damaged or incomplete.')
+        raise ValidationError({"detail": ["The image is damaged or incomplete."]})
+
+    model, field_name = TARGETS[session.target]
+    obj = model.objects.filter(pk=session.object_id).first()
+    if obj is None:
+        _fail(session, 'The target was deleted.')
+        raise NotFound("The object the upload was for no longer exists.")
+    field = getattr(obj, field_name)
+    with open(path, 'rb') as f:
+        field.save(_stored_name(session), File(f), save=False)
+    with transaction.atomic():
+        model.objects.filter(pk=obj.pk).update(**{field_name: field.name})
+        if session.target == 'book_cover':
+            cards.refresh([obj.pk])
+            jobs.enqueue_on_commit('process_cover_image', obj.pk)
+        UploadSession.objects.filter(pk=session.pk).update(
+            status='COMPLETE', received=session.received, content_type=session.content_type,
+            updated_at=timezone.now(),
+        )
+    discard(session)
+
+
+def discard(session):
+    try:
+        os.remove(temp_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def purge_expired():
+    """Deletes sessions untouched for ``UPLOAD_SESSION_TTL_HOURS`` with their temporary files."""
+    cutoff = timezone.now() - datetime.timedelta(hours=getattr(settings, 'UPLOAD_SESSION_TTL_HOURS', 24))
+    stale = UploadSession.objects.filter(updated_at__lt=cutoff)
+    for session in stale.only('id').iterator():
+        discard(session)
+    deleted, _ = stale.delete()
+    return deleted
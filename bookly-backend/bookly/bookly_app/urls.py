@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from .batch import BatchView
 
 router = DefaultRouter()
 router.register(r'users', views.UserViewSet)
 router.register(r'profiles', views.UserProfileViewSet)
+router.register(r'authors', views.AuthorViewSet)
 router.register(r'books', views.BookViewSet)
 router.register(r'genres', views.GenreViewSet)
 router.register(r'bookshelves', views.BookshelfViewSet)
@@ -15,8 +17,18 @@ router.register(r'discussions', views.DiscussionViewSet, basename='discussion')
 router.register(r'comments', views.CommentViewSet, basename='comment')
 router.register(r'support-tickets', views.SupportTicketViewSet, basename='support-ticket')
 router.register(r'ticket-replies', views.TicketReplyViewSet, basename='ticket-reply')
+router.register(r'rankings', views.RankingViewSet, basename='ranking')
+router.register(r'imports', views.ImportViewSet, basename='import')
+router.register(r'archive/exchange-offers', views.ArchivedExchangeOfferViewSet, basename='archived-exchange-offer')
+router.register(r'archive/exchange-requests', views.ArchivedExchangeRequestViewSet, basename='archived-exchange-request')
+router.register(r'archive/support-tickets', views.ArchivedSupportTicketViewSet, basename='archived-support-ticket')
+router.register(r'history', views.HistoryViewSet, basename='history')
+router.register(r'notifications', views.NotificationViewSet, basename='notification')
+router.register(r'sync', views.SyncViewSet, basename='sync')
+router.register(r'uploads', views.UploadViewSet, basename='upload')
 
 urlpatterns = [
+    path('batch/', BatchView.as_view(), name='batch'),
     path('', include(router.urls)),
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,67 +1,158 @@
 from django.shortcuts import render, get_object_or_404
-from rest_framework import viewsets, permissions, status, filters
+from rest_framework import viewsets, mixins, permissions, status, filters
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth.models import User
-from django.db.models import Avg, Count
+from django.db.models import Avg, BigIntegerField, BooleanField, CharField, Count, F, Max, OuterRef, Prefetch, Q, Subquery, Sum, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+import json
 import logging
+from django.http import HttpResponse
+from . import authors, cards, facets, imports, notifications, rankings, stats, sync, tasks, uploads
+from .fieldsets import SparseFieldsetMixin
+from .isbn import to_isbn13
+from .throttling import CreateThrottleMixin, EndpointBucketThrottle, IPBucketThrottle
 from .models import (
     Author, Book, Genre, UserProfile, Bookshelf, Review, 
     ExchangeOffer, ExchangeRequest, Discussion, 
-    Comment, SupportTicket, TicketReply
+    Comment, SupportTicket, TicketReply, ImportJob, UploadSession, BookCard,
+    ArchivedExchangeOffer, ArchivedExchangeRequest, ArchivedSupportTicket, ArchivedTicketReply
 )
 from .serializers import (
     AuthorSerializer, UserSerializer, UserProfileSerializer, BookSerializer, GenreSerializer, 
     BookshelfSerializer, ReviewSerializer, ExchangeOfferSerializer, 
     ExchangeRequestSerializer, DiscussionSerializer, CommentSerializer,
-    SupportTicketSerializer, TicketReplySerializer, BookshelfBooksUpdateSerializer
+    SupportTicketSerializer, TicketReplySerializer, BookshelfBooksUpdateSerializer,
+    SimpleBookSerializer, BookshelfSummarySerializer, SupportTicketQueueSerializer,
+    ImportJobSerializer, ArchivedExchangeOfferSerializer, ArchivedExchangeRequestSerializer,
+    ArchivedSupportTicketSerializer, NotificationSerializer, ISBNLookupSerializer,
+    UploadSessionSerializer, UserStatsSerializer
 )
 
 logger = logging.getLogger(__name__)
 
-class IsOwnerOrAdmin(permissions.BasePermission):
-    def has_object_permission(self, request, view, obj):
-        if request.user.is_staff:
-            return True
-        
-        if hasattr(obj, 'user'):
-            return obj.user == request.user
-        elif hasattr(obj, 'owner'):
-            return obj.owner == request.user
-        elif hasattr(obj, 'created_by'):
-            return obj.created_by == request.user
-        elif hasattr(obj, 'requester'):
-            return obj.requester == request.user
-        
-        return False
+def card_page_response(view, data):
+    """
+    A page of stored book-card JSON (see cards.py) in the usual paginated
+    envelope. The strings are spliced into the body as they are, without
+    building a model instance or running a serializer.
+    """
+    page = view.paginate_queryset(data)
+    if page is None:
+        return HttpResponse(cards.splice(data), content_type='application/json')
+    paginator = view.paginator
+    body = '{"count":%d,"next":%s,"previous":%s,"results":%s}' % (
+        paginator.page.paginator.count,
+        json.dumps(paginator.get_next_link()),
+        json.dumps(paginator.get_previous_link()),
+        cards.splice(page),
+    )
+    return HttpResponse(body, content_type='application/json')
+
+class RowAccessMixin:
+    """
+    Viewset mixin that applies the model's access rules (see ``OwnedModel``)
+    inside the query: reads see ``visible_to(user)``, writes reach only
+    ``editable_by(user)``. Other rows are never loaded and answer 404.
+    """
+    # Non-GET actions that anybody who can see the object may call
+    shared_actions = ()
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        user = self.request.user
+        if self.request.method in permissions.SAFE_METHODS or self.action in self.shared_actions:
+            return queryset.visible_to(user)
+        return queryset.editable_by(user)
 
-class AuthorViewSet(viewsets.ModelViewSet):
+class BookSearchFilter(filters.SearchFilter):
+    """A search term that is an ISBN in any notation matches isbn13 exactly"""
+    
+    def filter_queryset(self, request, queryset, view):
+        isbn13 = to_isbn13(request.query_params.get(self.search_param, '').strip() or None)
+        if isbn13:
+            return queryset.filter(isbn13=isbn13)
+        return super().filter_queryset(request, queryset, view)
+
+# Password hashing makes logins expensive, so they are rate limited per IP
+class ThrottledTokenObtainPairView(TokenObtainPairView):
+    throttle_scope = 'login'
+    throttle_classes = [IPBucketThrottle, EndpointBucketThrottle]
+
+class AuthorViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [filters.SearchFilter]
     search_fields = ['name']
     
     def create(self, request, *args, **kwargs):
         # Log the incoming data
-        logger.debug(f"Creating author with data: {request.data}")
+        logger.debug("Creating author with data: %s", request.data)
         
         # Call the parent class create method
         response = super().create(request, *args, **kwargs)
         
         # Log the created author
-        logger.debug(f"Created author: {response.data}")
+        logger.debug("Created author: %s", response.data)
         return response
+    
+    @action(detail=True, methods=['get'])
+    def page(self, request, pk=None):
+        """
+        Everything an author page shows: the author, rating and discussion
+        totals, and a page of their books (?page=). Three queries in all.
+        """
+        books_of_author = Book.objects.filter(author=OuterRef('pk')).order_by().values('author')
+        author = get_object_or_404(
+            Author.objects.annotate(
+                rating_count=Coalesce(Subquery(books_of_author.annotate(n=Sum('rating_count')).values('n')), 0),
+                rating_total=Subquery(
+                    books_of_author.annotate(total=Sum(F('rating_avg') * F('rating_count'))).values('total')
+                ),
+                discussion_count=Coalesce(Subquery(
+                    Discussion.objects
+                    .filter(Q(author=OuterRef('pk')) | Q(book__author=OuterRef('pk')))
+                    .order_by().annotate(one=Value(1)).values('one')
+                    .annotate(n=Count('id')).values('n')
+                ), 0),
+            ),
+            pk=pk,
+        )
+        books = (
+            Book.objects.filter(author=author).select_related('author')
+            .order_by(F('publication_date').desc(nulls_last=True), 'id')
+        )
+        page = self.paginate_queryset(books)
+        context = self.get_serializer_context()
+        book_page = self.get_paginated_response(SimpleBookSerializer(page, many=True, context=context).data).data
+        return Response({
+            'author': AuthorSerializer(author, context=context).data,
+            'book_count': book_page['count'],
+            'rating_count': author.rating_count,
+            # Mean of all ratings of all books, not of the per-book averages
+            'average_rating': round(author.rating_total / author.rating_count, 2) if author.rating_count else None,
+            'discussion_count': author.discussion_count,
+            'books': book_page,
+        })
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(CreateThrottleMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    create_throttle_scope = 'register'
     
     # Override default permission classes for specific actions
     def get_permissions(self):
         if self.action == 'create':  # For user registration
             permission_classes = [permissions.AllowAny]
-        elif self.action == 'me':  # For getting user profile
+        elif self.action in ('me', 'me_stats'):  # For getting user profile
             permission_classes = [permissions.IsAuthenticated]
         else:
             permission_classes = [permissions.IsAdminUser]
@@ -71,31 +162,89 @@ class UserViewSet(viewsets.ModelViewSet):
     def me(self, request):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'], url_path='me/stats')
+    def me_stats(self, request):
+        """Reading statistics of the current user, read from one precomputed row"""
+        return Response(UserStatsSerializer(stats.get(request.user)).data)
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(RowAccessMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
-    permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
-    
-    def get_queryset(self):
-        if self.request.user.is_staff:
-            return UserProfile.objects.all()
-        return UserProfile.objects.filter(user=self.request.user)
+    permission_classes = [permissions.IsAuthenticated]
 
-class GenreViewSet(viewsets.ModelViewSet):
+class GenreViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(CreateThrottleMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all().select_related('author').prefetch_related('genres')
     serializer_class = BookSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['title', 'author__name', 'isbn']
+    create_throttle_scope = 'book_create'
+    filter_backends = [BookSearchFilter]
+    search_fields = ['title', 'author__name']
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'facets', 'cards'):
+            # ?genre=1,2&decade=1990&rating=4 narrow the listing and its facet counts
+            queryset = facets.apply_filters(queryset, facets.selected(self.request.query_params))
+        return queryset
+    
+    def _facet_counts(self):
+        params = self.request.query_params
+        filtered = bool(facets.selected(params)) or bool(params.get(filters.SearchFilter.search_param))
+        return facets.for_queryset(self.filter_queryset(self.get_queryset()), filtered)
+    
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = self._facet_counts()
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def cards(self, request):
+        """
+        The listing as precomputed book cards; accepts the same search and facet filters.
+        Ratings on the cards follow new and changed reviews once the background
+        rating recompute has run, usually within seconds.
+        """
+        books = self.filter_queryset(self.get_queryset()).order_by()
+        data = (
+            BookCard.objects
+            .filter(book_id__in=books.values('pk'))
+            .order_by('book_id')
+            .values_list('data', flat=True)
+        )
+        return card_page_response(self, data)
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Books per genre, author, decade and rating bucket for the current search and filters"""
+        return Response(self._facet_counts())
+    
+    @action(detail=False, methods=['post'], url_path='isbn-lookup')
+    def isbn_lookup(self, request):
+        """Body: {"isbns": [...]}; resolves every ISBN with one indexed query, answers in request order"""
+        serializer = ISBNLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        isbns = serializer.validated_data['isbns']
+        canonical = [to_isbn13(value) for value in isbns]
+        books = list(Book.objects.filter(isbn13__in={key for key in canonical if key}).select_related('author'))
+        found = {
+            book.isbn13: data
+            for book, data in zip(books, SimpleBookSerializer(books, many=True, context=self.get_serializer_context()).data)
+        }
+        results = [
+            {'isbn': value, 'isbn13': isbn13, 'book': found.get(isbn13)}
+            for value, isbn13 in zip(isbns, canonical)
+        ]
+        return Response({'found': sum(1 for row in results if row['book']), 'results': results})
     
     def create(self, request, *args, **kwargs):
         # Log the incoming data
-        logger.debug(f"Creating book with data: {request.data}")
+        logger.debug("Creating book with data: %s", request.data)
         
         # Check if author is provided
         author_data = request.data.get('author')
@@ -110,12 +259,9 @@ class BookViewSet(viewsets.ModelViewSet):
             if isinstance(author_data, int):
                 author = Author.objects.get(id=author_data)
             else:
-                author, created = Author.objects.get_or_create(name=author_data)
-                request.data['author'] = author.id
-                if created:
-                    logger.info(f"Created new author: {author.name}")
+                request.data['author'] = authors.resolve(author_data)
         except Exception as e:
-            logger.error(f"Error processing author: {str(e)}")
+            logger.error("Error processing author: %s", e)
             return Response(
                 {"author": [f"Error processing author: {str(e)}"]},
                 status=status.HTTP_400_BAD_REQUEST
@@ -126,7 +272,7 @@ class BookViewSet(viewsets.ModelViewSet):
     
     def update(self, request, *args, **kwargs):
         # Log the incoming data
-        logger.debug(f"Updating book {kwargs.get('pk')} with data: {request.data}")
+        logger.debug("Updating book %s with data: %s", kwargs.get('pk'), request.data)
         
         # Check if author is being updated
         author_data = request.data.get('author')
@@ -136,12 +282,9 @@ class BookViewSet(viewsets.ModelViewSet):
                 if isinstance(author_data, int):
                     author = Author.objects.get(id=author_data)
                 else:
-                    author, created = Author.objects.get_or_create(name=author_data)
-                    request.data['author'] = author.id
-                    if created:
-                        logger.info(f"Created new author: {author.name}")
+                    request.data['author'] = authors.resolve(author_data)
             except Exception as e:
-                logger.error(f"Error processing author: {str(e)}")
+                logger.error("Error processing author: %s", e)
                 return Response(
                     {"author": [f"Error processing author: {str(e)}"]},
                     status=status.HTTP_400_BAD_REQUEST
@@ -149,22 +292,132 @@ class BookViewSet(viewsets.ModelViewSet):
         
         # Call the parent update method
         return super().update(request, *args, **kwargs)
+    
+    def perform_create(self, serializer):
+        book = serializer.save()
+        if 'cover_image' in self.request.FILES:
+            tasks.process_cover_image.enqueue_on_commit(book.id)
+    
+    def perform_update(self, serializer):
+        book = serializer.save()
+        if 'cover_image' in self.request.FILES:
+            tasks.process_cover_image.enqueue_on_commit(book.id)
 
-class BookshelfViewSet(viewsets.ModelViewSet):
+class BookshelfViewSet(RowAccessMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Bookshelf.objects.all()
     serializer_class = BookshelfSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    # Sort keys accepted by the paginated shelf contents endpoint
+    BOOK_ORDERINGS = {
+        'added': 'id',
+        'title': 'book__title',
+        'author': 'book__author__name',
+        'published': 'book__publication_date',
+    }
+    
+    def is_summary(self):
+        return self.action == 'list' and self.request.query_params.get('summary') in ('1', 'true')
+    
     def get_queryset(self):
-        # Only return bookshelves owned by current user
-        return Bookshelf.objects.filter(user=self.request.user).prefetch_related('books', 'books__author')
+        # Bookshelf rules keep every user, staff included, to their own shelves
+        queryset = Bookshelf.objects.all()
+        if self.is_summary():
+            return queryset.annotate(book_count=Count('books')).order_by('created_at', 'id')
+        if self.action in ('books', 'cards'):
+            return queryset
+        return queryset.prefetch_related('books', 'books__author')
+    
+    def _book_ordering(self):
+        ordering = self.request.query_params.get('ordering', 'added')
+        field = self.BOOK_ORDERINGS.get(ordering.lstrip('-'))
+        if field is None:
+            raise ValidationError({"ordering": [f"Must be one of: {', '.join(self.BOOK_ORDERINGS)}."]})
+        return '-' + field if ordering.startswith('-') else field
     
     def get_serializer_class(self):
         # Use BookshelfBooksUpdateSerializer for partial updates to handle book additions/removals
         if self.action == 'partial_update' and 'books' in self.request.data:
             return BookshelfBooksUpdateSerializer
+        if self.is_summary():
+            return BookshelfSummarySerializer
         return BookshelfSerializer
     
+    def list(self, request, *args, **kwargs):
+        if not self.is_summary():
+            return super().list(request, *args, **kwargs)
+        
+        try:
+            covers = min(max(int(request.query_params.get('covers', 4)), 0), 12)
+        except ValueError:
+            covers = 4
+        
+        shelves = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        previews = {shelf.id: [] for shelf in shelves}
+        if covers and previews:
+            # Number each shelf's books in insertion order and keep the first N
+            # with a cover, all in one windowed query
+            entries = (
+                Bookshelf.books.through.objects
+                .filter(bookshelf_id__in=previews)
+                .exclude(book__cover_image='')
+                .exclude(book__cover_image__isnull=True)
+                .annotate(position=Window(
+                    expression=RowNumber(),
+                    partition_by=F('bookshelf_id'),
+                    order_by=F('id').asc(),
+                ))
+                .filter(position__lte=covers)
+                .values('bookshelf_id', 'book_id', 'book__title', 'book__cover_image')
+                .order_by('bookshelf_id', 'position')
+            )
+            for entry in entries:
+                previews[entry['bookshelf_id']].append({
+                    'id': entry['book_id'],
+                    'title': entry['book__title'],
+                    'cover_image': request.build_absolute_uri(
+                        default_storage.url(entry['book__cover_image'])
+                    ),
+                })
+        for shelf in shelves:
+            shelf.cover_previews = previews[shelf.id]
+        
+        serializer = self.get_serializer(shelves, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def books(self, request, pk=None):
+        """Paginated contents of a single bookshelf"""
+        bookshelf = self.get_object()
+        
+        field = self._book_ordering()
+        
+        entries = (
+            Bookshelf.books.through.objects
+            .filter(bookshelf=bookshelf)
+            .select_related('book__author')
+            .order_by(field, 'id')
+        )
+        page = self.paginate_queryset(entries)
+        serializer = SimpleBookSerializer([entry.book for entry in page], many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def cards(self, request, pk=None):
+        """
+        Contents of a bookshelf as precomputed book cards; ?ordering= as for books.
+        Ratings follow reviews with the same delay as in /api/books/cards/.
+        """
+        bookshelf = self.get_object()
+        field = self._book_ordering()
+        data = (
+            Bookshelf.books.through.objects
+            .filter(bookshelf=bookshelf)
+            .order_by(field, 'id')
+            .values_list('book__card__data', flat=True)
+        )
+        return card_page_response(self, data)
+    
     @action(detail=True, methods=['patch'])
     def update_books(self, request, pk=None):
         """Endpoint specifically for updating books in a bookshelf"""
@@ -176,7 +429,7 @@ class BookshelfViewSet(viewsets.ModelViewSet):
             return Response({"books": ["This field is required."]}, status=status.HTTP_400_BAD_REQUEST)
         
         # Log the books being added
-        logger.debug(f"Updating bookshelf {pk} books with: {books_ids}")
+        logger.debug("Updating bookshelf %s books with: %s", pk, books_ids)
         
         # Update the books
         try:
@@ -197,86 +450,126 @@ class BookshelfViewSet(viewsets.ModelViewSet):
             
             # Return the updated bookshelf
             serializer = self.get_serializer(bookshelf)
-            logger.debug(f"Updated bookshelf {pk} books successfully: {bookshelf.books.count()} books")
+            logger.debug("Updated bookshelf %s books successfully: %d books", pk, len(books))
             return Response(serializer.data)
         except Exception as e:
-            logger.error(f"Error updating bookshelf books: {str(e)}")
+            logger.exception("Error updating bookshelf books: %s", e)
             return Response(
                 {"detail": f"Error updating books: {str(e)}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(RowAccessMixin, CreateThrottleMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
+    create_throttle_scope = 'review_create'
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         if self.request.query_params.get('book'):
             return Review.objects.filter(book_id=self.request.query_params.get('book'))
-        if self.request.user.is_staff:
-            return Review.objects.all()
-        return Review.objects.filter(user=self.request.user)
+        # Without ?book= the list holds the user's own reviews
+        if self.action == 'list' and not self.request.user.is_staff:
+            return Review.objects.filter(user=self.request.user)
+        return Review.objects.all()
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class ExchangeOfferViewSet(viewsets.ModelViewSet):
+class ImportViewSet(CreateThrottleMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                    mixins.ListModelMixin, viewsets.GenericViewSet):
+    """Imports of ratings and shelves from a CSV or JSON file; GET an import for its progress"""
+    serializer_class = ImportJobSerializer
+    create_throttle_scope = 'import_create'
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        return ImportJob.objects.filter(user=self.request.user)
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data['file']
+        if upload.size > settings.IMPORT_MAX_BYTES:
+            raise ValidationError({"file": [f"Files up to {settings.IMPORT_MAX_BYTES // (1024 * 1024)} MB can be imported."]})
+        try:
+            file_format = imports.detect_format(upload.name, serializer.validated_data.get('format'))
+        except imports.ImportFileError as e:
+            raise ValidationError({"format": [str(e)]})
+        job = serializer.save(user=request.user, format=file_format)
+        
+        if upload.size > settings.IMPORT_SYNC_MAX_BYTES:
+            # Large files: the worker processes them; poll the import for progress
+            tasks.run_import.enqueue_on_commit(job.id)
+            return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+        imports.run(job.id)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data, status=status.HTTP_201_CREATED)
+
+class ExchangeOfferViewSet(RowAccessMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = ExchangeOfferSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         if self.request.query_params.get('book'):
             return ExchangeOffer.objects.filter(book_id=self.request.query_params.get('book'))
-        if self.request.user.is_staff:
-            return ExchangeOffer.objects.all()
-        return ExchangeOffer.objects.filter(owner=self.request.user)
+        # Without ?book= the list holds the user's own offers
+        if self.action == 'list' and not self.request.user.is_staff:
+            return ExchangeOffer.objects.filter(owner=self.request.user)
+        return ExchangeOffer.objects.all()
     
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
-class ExchangeRequestViewSet(viewsets.ModelViewSet):
+class ExchangeRequestViewSet(RowAccessMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    # Requests for my offers and my requests for other offers (ExchangeRequest.visible_q)
+    queryset = ExchangeRequest.objects.select_related('offer__book', 'requester')
     serializer_class = ExchangeRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
     
-    def get_queryset(self):
-        if self.request.user.is_staff:
-            return ExchangeRequest.objects.all()
-        
-        # Get requests for my offers
-        my_offers = ExchangeOffer.objects.filter(owner=self.request.user)
-        requests_for_my_offers = ExchangeRequest.objects.filter(offer__in=my_offers)
-        
-        # Get my requests for other offers
-        my_requests = ExchangeRequest.objects.filter(requester=self.request.user)
-        
-        # Combine both querysets
-        return requests_for_my_offers | my_requests
-    
     def perform_create(self, serializer):
         serializer.save(requester=self.request.user)
 
-class DiscussionViewSet(viewsets.ModelViewSet):
+class DiscussionViewSet(RowAccessMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = DiscussionSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    # Sort keys of the discussion index; each matches an index, also under ?book= or ?author=
+    DISCUSSION_ORDERINGS = {
+        'activity': ('-last_activity_at', '-id'),
+        'newest': ('-id',),
+    }
+    
     def get_queryset(self):
-        if self.request.query_params.get('book'):
-            return Discussion.objects.filter(book_id=self.request.query_params.get('book'))
-        return Discussion.objects.all()
+        discussions = Discussion.objects.select_related('book', 'author', 'created_by')
+        params = self.request.query_params
+        for name in ('book', 'author'):
+            value = params.get(name)
+            if value is None:
+                continue
+            if not value.isdigit():
+                raise ValidationError({name: [f"A valid {name} ID is required."]})
+            discussions = discussions.filter(**{f'{name}_id': value})
+        ordering = self.DISCUSSION_ORDERINGS.get(params.get('ordering', 'activity'))
+        if ordering is None:
+            raise ValidationError({"ordering": [f"Must be one of: {', '.join(self.DISCUSSION_ORDERINGS)}."]})
+        return discussions.order_by(*ordering)
     
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(RowAccessMixin, CreateThrottleMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = CommentSerializer
+    create_throttle_scope = 'comment_create'
     permission_classes = [permissions.IsAuthenticated]
+    shared_actions = ('like', 'unlike')
     
     def get_queryset(self):
         if self.request.query_params.get('discussion'):
             return Comment.objects.filter(discussion_id=self.request.query_params.get('discussion'))
-        if self.request.user.is_staff:
-            return Comment.objects.all()
-        return Comment.objects.filter(user=self.request.user)
+        # Without ?discussion= the list holds the user's own comments
+        if self.action == 'list' and not self.request.user.is_staff:
+            return Comment.objects.filter(user=self.request.user)
+        return Comment.objects.all()
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -293,38 +586,390 @@ class CommentViewSet(viewsets.ModelViewSet):
         comment.likes.remove(request.user)
         return Response({'status': 'unliked'})
 
-class SupportTicketViewSet(viewsets.ModelViewSet):
+class SupportTicketViewSet(RowAccessMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = SupportTicketSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    # Sort keys accepted by the triage queue
+    QUEUE_ORDERINGS = {
+        'age': ('created_at', 'id'),
+        '-age': ('-created_at', '-id'),
+        'activity': ('last_activity_at', 'id'),
+        '-activity': ('-last_activity_at', '-id'),
+    }
+    
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return SupportTicket.objects.all()
-        return SupportTicket.objects.filter(user=self.request.user)
+        return SupportTicket.objects.order_by('-created_at', '-id')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+    
+    # Longest age filter accepted; anything longer can't be subtracted from now
+    MAX_QUEUE_HOURS = 100 * 365 * 24
+    
+    def _hours_param(self, name):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        try:
+            hours = float(value)
+        except ValueError:
+            hours = None
+        # Also rejects nan and inf, which fail both comparisons
+        if hours is None or not 0 <= hours <= self.MAX_QUEUE_HOURS:
+            raise ValidationError({name: [f"A number of hours between 0 and {self.MAX_QUEUE_HOURS} is required."]})
+        return timedelta(hours=hours)
+    
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def queue(self, request):
+        """Staff triage queue with reply statistics, oldest open tickets first"""
+        params = request.query_params
+        statuses = params.get('status', 'OPEN,IN_PROGRESS').split(',')
+        known_statuses = [choice for choice, _ in SupportTicket.STATUS_CHOICES]
+        if not set(statuses) <= set(known_statuses):
+            raise ValidationError({"status": [f"Must be a comma-separated list of: {', '.join(known_statuses)}."]})
+        ordering = self.QUEUE_ORDERINGS.get(params.get('ordering', 'age'))
+        if ordering is None:
+            raise ValidationError({"ordering": [f"Must be one of: {', '.join(self.QUEUE_ORDERINGS)}."]})
+        
+        now = timezone.now()
+        latest_reply = TicketReply.objects.filter(ticket=OuterRef('pk')).order_by('-created_at', '-id')
+        # status + created_at filters are served by ticket_status_created_idx
+        tickets = (
+            SupportTicket.objects
+            .filter(status__in=statuses)
+            .select_related('user')
+            .annotate(
+                reply_count=Count('replies'),
+                last_reply_at=Max('replies__created_at'),
+                last_activity_at=Coalesce(Max('replies__created_at'), 'created_at'),
+                last_reply_from_staff=Subquery(latest_reply.values('user__is_staff')[:1]),
+            )
+        )
+        older_than = self._hours_param('older_than')
+        if older_than is not None:
+            tickets = tickets.filter(created_at__lte=now - older_than)
+        newer_than = self._hours_param('newer_than')
+        if newer_than is not None:
+            tickets = tickets.filter(created_at__gte=now - newer_than)
+        idle_for = self._hours_param('idle_for')
+        if idle_for is not None:
+            tickets = tickets.filter(last_activity_at__lte=now - idle_for)
+        awaiting = params.get('awaiting')
+        if awaiting == 'staff':
+            # Nobody from staff has answered the latest message yet
+            tickets = tickets.filter(Q(last_reply_from_staff=False) | Q(reply_count=0))
+        elif awaiting == 'user':
+            tickets = tickets.filter(last_reply_from_staff=True)
+        
+        page = self.paginate_queryset(tickets.order_by(*ordering))
+        serializer = SupportTicketQueueSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def thread(self, request, pk=None):
+        """A ticket with all of its replies, fetched in a single query"""
+        tickets = SupportTicket.objects.visible_to(request.user)
+        tickets = tickets.filter(pk=pk) if pk.isdigit() else tickets.none()
+        rows = list(
+            tickets.values(
+                'id', 'user_id', 'user__username', 'subject', 'message', 'status', 'created_at',
+                'replies__id', 'replies__user_id', 'replies__user__username', 'replies__user__is_staff',
+                'replies__message', 'replies__created_at',
+            ).order_by('replies__created_at', 'replies__id')
+        )
+        if not rows:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        
+        first = rows[0]
+        return Response({
+            'id': first['id'],
+            'user': first['user_id'],
+            'username': first['user__username'],
+            'subject': first['subject'],
+            'message': first['message'],
+            'status': first['status'],
+            'created_at': first['created_at'],
+            'replies': [
+                {
+                    'id': row['replies__id'],
+                    'user': row['replies__user_id'],
+                    'username': row['replies__user__username'],
+                    'is_staff': row['replies__user__is_staff'],
+                    'message': row['replies__message'],
+                    'created_at': row['replies__created_at'],
+                }
+                for row in rows if row['replies__id'] is not None
+            ],
+        })
 
-class TicketReplyViewSet(viewsets.ModelViewSet):
+class TicketReplyViewSet(RowAccessMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = TicketReplySerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        if self.request.query_params.get('ticket'):
-            ticket_id = self.request.query_params.get('ticket')
-            ticket = SupportTicket.objects.get(id=ticket_id)
-            
-            # Only the ticket owner and admins can see replies
-            if self.request.user.is_staff or ticket.user == self.request.user:
-                return TicketReply.objects.filter(ticket_id=ticket_id)
-            return TicketReply.objects.none()
-        
-        if self.request.user.is_staff:
-            return TicketReply.objects.all()
+        replies = TicketReply.objects.all()
         
-        # Users can see replies to their own tickets
-        user_tickets = SupportTicket.objects.filter(user=self.request.user)
-        return TicketReply.objects.filter(ticket__in=user_tickets)
+        ticket_id = self.request.query_params.get('ticket')
+        if ticket_id:
+            if not ticket_id.isdigit():
+                return TicketReply.objects.none()
+            replies = replies.filter(ticket_id=ticket_id)
+        return replies.order_by('created_at', 'id')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+class RankingViewSet(viewsets.GenericViewSet):
+    """Trending and popularity lists, read only from the BookActivity rollup"""
+    serializer_class = SimpleBookSerializer
+    permission_classes = [permissions.AllowAny]
+    
+    def _int_param(self, name, default, maximum):
+        value = self.request.query_params.get(name, default)
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            value = 0
+        if not 1 <= value <= maximum:
+            raise ValidationError({name: [f"Must be an integer between 1 and {maximum}."]})
+        return value
+    
+    def _genre_param(self):
+        genre = self.request.query_params.get('genre')
+        if genre is None:
+            return None
+        if not genre.isdigit():
+            raise ValidationError({'genre': ["A valid genre ID is required."]})
+        return int(genre)
+    
+    def _ranked_response(self, ranked):
+        page = self.paginate_queryset(ranked)
+        # Hydrate only the books on the current page
+        books = Book.objects.select_related('author').in_bulk([row['book'] for row in page])
+        results = [
+            {
+                'book': self.get_serializer(books[row['book']]).data,
+                'score': round(row['score'], 3),
+            }
+            for row in page if row['book'] in books
+        ]
+        return self.get_paginated_response(results)
+    
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        ranked = rankings.trending(
+            days=self._int_param('days', 7, rankings.TRENDING_MAX_DAYS),
+            half_life=self._int_param('half_life', 2, 90),
+            genre=self._genre_param(),
+        )
+        return self._ranked_response(ranked)
+    
+    @action(detail=False, methods=['get'], url_path='most-reviewed')
+    def most_reviewed(self, request):
+        ranked = rankings.most_reviewed(
+            days=self._int_param('days', 30, 3650),
+            genre=self._genre_param(),
+        )
+        return self._ranked_response(ranked)
+
+# Archived exchanges and tickets are read-only; archive.py moves them here
+class ArchivedExchangeOfferViewSet(RowAccessMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = ArchivedExchangeOffer.objects.select_related('book', 'owner').order_by('-created_at', '-id')
+    serializer_class = ArchivedExchangeOfferSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+class ArchivedExchangeRequestViewSet(RowAccessMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = ArchivedExchangeRequest.objects.select_related('requester').order_by('-created_at', '-id')
+    serializer_class = ArchivedExchangeRequestSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+class ArchivedSupportTicketViewSet(RowAccessMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = (
+        ArchivedSupportTicket.objects
+        .select_related('user')
+        .prefetch_related(Prefetch(
+            'replies', queryset=ArchivedTicketReply.objects.select_related('user').order_by('created_at', 'id')
+        ))
+        .order_by('-created_at', '-id')
+    )
+    serializer_class = ArchivedSupportTicketSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+class HistoryViewSet(viewsets.GenericViewSet):
+    """A user's exchanges and tickets, live and archived, newest first"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    # Every part of a history UNION must produce the same columns in the same order
+    HISTORY_COLUMNS = ('h_kind', 'h_id', 'h_book', 'h_status', 'h_created_at', 'h_archived')
+    
+    def _part(self, queryset, kind, archived, book=F('book_id')):
+        return queryset.annotate(
+            h_kind=Value(kind, output_field=CharField()),
+            h_id=F('id'),
+            h_book=book,
+            h_status=F('status'),
+            h_created_at=F('created_at'),
+            h_archived=Value(archived, output_field=BooleanField()),
+        ).values(*self.HISTORY_COLUMNS)
+    
+    def _history_response(self, parts):
+        history = parts[0].union(*parts[1:], all=True).order_by('-h_created_at', '-h_id')
+        page = self.paginate_queryset(history)
+        return self.get_paginated_response([
+            {
+                'type': row['h_kind'],
+                'id': row['h_id'],
+                'book': row['h_book'],
+                'status': row['h_status'],
+                'created_at': row['h_created_at'],
+                'archived': row['h_archived'],
+            }
+            for row in page
+        ])
+    
+    @action(detail=False, methods=['get'])
+    def exchanges(self, request):
+        user = request.user
+        # Archived requests only keep the offer id; find its book in either table
+        offer_book = Coalesce(
+            Subquery(ExchangeOffer.objects.filter(id=OuterRef('offer_id')).values('book_id')[:1]),
+            Subquery(ArchivedExchangeOffer.objects.filter(id=OuterRef('offer_id')).values('book_id')[:1]),
+        )
+        return self._history_response([
+            self._part(ExchangeOffer.objects.filter(owner=user), 'offer', False),
+            self._part(ArchivedExchangeOffer.objects.filter(owner=user), 'offer', True),
+            self._part(ExchangeRequest.objects.filter(requester=user), 'request', False, F('offer__book_id')),
+            self._part(ArchivedExchangeRequest.objects.filter(requester=user), 'request', True, offer_book),
+        ])
+    
+    @action(detail=False, methods=['get'])
+    def tickets(self, request):
+        user = request.user
+        no_book = Value(None, output_field=BigIntegerField())
+        return self._history_response([
+            self._part(SupportTicket.objects.filter(user=user), 'ticket', False, no_book),
+            self._part(ArchivedSupportTicket.objects.filter(user=user), 'ticket', True, no_book),
+        ])
+
+class NotificationViewSet(viewsets.GenericViewSet):
+    """The current user's inbox, newest first; page with ?before=<id>"""
+    serializer_class = NotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def _id_param(self, name):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        if not value.isdigit():
+            raise ValidationError({name: ["A notification id is required."]})
+        return int(value)
+    
+    def list(self, request):
+        before = self._id_param('before')
+        limit = min(self._id_param('limit') or 20, 100)
+        items, next_before = notifications.feed(request.user, before=before, limit=limit)
+        return Response({
+            'unread_count': notifications.unread_count(request.user),
+            'next_before': next_before,
+            'results': self.get_serializer(items, many=True).data,
+        })
+    
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        return Response({'unread_count': notifications.unread_count(request.user)})
+    
+    @action(detail=False, methods=['post'], url_path='mark-read')
+    def mark_read(self, request):
+        """Body: {"ids": [...]} or {"all": true}"""
+        ids = request.data.get('ids')
+        if request.data.get('all') is True:
+            ids = None
+        elif not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            raise ValidationError({"ids": ["A list of notification ids is required."]})
+        changed = notifications.mark_read(request.user, ids)
+        return Response({'marked': changed, 'unread_count': notifications.unread_count(request.user)})
+
+class SyncViewSet(viewsets.GenericViewSet):
+    """
+    Delta sync of the user's shelves, reviews, offers, requests and tickets.
+    GET /api/sync/ without a token returns one for "now"; load the lists, then
+    GET /api/sync/?token=... returns only what changed since, plus a new token.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    SYNC_KINDS = {
+        'bookshelves': (lambda: Bookshelf.objects.prefetch_related(
+            Prefetch('books', queryset=Book.objects.select_related('author'))), BookshelfSerializer),
+        'reviews': (lambda: Review.objects.select_related('user'), ReviewSerializer),
+        'offers': (lambda: ExchangeOffer.objects.select_related('book', 'owner'), ExchangeOfferSerializer),
+        'requests': (lambda: ExchangeRequest.objects.select_related('offer__book', 'requester'), ExchangeRequestSerializer),
+        'tickets': (lambda: SupportTicket.objects.select_related('user'), SupportTicketSerializer),
+    }
+    
+    def list(self, request):
+        user = request.user
+        token = request.query_params.get('token')
+        if not token:
+            return Response({'token': sync.current_token(user), 'has_more': False, 'changes': {}, 'deleted': {}})
+        
+        since = sync.read_token(user, token)
+        changed, deleted, last_seq, has_more = sync.changes(user, since, settings.SYNC_PAGE_SIZE)
+        changes = {}
+        for kind, ids in changed.items():
+            queryset, serializer_class = self.SYNC_KINDS[kind]
+            objects = queryset().in_bulk(ids)
+            # Deleted since this change was recorded; its tombstone comes later
+            deleted[kind] |= ids - objects.keys()
+            changes[kind] = serializer_class(
+                objects.values(), many=True, context=self.get_serializer_context()
+            ).data
+        return Response({
+            'token': sync.make_token(user, last_seq),
+            'has_more': has_more,
+            'changes': changes,
+            'deleted': {kind: sorted(ids) for kind, ids in deleted.items() if ids},
+        })
+
+class UploadViewSet(RowAccessMixin, CreateThrottleMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                    mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable image uploads. POST {"target", "object_id", "filename", "size"}
+    opens an upload; PUT the raw bytes of each chunk to /api/uploads/<id>/ with
+    an Upload-Offset header. GET an upload for the offset to resume from.
+    """
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    create_throttle_scope = 'upload_create'
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = uploads.open_session(request.user, **serializer.validated_data)
+        response = Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+        response['Upload-Offset'] = '0'
+        return response
+    
+    def update(self, request, *args, **kwargs):
+        session = self.get_object()
+        offset = request.META.get('HTTP_UPLOAD_OFFSET', '')
+        length = request.META.get('CONTENT_LENGTH', '')
+        if not offset.isdigit():
+            raise ValidationError({"Upload-Offset": ["The byte offset of the chunk is required."]})
+        if not length.isdigit():
+            return Response({'detail': 'Content-Length is required.'}, status=status.HTTP_411_LENGTH_REQUIRED)
+        # The body is read from the stream piece by piece, never as request.data
+        session = uploads.write_chunk(session, int(offset), request.stream, int(length))
+        response = Response(self.get_serializer(session).data)
+        response['Upload-Offset'] = str(session.received)
+        return response
+    
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response['Upload-Offset'] = str(response.data['received'])
+        return response
+    
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
+        instance.delete()